@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
 from django.utils.html import format_html
-from .models import UserProfile, AdminAction, Report, UserReview
+from .models import UserProfile, AdminAction, ModerationJob, Report, UserReview
+from .moderation import moderate_selection
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -43,52 +44,23 @@ class UserAdmin(BaseUserAdmin):
         return 'No Image'
     get_profile_picture.short_description = 'Picture'
     
+    def moderate(self, request, queryset, action_type, verb):
+        changed, job = moderate_selection(request.user, action_type, queryset)
+        if job:
+            self.message_user(request, f"{job.total} users are being {verb} in the background (moderation job #{job.pk}).")
+        else:
+            self.message_user(request, f"{changed} users have been {verb}.")
+    
     def suspend_users(self, request, queryset):
-        for user in queryset:
-            if hasattr(user, 'profile'):
-                user.profile.is_suspended = True
-                user.profile.suspension_reason = f"Suspended by admin {request.user.username}"
-                user.profile.save()
-                
-                AdminAction.objects.create(
-                    admin=request.user,
-                    target_user=user,
-                    action_type='suspend_user',
-                    reason=f"Bulk suspension by {request.user.username}"
-                )
-        self.message_user(request, f"{queryset.count()} users have been suspended.")
+        self.moderate(request, queryset, 'suspend_user', 'suspended')
     suspend_users.short_description = "Suspend selected users"
     
     def unsuspend_users(self, request, queryset):
-        for user in queryset:
-            if hasattr(user, 'profile'):
-                user.profile.is_suspended = False
-                user.profile.suspension_reason = ""
-                user.profile.save()
-                
-                AdminAction.objects.create(
-                    admin=request.user,
-                    target_user=user,
-                    action_type='unsuspend_user',
-                    reason=f"Bulk unsuspension by {request.user.username}"
-                )
-        self.message_user(request, f"{queryset.count()} users have been unsuspended.")
+        self.moderate(request, queryset, 'unsuspend_user', 'unsuspended')
     unsuspend_users.short_description = "Unsuspend selected users"
     
     def verify_users(self, request, queryset):
-        for user in queryset:
-            if hasattr(user, 'profile'):
-                user.profile.is_verified = True
-                user.profile.verification_status = 'verified'
-                user.profile.save()
-                
-                AdminAction.objects.create(
-                    admin=request.user,
-                    target_user=user,
-                    action_type='verify_user',
-                    reason=f"Bulk verification by {request.user.username}"
-                )
-        self.message_user(request, f"{queryset.count()} users have been verified.")
+        self.moderate(request, queryset, 'verify_user', 'verified')
     verify_users.short_description = "Verify selected users"
 
 @admin.register(AdminAction)
@@ -99,6 +71,20 @@ class AdminActionAdmin(admin.ModelAdmin):
     readonly_fields = ('timestamp',)
     date_hierarchy = 'timestamp'
 
+@admin.register(ModerationJob)
+class ModerationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'action_type', 'admin', 'status', 'get_progress', 'changed', 'created_at', 'finished_at')
+    list_filter = ('status', 'action_type')
+    readonly_fields = ('admin', 'action_type', 'total', 'processed', 'changed', 'status', 'error', 'created_at', 'finished_at')
+    exclude = ('target_ids',)
+    
+    def get_progress(self, obj):
+        return f"{obj.processed}/{obj.total} ({obj.progress}%)"
+    get_progress.short_description = 'Progress'
+    
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
     list_display = ('reporter', 'report_type', 'reported_user', 'reported_item', 'status', 'created_at')
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from accounts.moderation import resume_stale_moderation_jobs
+
+class Command(BaseCommand):
+    help = 'Resume moderation jobs left pending or running by a process that stopped'
+
+    def handle(self, *args, **options):
+        count = resume_stale_moderation_jobs()
+        self.stdout.write(
+            self.style.SUCCESS(f'Resumed {count} moderation jobs')
+        )
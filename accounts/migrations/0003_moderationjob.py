@@ -0,0 +1,40 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:44
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0002_userprofile_theme_preference'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adminaction',
+            name='action_type',
+            field=models.CharField(choices=[('suspend_user', 'Suspend User'), ('unsuspend_user', 'Unsuspend User'), ('remove_listing', 'Remove Listing'), ('verify_user', 'Verify User'), ('reject_verification', 'Reject Verification'), ('warning', 'Warning'), ('ban_user', 'Ban User'), ('feature_listing', 'Feature Listing'), ('unfeature_listing', 'Unfeature Listing'), ('approve_listing', 'Approve Listing')], max_length=30),
+        ),
+        migrations.CreateModel(
+            name='ModerationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_type', models.CharField(choices=[('suspend_user', 'Suspend User'), ('unsuspend_user', 'Unsuspend User'), ('remove_listing', 'Remove Listing'), ('verify_user', 'Verify User'), ('reject_verification', 'Reject Verification'), ('warning', 'Warning'), ('ban_user', 'Ban User'), ('feature_listing', 'Feature Listing'), ('unfeature_listing', 'Unfeature Listing'), ('approve_listing', 'Approve Listing')], max_length=30)),
+                ('target_ids', models.JSONField(default=list)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('processed', models.PositiveIntegerField(default=0)),
+                ('changed', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('admin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='moderation_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_moderationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='moderationjob',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
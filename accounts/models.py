@@ -67,6 +67,7 @@ class AdminAction(models.Model):
         ('ban_user', 'Ban User'),
         ('feature_listing', 'Feature Listing'),
         ('unfeature_listing', 'Unfeature Listing'),
+        ('approve_listing', 'Approve Listing'),
     ]
     
     admin = models.ForeignKey(User, on_delete=models.CASCADE, related_name='admin_actions')
@@ -79,6 +80,37 @@ class AdminAction(models.Model):
     def __str__(self):
         return f"{self.admin.username} - {self.action_type} - {self.timestamp}"
 
+class ModerationJob(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+    
+    admin = models.ForeignKey(User, on_delete=models.CASCADE, related_name='moderation_jobs')
+    action_type = models.CharField(max_length=30, choices=AdminAction.ACTION_TYPES)
+    target_ids = models.JSONField(default=list)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Moved on by every batch, so a job that stops moving was left behind by a crash
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ('-created_at',)
+    
+    def __str__(self):
+        return f"{self.get_action_type_display()} ({self.processed}/{self.total})"
+    
+    @property
+    def progress(self):
+        return round(100 * self.processed / self.total) if self.total else 100
+
 class Report(models.Model):
     REPORT_TYPES = [
         ('inappropriate_content', 'Inappropriate Content'),
@@ -0,0 +1,176 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, Q, When
+from django.utils import timezone
+
+from core.background import run_in_background
+from core.cache import bump_version
+from item.categories import refresh_category_counts
+from item.models import Item, default_expiry
+
+from .models import AdminAction, ModerationJob, UserProfile
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+ITEM_CHANGES = {
+    'approve_listing': {'admin_approved': True, 'status': 'active'},
+    'remove_listing': {'admin_approved': False, 'status': 'removed'},
+    'feature_listing': {'is_featured': True},
+    'unfeature_listing': {'is_featured': False},
+}
+
+USER_CHANGES = {
+    'suspend_user': {'is_suspended': True, 'suspension_reason': 'Suspended by admin {username}'},
+    'unsuspend_user': {'is_suspended': False, 'suspension_reason': ''},
+    'verify_user': {'is_verified': True, 'verification_status': 'verified'},
+}
+
+REASONS = {
+    'approve_listing': 'Bulk approval',
+    'remove_listing': 'Bulk removal',
+    'feature_listing': 'Bulk featuring',
+    'unfeature_listing': 'Bulk unfeaturing',
+    'suspend_user': 'Bulk suspension',
+    'unsuspend_user': 'Bulk unsuspension',
+    'verify_user': 'Bulk verification',
+}
+
+
+def _moderate_items(admin, action_type, item_ids):
+    targets = list(Item.objects.filter(pk__in=item_ids).values_list('pk', 'created_by_id'))
+    if not targets:
+        return 0
+
+    changes = dict(ITEM_CHANGES[action_type])
+    if changes.get('status') == 'active':
+        # Listings put back on the market get a new listing period, as when their seller relists them
+        changes['expires_at'] = Case(When(~Q(status='active'), then=default_expiry()), default=F('expires_at'))
+    Item.objects.filter(pk__in=[pk for pk, owner_id in targets]).update(updated_at=timezone.now(), **changes)
+    reason = f'{REASONS[action_type]} by {admin.username}'
+    AdminAction.objects.bulk_create([
+        AdminAction(admin=admin, target_item_id=pk, target_user_id=owner_id, action_type=action_type, reason=reason)
+        for pk, owner_id in targets
+    ])
+    return len(targets)
+
+
+def _moderate_users(admin, action_type, user_ids):
+    # Users without a profile are skipped, as before
+    targets = list(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+    if not targets:
+        return 0
+
+    changes = {
+        field: value.format(username=admin.username) if isinstance(value, str) else value
+        for field, value in USER_CHANGES[action_type].items()
+    }
+    UserProfile.objects.filter(user_id__in=targets).update(**changes)
+    reason = f'{REASONS[action_type]} by {admin.username}'
+    AdminAction.objects.bulk_create([
+        AdminAction(admin=admin, target_user_id=user_id, action_type=action_type, reason=reason)
+        for user_id in targets
+    ])
+    return len(targets)
+
+
+def _moderate_batch(admin, action_type, ids):
+    if action_type in ITEM_CHANGES:
+        return _moderate_items(admin, action_type, ids)
+    return _moderate_users(admin, action_type, ids)
+
+
+def _after_moderation(action_type):
+    # QuerySet.update() skips the item signals
+    if action_type in ('approve_listing', 'remove_listing'):
+        refresh_category_counts()
+        bump_version('autocomplete')
+    if action_type in ITEM_CHANGES:
+        bump_version('item')
+
+
+def moderate(admin, action_type, ids):
+    """
+    Apply ``action_type`` to the items or users with the given ids in one
+    transaction: an UPDATE and a bulk insert of AdminAction rows per batch
+    of BATCH_SIZE. Returns the number of targets changed.
+    """
+    if action_type not in ITEM_CHANGES and action_type not in USER_CHANGES:
+        raise ValueError(f'Unknown moderation action {action_type!r}')
+
+    changed = 0
+    with transaction.atomic():
+        for start in range(0, len(ids), BATCH_SIZE):
+            changed += _moderate_batch(admin, action_type, ids[start:start + BATCH_SIZE])
+        _after_moderation(action_type)
+    return changed
+
+
+def run_moderation_job(job_id):
+    """
+    Work through a ModerationJob batch by batch. Each batch commits on its
+    own so ``processed`` shows progress while the job runs, and a resumed
+    job continues after the last batch that committed.
+    """
+    job = ModerationJob.objects.select_related('admin').get(pk=job_id)
+    ModerationJob.objects.filter(pk=job.pk).update(status='running', updated_at=timezone.now())
+
+    try:
+        for start in range(job.processed, len(job.target_ids), BATCH_SIZE):
+            batch = job.target_ids[start:start + BATCH_SIZE]
+            with transaction.atomic():
+                changed = _moderate_batch(job.admin, job.action_type, batch)
+                ModerationJob.objects.filter(pk=job.pk).update(
+                    processed=F('processed') + len(batch), changed=F('changed') + changed, updated_at=timezone.now()
+                )
+        _after_moderation(job.action_type)
+    except Exception as e:
+        logger.exception('Moderation job %s failed', job.pk)
+        ModerationJob.objects.filter(pk=job.pk).update(
+            status='failed', error=str(e), updated_at=timezone.now(), finished_at=timezone.now()
+        )
+    else:
+        ModerationJob.objects.filter(pk=job.pk).update(
+            status='done', updated_at=timezone.now(), finished_at=timezone.now()
+        )
+
+
+def stale_moderation_jobs(now=None):
+    # Jobs no process has moved on for a while: their worker died with the process that ran it
+    cutoff = (now or timezone.now()) - timedelta(seconds=settings.MODERATION_JOB_STALE_AFTER)
+    return ModerationJob.objects.filter(status__in=['pending', 'running'], updated_at__lt=cutoff)
+
+
+def resume_stale_moderation_jobs(now=None):
+    """
+    Run the jobs a crashed process left pending or running, from their
+    last committed batch. Returns the number of jobs resumed.
+    """
+    resumed = 0
+    for job_id in stale_moderation_jobs(now).values_list('pk', flat=True):
+        # Claiming the job first keeps two sweeps from running it twice
+        if stale_moderation_jobs(now).filter(pk=job_id).update(status='running', updated_at=timezone.now()):
+            run_moderation_job(job_id)
+            resumed += 1
+    return resumed
+
+
+def start_moderation_job(admin, action_type, ids):
+    job = ModerationJob.objects.create(admin=admin, action_type=action_type, target_ids=ids, total=len(ids))
+    run_in_background(run_moderation_job, job.pk)
+    return job
+
+
+def moderate_selection(admin, action_type, queryset):
+    """
+    Moderate an admin changelist selection: right away when it is small,
+    otherwise as a background ModerationJob. Returns ``(changed, job)``.
+    """
+    ids = list(queryset.order_by().values_list('pk', flat=True))
+    if len(ids) > settings.MODERATION_SYNC_LIMIT:
+        return 0, start_moderation_job(admin, action_type, ids)
+    return moderate(admin, action_type, ids), None
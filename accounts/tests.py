@@ -0,0 +1,92 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.factories import create_users
+from item.models import Category, Item
+
+from .models import AdminAction, ModerationJob, UserProfile
+from .moderation import moderate, resume_stale_moderation_jobs, stale_moderation_jobs, start_moderation_job
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    BACKGROUND_TASKS_EAGER=True,
+)
+class ModerationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = create_users(1, prefix='moderator')[0]
+        cls.seller = create_users(1, prefix='seller')[0]
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        Item.objects.bulk_create([
+            Item(category=category, created_by=cls.seller, name=f'Chair {number}', price=100)
+            for number in range(160)
+        ])
+
+    def test_bulk_moderation_runs_in_constant_queries(self):
+        item_ids = list(Item.objects.active().values_list('pk', flat=True))
+
+        query_counts = []
+        for size in (10, 150):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(moderate(self.admin, 'remove_listing', item_ids[:size]), size)
+            query_counts.append(len(queries))
+
+        self.assertEqual(query_counts[0], query_counts[1])
+        self.assertEqual(AdminAction.objects.filter(action_type='remove_listing').count(), 160)
+        self.assertFalse(Item.objects.active().filter(pk__in=item_ids[:150]).exists())
+
+    def test_approving_a_listing_gives_it_a_new_listing_period(self):
+        expired_at = timezone.now() - timedelta(days=1)
+        expired, listed = Item.objects.all()[:2]
+        Item.objects.filter(pk=expired.pk).update(status='expired', expires_at=expired_at)
+        Item.objects.filter(pk=listed.pk).update(expires_at=expired_at + timedelta(days=30))
+
+        self.assertEqual(moderate(self.admin, 'approve_listing', [expired.pk, listed.pk]), 2)
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, 'active')
+        self.assertGreater(expired.expires_at, timezone.now())
+        self.assertEqual(Item.objects.get(pk=listed.pk).expires_at, expired_at + timedelta(days=30))
+
+    def test_background_moderation_job_reports_progress(self):
+        users = create_users(20, prefix='member')
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        user_ids = [user.pk for user in users]
+        with self.captureOnCommitCallbacks(execute=True):
+            job = start_moderation_job(self.admin, 'verify_user', user_ids)
+
+        job = ModerationJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.processed, job.progress), ('done', len(user_ids), 100))
+        self.assertEqual(job.changed, len(user_ids))
+        self.assertEqual(UserProfile.objects.filter(is_verified=True).count(), len(user_ids))
+
+    def test_jobs_left_behind_by_a_crash_are_resumed(self):
+        users = create_users(20, prefix='member')
+        UserProfile.objects.bulk_create([UserProfile(user=user) for user in users])
+        user_ids = [user.pk for user in users]
+        # The first half committed before the process running the job died
+        moderate(self.admin, 'verify_user', user_ids[:10])
+        lost = ModerationJob.objects.create(
+            admin=self.admin, action_type='verify_user', target_ids=user_ids, total=20, processed=10, changed=10,
+            status='running',
+        )
+        queued = ModerationJob.objects.create(admin=self.admin, action_type='verify_user', target_ids=user_ids, total=20)
+        stale_at = timezone.now() - timedelta(seconds=settings.MODERATION_JOB_STALE_AFTER + 1)
+        ModerationJob.objects.filter(pk=lost.pk).update(updated_at=stale_at)
+        running = ModerationJob.objects.create(admin=self.admin, action_type='verify_user', target_ids=user_ids, total=20, status='running')
+
+        self.assertEqual(resume_stale_moderation_jobs(), 1)
+        lost.refresh_from_db()
+        self.assertEqual((lost.status, lost.processed, lost.changed), ('done', 20, 20))
+        self.assertEqual(AdminAction.objects.filter(action_type='verify_user').count(), 20)
+        self.assertEqual(UserProfile.objects.filter(is_verified=True).count(), 20)
+
+        # Jobs still moving are left to their worker
+        self.assertFalse(stale_moderation_jobs().exists())
+        self.assertEqual(ModerationJob.objects.get(pk=running.pk).status, 'running')
+        self.assertEqual(ModerationJob.objects.get(pk=queued.pk).status, 'pending')
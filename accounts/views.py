@@ -6,6 +6,8 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from .models import UserProfile
 from .forms import UserProfileForm
+from core.pagination import estimate_count, paginate
+from item.counters import apply_pending, increment
 from item.models import Item, ItemFavorite
 
 @login_required
@@ -29,10 +31,11 @@ def profile(request):
 
 @login_required
 def favorites(request):
-    favorite_items = ItemFavorite.objects.filter(user=request.user).select_related('item')
+    favorite_items = ItemFavorite.objects.filter(user=request.user).select_related('item', 'item__created_by').prefetch_related('item__images')
     
     context = {
-        'favorite_items': favorite_items,
+        'favorite_items': paginate(request, favorite_items, ('-created_at', '-id')),
+        'total_favorites': estimate_count(favorite_items),
     }
     return render(request, 'accounts/favorites.html', context)
 
@@ -43,15 +46,15 @@ def toggle_favorite(request, item_id):
     favorite, created = ItemFavorite.objects.get_or_create(item=item, user=request.user)
     
     if not created:
-        favorite.delete()
+        # Only the request that actually removed the row decrements the counter
+        if ItemFavorite.objects.filter(pk=favorite.pk).delete()[0]:
+            increment(item.pk, 'favorites', -1)
         favorited = False
-        item.favorites = max(0, item.favorites - 1)
     else:
+        increment(item.pk, 'favorites')
         favorited = True
-        item.favorites += 1
-    
-    item.save()
     
+    apply_pending([item])
     return JsonResponse({
         'favorited': favorited,
         'favorites_count': item.favorites
@@ -0,0 +1,94 @@
+from rest_framework import serializers
+
+
+class LeanSerializer(serializers.Serializer):
+    """
+    Read-only serializer over ``values()`` rows. Each field's ``source`` is
+    the column it reads, so ``columns()`` gives the ``values()`` arguments
+    for the fields a client asked for with ``?fields=``. Fields listed in
+    ``computed`` are filled in by the view instead of the query.
+    """
+
+    computed = ()
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    @classmethod
+    def field_names(cls, fields=None):
+        names = list(cls._declared_fields)
+        if fields:
+            names = [name for name in names if name in fields] or names
+        return names
+
+    @classmethod
+    def columns(cls, names):
+        return [
+            cls._declared_fields[name].source or name
+            for name in names if name not in cls.computed
+        ]
+
+
+class CategorySerializer(LeanSerializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    slug = serializers.CharField()
+    icon = serializers.CharField()
+    parent = serializers.IntegerField(source='parent_id', allow_null=True)
+    depth = serializers.IntegerField()
+    items_count = serializers.IntegerField(source='total_active_items_count')
+
+
+class ItemSerializer(LeanSerializer):
+    computed = ('image',)
+
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    condition = serializers.CharField()
+    category = serializers.IntegerField(source='category_id')
+    category_name = serializers.CharField(source='category__name')
+    seller = serializers.CharField(source='created_by__username')
+    location = serializers.CharField()
+    delivery_available = serializers.BooleanField()
+    is_featured = serializers.BooleanField()
+    views = serializers.IntegerField()
+    favorites = serializers.IntegerField()
+    created_at = serializers.DateTimeField()
+    updated_at = serializers.DateTimeField()
+    image = serializers.CharField(allow_null=True)
+
+
+class ItemDetailSerializer(ItemSerializer):
+    computed = ('image', 'images')
+
+    description = serializers.CharField(allow_null=True)
+    pickup_available = serializers.BooleanField()
+    is_negotiable = serializers.BooleanField()
+    status = serializers.CharField()
+    images = serializers.ListField(child=serializers.CharField())
+
+
+class FavoriteSerializer(LeanSerializer):
+    computed = ('image',)
+
+    id = serializers.IntegerField(source='item_id')
+    name = serializers.CharField(source='item__name')
+    price = serializers.DecimalField(source='item__price', max_digits=10, decimal_places=2)
+    status = serializers.CharField(source='item__status')
+    favorited_at = serializers.DateTimeField(source='created_at')
+    image = serializers.CharField(allow_null=True)
+
+
+class ConversationSerializer(LeanSerializer):
+    id = serializers.IntegerField(source='conversation_id')
+    item = serializers.IntegerField(source='conversation__item_id')
+    item_name = serializers.CharField(source='conversation__item__name')
+    counterpart = serializers.CharField(source='counterpart__username', allow_null=True)
+    last_message = serializers.CharField(source='conversation__last_message_snippet')
+    last_message_at = serializers.DateTimeField(source='conversation__last_message_at', allow_null=True)
+    unread_count = serializers.IntegerField()
+    modified_at = serializers.DateTimeField()
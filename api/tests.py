@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.http import http_date
+
+from conversation.threads import start_conversation
+from core.factories import create_users
+from item.counters import increment, rollup_counters
+from item.models import Category, Item
+from item.tracking import save_views
+
+from .views import PAGE_SIZE
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller, cls.buyer = create_users(2, prefix='api-tests')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        # A page and a half of listings
+        Item.objects.bulk_create([
+            Item(category=category, created_by=cls.seller, name=f'Chair {number}', price=100 + number, views=number)
+            for number in range(PAGE_SIZE + PAGE_SIZE // 2)
+        ])
+        cls.item = Item.objects.first()
+        start_conversation(cls.item, cls.buyer, 'Is this still available?')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_api_serves_selected_fields_and_revalidates(self):
+        items_url = reverse('api:items')
+
+        response = self.client.get(items_url, {'fields': 'id,name,price'})
+        data = response.json()
+        self.assertEqual(set(data['results'][0]), {'id', 'name', 'price'})
+        self.assertIsNotNone(data['next'])
+        self.assertFalse(response.has_header('Last-Modified'))
+
+        next_page = self.client.get(data['next']).json()
+        self.assertFalse({row['id'] for row in data['results']} & {row['id'] for row in next_page['results']})
+
+        list_etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(items_url, {'fields': 'id,name,price'}, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 304)
+
+        detail_url = reverse('api:item_detail', kwargs={'pk': self.item.pk})
+        response = self.client.get(detail_url)
+        self.assertEqual(response.json()['seller'], self.seller.username)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        # Editing the item changes both validators
+        Item.objects.get(pk=self.item.pk).save()
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        response = self.client.get(items_url, {'fields': 'id,name,price'}, HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+
+        token = self.client.post(reverse('api:token'), {'username': self.buyer.username, 'password': 'password'}).json()
+        self.client.logout()
+        response = self.client.get(reverse('api:conversations'), HTTP_AUTHORIZATION=f"Bearer {token['access']}")
+        self.assertEqual(response.json()['results'][0]['last_message'], 'Is this still available?')
+        self.assertEqual(self.client.get(reverse('api:conversations')).status_code, 401)
+
+    def test_counter_updates_change_the_validators(self):
+        items_url = reverse('api:items')
+        detail_url = reverse('api:item_detail', kwargs={'pk': self.item.pk})
+        list_etag = self.client.get(items_url)['ETag']
+        detail_etag = self.client.get(detail_url)['ETag']
+
+        detail = self.client.get(detail_url)
+        since = http_date(Item.objects.get(pk=self.item.pk).updated_at.timestamp() + 1)
+
+        # Views and favorites are rolled up with update(), which leaves updated_at alone
+        save_views([(self.item.pk, self.buyer.pk, '127.0.0.1')])
+        self.assertEqual(self.client.get(items_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+        response = self.client.get(detail_url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['views'], detail.json()['views'] + 1)
+        self.assertEqual(self.client.get(items_url, HTTP_IF_MODIFIED_SINCE=since).status_code, 200)
+
+        list_etag = self.client.get(items_url)['ETag']
+        detail_etag = self.client.get(detail_url)['ETag']
+        increment(self.item.pk, 'favorites')
+        self.assertEqual(self.client.get(items_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 304)
+        rollup_counters()
+        self.assertEqual(self.client.get(items_url, HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertEqual(self.client.get(detail_url, HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+    def test_items_ignore_sort_options_the_api_cannot_apply(self):
+        newest = self.client.get(reverse('api:items'), {'fields': 'id'}).json()['results']
+        for sort_by in ['distance', 'relevance', 'bogus']:
+            with self.subTest(sort_by=sort_by):
+                response = self.client.get(reverse('api:items'), {'fields': 'id', 'sort_by': sort_by})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['results'], newest)
+
+        results = self.client.get(reverse('api:items'), {'fields': 'id,views', 'sort_by': 'most_viewed'}).json()['results']
+        self.assertEqual(results[0]['views'], PAGE_SIZE + PAGE_SIZE // 2 - 1)
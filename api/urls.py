@@ -0,0 +1,16 @@
+from django.urls import path
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('token/', TokenObtainPairView.as_view(), name='token'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('categories/', views.categories, name='categories'),
+    path('items/', views.items, name='items'),
+    path('items/<int:pk>/', views.item_detail, name='item_detail'),
+    path('favorites/', views.favorites, name='favorites'),
+    path('conversations/', views.conversations, name='conversations'),
+]
@@ -0,0 +1,182 @@
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from conversation.models import ConversationMember
+from core.cache import get_versions
+from core.pagination import paginate
+from item.categories import get_category_tree
+from item.models import Item, ItemFavorite, ItemImage
+from item.views import SORT_ORDERINGS
+
+from .serializers import (
+    CategorySerializer, ConversationSerializer, FavoriteSerializer, ItemDetailSerializer, ItemSerializer,
+)
+
+PAGE_SIZE = 20
+
+# Sort options the API accepts; relevance and distance need a search or a place, which it doesn't take
+SORT_OPTIONS = ('newest', 'oldest', 'price_low', 'price_high', 'most_viewed', 'most_favorited')
+
+
+def requested_fields(request):
+    fields = request.query_params.get('fields', '')
+    return [name.strip() for name in fields.split(',') if name.strip()]
+
+
+def make_etag(request, *parts):
+    # The representation depends on the URL (cursor, filters, ?fields=) and on who asks
+    digest = hashlib.md5(
+        ':'.join(str(part) for part in [request.get_full_path(), request.user.pk, *parts]).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return quote_etag(digest)
+
+
+def conditional_response(request, etag):
+    # A 304 for a matching If-None-Match, else None. There is no Last-Modified: counters,
+    # deletions and expiries change a representation without a newer timestamp to show for it
+    return get_conditional_response(request, etag=etag)
+
+
+def with_validators(response, etag):
+    response['ETag'] = etag
+    return response
+
+
+def attach_images(rows, names, key='id'):
+    """
+    Fill in ``image`` (the card-sized photo) for the given rows with one
+    query over the page's items.
+    """
+    if 'image' not in names:
+        return
+
+    images = {}
+    ready = ItemImage.objects.filter(item_id__in=[row[key] for row in rows], status='ready').only(
+        'item_id', 'position', 'original', 'width', 'height', 'variants'
+    ).order_by('-position')
+    for image in ready:
+        images[image.item_id] = image
+    for row in rows:
+        image = images.get(row[key])
+        row['image'] = image.variant_url('card') if image else None
+
+
+def page_response(request, queryset, serializer_class, ordering, attach=None):
+    """
+    One keyset page of ``queryset`` serialized from ``values()`` rows that
+    carry only the requested fields plus the ordering keys.
+    """
+    names = serializer_class.field_names(requested_fields(request))
+    columns = {*serializer_class.columns(names), *(field.lstrip('-') for field in ordering)}
+    page = paginate(request, queryset.values(*columns), ordering, per_page=PAGE_SIZE)
+    rows = list(page)
+    if attach:
+        attach(rows, names)
+
+    response = Response({
+        'next': request.build_absolute_uri(page.next_url) if page.has_next() else None,
+        'previous': request.build_absolute_uri(page.previous_url) if page.has_previous() else None,
+        'results': serializer_class(rows, many=True, fields=names).data,
+    })
+    return response
+
+
+@api_view(['GET'])
+def categories(request):
+    etag = make_etag(request, *get_versions(['category', 'category-counts']))
+    not_modified = conditional_response(request, etag)
+    if not_modified:
+        return not_modified
+
+    names = CategorySerializer.field_names(requested_fields(request))
+    rows = get_category_tree().active()
+    return with_validators(Response({'results': CategorySerializer(rows, many=True, fields=names).data}), etag)
+
+
+@api_view(['GET'])
+def items(request):
+    # Every item write bumps the 'item' version and every counter update 'item-counts',
+    # so revalidating a list costs no queries
+    etag = make_etag(request, *get_versions(['item', 'item-counts', 'category']))
+    not_modified = conditional_response(request, etag)
+    if not_modified:
+        return not_modified
+
+    queryset = Item.objects.active()
+    category = request.query_params.get('category', '')
+    if category.isdigit():
+        queryset = queryset.filter(category__in=get_category_tree().descendant_ids(int(category)))
+
+    sort_by = request.query_params.get('sort_by')
+    if sort_by not in SORT_OPTIONS:
+        sort_by = 'newest'
+
+    response = page_response(request, queryset, ItemSerializer, SORT_ORDERINGS[sort_by], attach_images)
+    return with_validators(response, etag)
+
+
+@api_view(['GET'])
+def item_detail(request, pk):
+    # Revalidation reads the columns counters change without touching updated_at; the full row is only loaded for a 200
+    state = Item.objects.active().filter(pk=pk).values_list('updated_at', 'views', 'favorites').first()
+    if state is None:
+        raise Http404
+
+    updated_at, views, favorites = state
+    etag = make_etag(request, updated_at.isoformat(), views, favorites, *get_versions(['category']))
+    not_modified = conditional_response(request, etag)
+    if not_modified:
+        return not_modified
+
+    names = ItemDetailSerializer.field_names(requested_fields(request))
+    columns = ItemDetailSerializer.columns(names)
+    row = Item.objects.filter(pk=pk).values(*{'id', *columns}).get()
+    if 'image' in names or 'images' in names:
+        images = list(ItemImage.objects.filter(item_id=pk, status='ready').order_by('position'))
+        row['image'] = images[0].variant_url('card') if images else None
+        row['images'] = [image.variant_url('detail') for image in images]
+
+    response = Response(ItemDetailSerializer(row, fields=names).data)
+    return with_validators(response, etag)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def favorites(request):
+    queryset = ItemFavorite.objects.filter(user=request.user)
+
+    state = queryset.aggregate(count=Count('id'), latest=Max('created_at'))
+    etag = make_etag(request, state['count'], state['latest'], *get_versions(['item']))
+    not_modified = conditional_response(request, etag)
+    if not_modified:
+        return not_modified
+
+    response = page_response(
+        request, queryset, FavoriteSerializer, ('-created_at', '-id'),
+        lambda rows, names: attach_images(rows, names, key='item_id'),
+    )
+    return with_validators(response, etag)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def conversations(request):
+    queryset = ConversationMember.objects.filter(user=request.user)
+
+    # Reading a thread changes unread counts but not modified_at
+    state = queryset.aggregate(count=Count('id'), latest=Max('modified_at'), unread=Sum('unread_count'))
+    etag = make_etag(request, state['count'], state['latest'], state['unread'])
+    not_modified = conditional_response(request, etag)
+    if not_modified:
+        return not_modified
+
+    response = page_response(request, queryset, ConversationSerializer, ('-modified_at', '-id'))
+    return with_validators(response, etag)
@@ -0,0 +1,108 @@
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .inbox import mark_read
+from .models import Conversation, ConversationMessage
+from .realtime import conversation_group, user_group
+
+MAX_MESSAGE_LENGTH = 5000
+
+
+class ConversationConsumer(AsyncJsonWebsocketConsumer):
+    """
+    One socket per open conversation. Clients send ``message``, ``typing``
+    and ``read`` events; new messages (from the socket or a form POST) come
+    back as ``message`` events to every member in the conversation.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        self.conversation_id = self.scope['url_route']['kwargs']['pk']
+
+        if not self.user or not self.user.is_authenticated or not await self.is_member():
+            await self.close()
+            return
+
+        self.group_name = conversation_group(self.conversation_id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    @database_sync_to_async
+    def is_member(self):
+        return Conversation.objects.for_user(self.user).filter(pk=self.conversation_id).exists()
+
+    @database_sync_to_async
+    def mark_read(self, message_id):
+        conversation = Conversation.objects.filter(pk=self.conversation_id).first()
+        return conversation is not None and mark_read(conversation, self.user, message_id)
+
+    @database_sync_to_async
+    def create_message(self, content):
+        # Broadcast by the post_save signal once the row is committed
+        ConversationMessage.objects.create(
+            conversation_id=self.conversation_id, created_by=self.user, content=content
+        )
+
+    async def receive_json(self, content, **kwargs):
+        event = content.get('type')
+
+        if event == 'message':
+            text = str(content.get('content', '')).strip()[:MAX_MESSAGE_LENGTH]
+            if text:
+                await self.create_message(text)
+        elif event == 'typing':
+            await self.channel_layer.group_send(self.group_name, {
+                'type': 'member.typing',
+                'user': self.user.pk,
+                'username': self.user.username,
+                'typing': bool(content.get('typing', True)),
+            })
+        elif event == 'read':
+            message_id = content.get('message')
+            # Only reads that moved the marker are passed on to the other members
+            if not isinstance(message_id, int) or not await self.mark_read(message_id):
+                return
+            await self.channel_layer.group_send(self.group_name, {
+                'type': 'member.read',
+                'user': self.user.pk,
+                'message': message_id,
+            })
+
+    async def message_created(self, event):
+        await self.send_json({'type': 'message', 'message': event['message']})
+
+    async def member_typing(self, event):
+        if event['user'] != self.user.pk:
+            await self.send_json({'type': 'typing', 'user': event['user'], 'username': event['username'], 'typing': event['typing']})
+
+    async def member_read(self, event):
+        if event['user'] != self.user.pk:
+            await self.send_json({'type': 'read', 'user': event['user'], 'message': event['message']})
+
+
+class InboxConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Tells a signed-in user's open inbox about new messages in any of their
+    conversations, so it never has to be reloaded to find replies.
+    """
+
+    async def connect(self):
+        self.user = self.scope.get('user')
+        if not self.user or not self.user.is_authenticated:
+            await self.close()
+            return
+
+        self.group_name = user_group(self.user.pk)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def inbox_message(self, event):
+        await self.send_json({'type': 'message', 'message': event['message']})
@@ -0,0 +1,124 @@
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Count, F, Max, PositiveIntegerField, Q, Value, When
+
+from .models import SNIPPET_LENGTH, Conversation, ConversationMember, ConversationMessage
+
+
+def snippet(content):
+    return ' '.join(content.split())[:SNIPPET_LENGTH]
+
+
+def record_message(message):
+    """
+    Update the inbox state for a new message: the conversation's last message
+    and every member's position and unread count, in two UPDATEs.
+    """
+    with transaction.atomic():
+        Conversation.objects.filter(pk=message.conversation_id).update(
+            last_message=message,
+            last_message_snippet=snippet(message.content),
+            last_message_at=message.created_at,
+            modified_at=message.created_at,
+        )
+        # The sender has read their own message; everyone else has one more unread
+        ConversationMember.objects.filter(conversation_id=message.conversation_id).update(
+            modified_at=message.created_at,
+            unread_count=Case(
+                When(user_id=message.created_by_id, then=Value(0)),
+                default=F('unread_count') + 1,
+                output_field=PositiveIntegerField(),
+            ),
+            last_read_message_id=Case(
+                When(user_id=message.created_by_id, then=Value(message.pk)),
+                default=F('last_read_message_id'),
+                output_field=BigIntegerField(),
+            ),
+        )
+
+
+def mark_read(conversation, user, message_id=None):
+    """
+    Move ``user``'s read marker in ``conversation`` up to ``message_id`` (the
+    newest message by default) and recount what is left unread. Ids that
+    aren't messages of the conversation are ignored. Returns whether the
+    marker moved.
+    """
+    if message_id is not None and message_id != conversation.last_message_id:
+        # Sent by the client: a foreign or made up id must not move the marker past this thread's messages
+        if not conversation.messages.filter(pk=message_id).exists():
+            return False
+        if conversation.last_message_id is not None:
+            message_id = min(message_id, conversation.last_message_id)
+
+    if message_id is None or message_id == conversation.last_message_id:
+        message_id, unread_count = conversation.last_message_id, 0
+    else:
+        unread_count = conversation.messages.filter(pk__gt=message_id).exclude(created_by=user).count()
+
+    if message_id is None:
+        return False
+    return bool(ConversationMember.objects.filter(conversation=conversation, user=user).filter(
+        Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=message_id)
+    ).update(last_read_message_id=message_id, unread_count=unread_count))
+
+
+def link_counterparts(conversation_ids=None):
+    # Each member of a two-person conversation points at the other one
+    memberships = ConversationMember.objects.all()
+    if conversation_ids is not None:
+        memberships = memberships.filter(conversation_id__in=conversation_ids)
+    memberships = list(memberships)
+    members = {}
+    for membership in memberships:
+        members.setdefault(membership.conversation_id, []).append(membership.user_id)
+
+    changed = []
+    for membership in memberships:
+        others = [user_id for user_id in members[membership.conversation_id] if user_id != membership.user_id]
+        counterpart_id = others[0] if len(others) == 1 else None
+        if membership.counterpart_id != counterpart_id:
+            membership.counterpart_id = counterpart_id
+            changed.append(membership)
+    ConversationMember.objects.bulk_update(changed, ['counterpart'], batch_size=500)
+
+
+def refresh_inbox_state():
+    """
+    Recompute every conversation's last message, counterparts and unread
+    counts from scratch, for messages written with ``bulk_create()`` that
+    skip the save signals.
+    """
+    last_ids = dict(
+        ConversationMessage.objects.order_by().values_list('conversation_id').annotate(last_id=Max('id'))
+    )
+    last_messages = ConversationMessage.objects.in_bulk(last_ids.values())
+
+    conversations = list(Conversation.objects.all())
+    for conversation in conversations:
+        message = last_messages.get(last_ids.get(conversation.pk))
+        conversation.last_message = message
+        conversation.last_message_snippet = snippet(message.content) if message else ''
+        conversation.last_message_at = message.created_at if message else None
+        if message and message.created_at > conversation.modified_at:
+            conversation.modified_at = message.created_at
+    Conversation.objects.bulk_update(
+        conversations, ['last_message', 'last_message_snippet', 'last_message_at', 'modified_at'], batch_size=500
+    )
+
+    modified = {conversation.pk: conversation.modified_at for conversation in conversations}
+    memberships = list(ConversationMember.objects.all())
+    unread = dict(
+        ((row['conversation_id'], row['user_id']), row['unread'])
+        for row in ConversationMember.objects.order_by().values('conversation_id', 'user_id').annotate(
+            unread=Count('conversation__messages', filter=(
+                ~Q(conversation__messages__created_by=F('user_id'))
+                & (Q(last_read_message__isnull=True) | Q(conversation__messages__id__gt=F('last_read_message_id')))
+            ))
+        )
+    )
+    for membership in memberships:
+        membership.modified_at = modified[membership.conversation_id]
+        membership.unread_count = unread.get((membership.conversation_id, membership.user_id), 0)
+    ConversationMember.objects.bulk_update(memberships, ['modified_at', 'unread_count'], batch_size=500)
+
+    link_counterparts()
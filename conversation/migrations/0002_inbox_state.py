@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def backfill_inbox_state(apps, schema_editor):
+    Conversation = apps.get_model('conversation', 'Conversation')
+    ConversationMember = apps.get_model('conversation', 'ConversationMember')
+    ConversationMessage = apps.get_model('conversation', 'ConversationMessage')
+
+    last_messages = {}
+    for message in ConversationMessage.objects.order_by('conversation_id', 'id').iterator():
+        last_messages[message.conversation_id] = message
+
+    conversations = list(Conversation.objects.all())
+    for conversation in conversations:
+        message = last_messages.get(conversation.pk)
+        if message is not None:
+            conversation.last_message_id = message.pk
+            conversation.last_message_snippet = ' '.join(message.content.split())[:140]
+            conversation.last_message_at = message.created_at
+    Conversation.objects.bulk_update(
+        conversations, ['last_message', 'last_message_snippet', 'last_message_at'], batch_size=500
+    )
+
+    modified = {conversation.pk: conversation.modified_at for conversation in conversations}
+    members = {}
+    memberships = list(ConversationMember.objects.all())
+    for membership in memberships:
+        members.setdefault(membership.conversation_id, []).append(membership.user_id)
+
+    # Existing conversations start out read
+    for membership in memberships:
+        others = [user_id for user_id in members[membership.conversation_id] if user_id != membership.user_id]
+        membership.counterpart_id = others[0] if len(others) == 1 else None
+        membership.modified_at = modified[membership.conversation_id]
+        message = last_messages.get(membership.conversation_id)
+        membership.last_read_message_id = message.pk if message else None
+    ConversationMember.objects.bulk_update(
+        memberships, ['counterpart', 'modified_at', 'last_read_message'], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('conversation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='conversation.conversationmessage'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message_snippet',
+            field=models.CharField(blank=True, max_length=140),
+        ),
+        # The implicit members table becomes ConversationMember as it is
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='ConversationMember',
+                    fields=[
+                        ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                        ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='conversation.conversation')),
+                        ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memberships', to=settings.AUTH_USER_MODEL)),
+                    ],
+                    options={
+                        'db_table': 'conversation_conversation_members',
+                        'unique_together': {('conversation', 'user')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='conversation',
+                    name='members',
+                    field=models.ManyToManyField(related_name='conversations', through='conversation.ConversationMember', through_fields=('conversation', 'user'), to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='counterpart',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='last_read_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='conversation.conversationmessage'),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversationmember',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='conversationmember',
+            index=models.Index(fields=['user', '-modified_at', '-id'], name='conversation_member_inbox'),
+        ),
+        migrations.RunPython(backfill_inbox_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('conversation', '0002_inbox_state'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversationmessage',
+            index=models.Index(fields=['conversation', 'created_at', 'id'], name='conversation_message_history'),
+        ),
+    ]
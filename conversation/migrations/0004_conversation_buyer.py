@@ -0,0 +1,46 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_buyers(apps, schema_editor):
+    Conversation = apps.get_model('conversation', 'Conversation')
+    ConversationMember = apps.get_model('conversation', 'ConversationMember')
+
+    members = {}
+    for conversation_id, user_id in ConversationMember.objects.values_list('conversation_id', 'user_id'):
+        members.setdefault(conversation_id, []).append(user_id)
+
+    # The oldest thread per (item, buyer) keeps the identity; later duplicates stay without a buyer
+    seen = set()
+    conversations = []
+    for conversation in Conversation.objects.select_related('item').order_by('created_at', 'id'):
+        buyers = [user_id for user_id in members.get(conversation.pk, []) if user_id != conversation.item.created_by_id]
+        if buyers and (conversation.item_id, buyers[0]) not in seen:
+            seen.add((conversation.item_id, buyers[0]))
+            conversation.buyer_id = buyers[0]
+            conversations.append(conversation)
+    Conversation.objects.bulk_update(conversations, ['buyer'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('conversation', '0003_message_history_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='buyer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='started_conversations', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_buyers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('item', 'buyer'), name='unique_conversation_per_buyer'),
+        ),
+    ]
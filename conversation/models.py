@@ -1,19 +1,84 @@
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 from item.models import Item
 
+SNIPPET_LENGTH = 140
+
+class ConversationQuerySet(models.QuerySet):
+    def for_user(self, user):
+        return self.filter(members=user)
+
+    def with_related(self):
+        return self.select_related('item').prefetch_related('members', 'item__images')
+
 class Conversation(models.Model):
     item = models.ForeignKey(Item, related_name='conversations', on_delete=models.CASCADE)
-    members = models.ManyToManyField(User, related_name='conversations')
+    # Together with item identifies the thread; null only for duplicates made before the constraint
+    buyer = models.ForeignKey(User, related_name='started_conversations', null=True, blank=True, on_delete=models.CASCADE)
+    members = models.ManyToManyField(User, related_name='conversations', through='ConversationMember', through_fields=('conversation', 'user'))
     created_at = models.DateTimeField(auto_now_add=True)
     modified_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized from the newest message so the inbox needs no per-row queries
+    last_message = models.ForeignKey('ConversationMessage', related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    last_message_snippet = models.CharField(max_length=SNIPPET_LENGTH, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    objects = ConversationQuerySet.as_manager()
+
     class Meta:
         ordering = ('-modified_at',)
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'buyer'], name='unique_conversation_per_buyer'),
+        ]
+
+class ConversationMemberQuerySet(models.QuerySet):
+    def inbox(self, user):
+        return self.filter(user=user).select_related('conversation__item', 'counterpart').prefetch_related(
+            'conversation__item__images'
+        )
+
+class ConversationMember(models.Model):
+    # The table Django created for the old implicit M2M, whose key came from DEFAULT_AUTO_FIELD
+    id = models.BigAutoField(primary_key=True)
+    conversation = models.ForeignKey(Conversation, related_name='memberships', on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name='conversation_memberships', on_delete=models.CASCADE)
+
+    # The other member of a two-person conversation, shown in the inbox
+    counterpart = models.ForeignKey(User, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    last_read_message = models.ForeignKey('ConversationMessage', related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    unread_count = models.PositiveIntegerField(default=0)
+    # Copy of Conversation.modified_at, so the inbox is one range scan of the user's memberships
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    objects = ConversationMemberQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'conversation_conversation_members'
+        unique_together = ('conversation', 'user')
+        indexes = [
+            models.Index(fields=['user', '-modified_at', '-id'], name='conversation_member_inbox'),
+        ]
     
+class ConversationMessageQuerySet(models.QuerySet):
+    def with_related(self):
+        return self.select_related('created_by')
+
+    def since(self, message_id):
+        return self.filter(pk__gt=message_id).order_by('created_at', 'id')
+
 class ConversationMessage(models.Model):
     conversation = models.ForeignKey(Conversation, related_name='messages', on_delete=models.CASCADE)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
-    created_by = models.ForeignKey(User, related_name='created_messages', on_delete=models.CASCADE)
\ No newline at end of file
+    created_by = models.ForeignKey(User, related_name='created_messages', on_delete=models.CASCADE)
+
+    objects = ConversationMessageQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Backs the newest-first windows of a conversation's history
+            models.Index(fields=['conversation', 'created_at', 'id'], name='conversation_message_history'),
+        ]
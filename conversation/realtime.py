@@ -0,0 +1,37 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def conversation_group(conversation_id):
+    return f'conversation-{conversation_id}'
+
+
+def user_group(user_id):
+    return f'user-{user_id}'
+
+
+def serialize_message(message):
+    return {
+        'id': message.pk,
+        'conversation': message.conversation_id,
+        'content': message.content,
+        'created_by': message.created_by_id,
+        'username': message.created_by.username,
+        'created_at': message.created_at.isoformat(),
+    }
+
+
+def broadcast_message(message, member_ids):
+    """
+    Push a new message to everyone watching its conversation and to the
+    inbox of each member.
+    """
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    payload = serialize_message(message)
+    send = async_to_sync(channel_layer.group_send)
+    send(conversation_group(message.conversation_id), {'type': 'message.created', 'message': payload})
+    for member_id in member_ids:
+        send(user_group(member_id), {'type': 'inbox.message', 'message': payload})
@@ -0,0 +1,8 @@
+from django.urls import path
+
+from . import consumers
+
+websocket_urlpatterns = [
+    path('ws/inbox/', consumers.InboxConsumer.as_asgi()),
+    path('ws/conversations/<int:pk>/', consumers.ConversationConsumer.as_asgi()),
+]
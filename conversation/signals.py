@@ -0,0 +1,28 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+
+from .inbox import link_counterparts, record_message
+from .models import Conversation, ConversationMember, ConversationMessage
+from .realtime import broadcast_message
+
+@receiver(post_save, sender=ConversationMessage)
+def update_inbox_state(sender, instance, created, **kwargs):
+    if created:
+        record_message(instance)
+
+@receiver(post_save, sender=ConversationMessage)
+def push_new_message(sender, instance, created, **kwargs):
+    if not created:
+        return
+
+    member_ids = list(ConversationMember.objects.filter(
+        conversation_id=instance.conversation_id
+    ).values_list('user_id', flat=True))
+    transaction.on_commit(lambda: broadcast_message(instance, member_ids))
+
+@receiver(m2m_changed, sender=Conversation.members.through)
+def update_counterparts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove'):
+        return
+    link_counterparts(pk_set if reverse else [instance.pk])
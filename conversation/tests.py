@@ -1,3 +1,193 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from core.factories import create_users
+from item.models import Category, Item
+
+from .inbox import mark_read
+from .models import Conversation, ConversationMember, ConversationMessage
+from .routing import websocket_urlpatterns
+from .threads import start_conversation
+from .views import MESSAGES_PER_PAGE
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class ConversationTestCase(TestCase):
+    # A seller's listing and a buyer who has asked about it
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller, cls.buyer = create_users(2, prefix='conversation-tests')
+        category = Category.objects.create(name='Furniture', slug='furniture')
+        cls.item = Item.objects.create(category=category, created_by=cls.seller, name='Wooden chair', price=100)
+        cls.conversation, _ = start_conversation(cls.item, cls.buyer, 'Is this still available?')
+
+    def setUp(self):
+        cache.clear()
+
+
+class InboxTests(ConversationTestCase):
+    def test_inbox_state_follows_messages(self):
+        detail_url = reverse('conversation:detail', kwargs={'pk': self.conversation.pk})
+        buyer_membership = ConversationMember.objects.filter(conversation=self.conversation, user=self.buyer)
+
+        self.assertEqual(buyer_membership.get().counterpart, self.seller)
+
+        self.client.force_login(self.seller)
+        self.client.post(detail_url, {'content': 'Yes,   it is still\navailable'})
+        self.client.post(detail_url, {'content': 'Make me an offer'})
+
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.last_message_snippet, 'Make me an offer')
+        self.assertEqual(buyer_membership.get().unread_count, 2)
+        self.assertEqual(
+            ConversationMember.objects.get(conversation=self.conversation, user=self.seller).unread_count, 0
+        )
+
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('conversation:inbox'))
+        self.assertEqual(response.context['memberships'][0].conversation, self.conversation)
+        self.assertContains(response, 'Make me an offer')
+
+        self.client.get(detail_url)
+        membership = buyer_membership.get()
+        self.assertEqual((membership.unread_count, membership.last_read_message_id), (0, self.conversation.last_message_id))
+
+
+    def test_read_markers_only_move_to_messages_of_the_conversation(self):
+        first = self.conversation.messages.get()
+        reply = ConversationMessage.objects.create(conversation=self.conversation, created_by=self.seller, content='Yes')
+        other_item = Item.objects.create(category=self.item.category, created_by=self.seller, name='Red sofa', price=100)
+        other, _ = start_conversation(other_item, self.buyer, 'And this one?')
+        other.refresh_from_db()
+        self.conversation.refresh_from_db()
+        membership = ConversationMember.objects.filter(conversation=self.conversation, user=self.buyer)
+
+        # Made up ids and messages of other conversations are ignored
+        self.assertFalse(mark_read(self.conversation, self.buyer, other.last_message_id + 1000))
+        self.assertFalse(mark_read(self.conversation, self.buyer, other.last_message_id))
+        self.assertEqual((membership.get().last_read_message_id, membership.get().unread_count), (first.pk, 1))
+
+        self.assertTrue(mark_read(self.conversation, self.buyer, reply.pk))
+        self.assertEqual((membership.get().last_read_message_id, membership.get().unread_count), (reply.pk, 0))
+
+
+class MessageHistoryTests(ConversationTestCase):
+    def test_message_history_is_windowed(self):
+        ConversationMessage.objects.bulk_create([
+            ConversationMessage(conversation=self.conversation, created_by=self.buyer, content=f'Offer {number}')
+            for number in range(MESSAGES_PER_PAGE * 2)
+        ])
+        newest = list(self.conversation.messages.order_by('-created_at', '-id').values_list('content', flat=True))
+        history_url = reverse('conversation:messages', kwargs={'pk': self.conversation.pk})
+
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('conversation:detail', kwargs={'pk': self.conversation.pk}))
+        history = response.context['history']
+        self.assertEqual([message.content for message in history], newest[:MESSAGES_PER_PAGE][::-1])
+
+        with self.assertNumQueries(4):
+            response = self.client.get(history_url, {'cursor': response.context['older_cursor'], 'format': 'json'})
+        data = response.json()
+        self.assertEqual([message['content'] for message in data['messages']], newest[MESSAGES_PER_PAGE:MESSAGES_PER_PAGE * 2][::-1])
+        self.assertIsNotNone(data['older_cursor'])
+
+        response = self.client.get(history_url, {'cursor': data['older_cursor']})
+        self.assertContains(response, 'Is this still available?')
+        self.assertEqual(response['X-Older-Cursor'], '')
+
+        data = self.client.get(history_url, {'after': history[-3].pk, 'format': 'json'}).json()
+        self.assertEqual([message['content'] for message in data['messages']], newest[:2][::-1])
+        self.assertFalse(data['has_newer'])
+
+
+class StartConversationTests(ConversationTestCase):
+    def test_starting_a_conversation_is_idempotent(self):
+        item = Item.objects.create(category=self.item.category, created_by=self.seller, name='Red sofa', price=100)
+        new_url = reverse('conversation:new', kwargs={'item_pk': item.pk})
+
+        self.client.force_login(self.buyer)
+        for _ in range(2):
+            self.client.post(new_url, {'content': 'Would you take less?'})
+
+        conversation = Conversation.objects.get(item=item, buyer=self.buyer)
+        self.assertEqual(set(conversation.members.all()), {self.buyer, self.seller})
+        self.assertEqual(conversation.messages.count(), 1)
+        self.assertEqual(conversation.last_message_snippet, 'Would you take less?')
+
+        # A race past the lookup hits the unique constraint and gets the same thread back
+        self.assertEqual(start_conversation(item, self.buyer, 'Would you take less?'), (conversation, False))
+
+        with self.assertNumQueries(3):
+            response = self.client.get(new_url)
+        self.assertRedirects(response, reverse('conversation:detail', kwargs={'pk': conversation.pk}))
+
+
+class WebsocketTests(ConversationTestCase):
+    def test_conversation_messages_are_pushed_over_websockets(self):
+        outsider = create_users(1, prefix='outsider')[0]
+        application = URLRouter(websocket_urlpatterns)
+        conversation_path = f'/ws/conversations/{self.conversation.pk}/'
+
+        self.client.force_login(self.seller)
+
+        @database_sync_to_async
+        def post_message(content):
+            # The fallback POST; on_commit hooks only run here when captured
+            with self.captureOnCommitCallbacks(execute=True):
+                return self.client.post(
+                    reverse('conversation:detail', kwargs={'pk': self.conversation.pk}),
+                    {'content': content}, HTTP_ACCEPT='application/json',
+                )
+
+        @database_sync_to_async
+        def message_exists(content):
+            return self.conversation.messages.filter(content=content, created_by=self.buyer).exists()
+
+        async def connect(user, path):
+            communicator = WebsocketCommunicator(application, path)
+            communicator.scope['user'] = user
+            connected, _ = await communicator.connect()
+            return communicator, connected
+
+        async def scenario():
+            _, connected = await connect(outsider, conversation_path)
+            self.assertFalse(connected)
+
+            buyer, connected = await connect(self.buyer, conversation_path)
+            self.assertTrue(connected)
+            seller_socket, _ = await connect(self.seller, conversation_path)
+            buyer_inbox, _ = await connect(self.buyer, '/ws/inbox/')
+
+            await buyer.send_json_to({'type': 'typing', 'typing': True})
+            event = await seller_socket.receive_json_from()
+            self.assertEqual((event['type'], event['username']), ('typing', self.buyer.username))
+            self.assertTrue(await buyer.receive_nothing())
+
+            response = await post_message('Yes, still for sale')
+            self.assertEqual(response.status_code, 201)
+            for socket in (buyer, seller_socket, buyer_inbox):
+                event = await socket.receive_json_from()
+                self.assertEqual(event['type'], 'message')
+                self.assertEqual(event['message']['content'], 'Yes, still for sale')
+
+            await buyer.send_json_to({'type': 'read', 'message': response.json()['id']})
+            event = await seller_socket.receive_json_from()
+            self.assertEqual((event['type'], event['message']), ('read', response.json()['id']))
+
+            await buyer.send_json_to({'type': 'message', 'content': 'Great, I will take it'})
+            await buyer.receive_nothing()
+            self.assertTrue(await message_exists('Great, I will take it'))
+
+            for socket in (buyer, seller_socket, buyer_inbox):
+                await socket.disconnect()
+
+        async_to_sync(scenario)()
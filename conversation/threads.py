@@ -0,0 +1,42 @@
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+
+from item.models import Item
+
+from .models import Conversation, ConversationMember, ConversationMessage
+
+
+def get_item_with_conversation(item_pk, buyer):
+    """
+    The item with ``pk=item_pk`` annotated with ``conversation_id``, the
+    thread ``buyer`` already has about it (or None), in one query backed by
+    the unique (item, buyer) index.
+    """
+    return Item.objects.annotate(
+        conversation_id=Subquery(
+            Conversation.objects.filter(item=OuterRef('pk'), buyer=buyer).values('pk')[:1]
+        )
+    ).filter(pk=item_pk).first()
+
+
+def start_conversation(item, buyer, content):
+    """
+    Open ``buyer``'s thread about ``item`` with a first message: the
+    conversation, both memberships and the message in one transaction.
+    Returns ``(conversation, created)``; when the thread already exists
+    (e.g. a double-submitted form) it is returned unchanged.
+    """
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                conversation = Conversation.objects.create(item=item, buyer=buyer)
+        except IntegrityError:
+            return Conversation.objects.get(item=item, buyer=buyer), False
+
+        ConversationMember.objects.bulk_create([
+            ConversationMember(conversation=conversation, user_id=buyer.pk, counterpart_id=item.created_by_id),
+            ConversationMember(conversation=conversation, user_id=item.created_by_id, counterpart_id=buyer.pk),
+        ])
+        ConversationMessage.objects.create(conversation=conversation, created_by=buyer, content=content)
+
+    return conversation, True
@@ -7,5 +7,6 @@ app_name = 'conversation'
 urlpatterns = [
     path('', views.inbox, name='inbox'),
     path('<int:pk>/', views.detail, name='detail'),
+    path('<int:pk>/messages/', views.message_history, name='messages'),
     path('new/<int:item_pk>/', views.new_conversation, name='new'),
 ]
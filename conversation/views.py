@@ -1,36 +1,48 @@
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
 
-from item.models import Item
+from core.async_views import arender, async_login_required
+from core.pagination import paginate
 
 from .forms import ConversationMessageForm
-from .models import Conversation
+from .inbox import mark_read
+from .models import Conversation, ConversationMember
+from .realtime import serialize_message
+from .threads import get_item_with_conversation, start_conversation
+
+# Messages shown when a conversation opens and fetched per older page
+MESSAGES_PER_PAGE = 30
+
+def get_message_window(request, conversation):
+    """
+    The newest page of ``conversation``'s messages, or the page before
+    ``?cursor=``, oldest first. Returns the messages and the cursor for the
+    page before them.
+    """
+    messages = conversation.messages.with_related()
+    page = paginate(request, messages, ('-created_at', '-id'), per_page=MESSAGES_PER_PAGE)
+    return list(reversed(page.object_list)), page.next_cursor
 
 @login_required
 def new_conversation(request, item_pk):
-    item = get_object_or_404(Item, pk=item_pk)
+    item = get_item_with_conversation(item_pk, request.user)
 
-    if item.created_by == request.user:
+    if item is None:
+        raise Http404
+
+    if item.created_by_id == request.user.pk:
         return redirect('dashboard:index')
-    
-    conversations = Conversation.objects.filter(item=item).filter(members__in=[request.user.id])
 
-    if conversations:
-        return redirect('conversation:detail', pk=conversations.first().id)
+    if item.conversation_id:
+        return redirect('conversation:detail', pk=item.conversation_id)
 
     if request.method == 'POST':
         form = ConversationMessageForm(request.POST)
 
         if form.is_valid():
-            conversation = Conversation.objects.create(item=item)
-            conversation.members.add(request.user)
-            conversation.members.add(item.created_by)
-            conversation.save()
-
-            conversation_message = form.save(commit=False)
-            conversation_message.conversation = conversation
-            conversation_message.created_by = request.user
-            conversation_message.save()
+            start_conversation(item, request.user, form.cleaned_data['content'])
 
             return redirect('item:detail', pk=item_pk)
     else:
@@ -40,17 +52,18 @@ def new_conversation(request, item_pk):
         'form': form
     })
 
-@login_required
-def inbox(request):
-    conversations = Conversation.objects.filter(members__in=[request.user.id])
+@async_login_required
+async def inbox(request):
+    memberships = ConversationMember.objects.inbox(request.user)
+    page = await sync_to_async(paginate)(request, memberships, ('-modified_at', '-id'), per_page=20)
 
-    return render(request, 'conversation/inbox.html', {
-        'conversations': conversations
+    return await arender(request, 'conversation/inbox.html', {
+        'memberships': page
     })
 
 @login_required
 def detail(request, pk):
-    conversation = Conversation.objects.filter(members__in=[request.user.id]).get(pk=pk)
+    conversation = get_object_or_404(Conversation.objects.for_user(request.user), pk=pk)
 
     if request.method == 'POST':
         form = ConversationMessageForm(request.POST)
@@ -61,13 +74,49 @@ def detail(request, pk):
             conversation_message.created_by = request.user
             conversation_message.save()
 
-            conversation.save()
+            # The page posts with fetch when its socket is down; members get the message pushed either way
+            if 'application/json' in request.headers.get('Accept', ''):
+                return JsonResponse(serialize_message(conversation_message), status=201)
 
             return redirect('conversation:detail', pk=pk)
     else:
         form = ConversationMessageForm()
+        mark_read(conversation, request.user)
+
+    history, older_cursor = get_message_window(request, conversation)
 
     return render(request, 'conversation/detail.html', {
         'conversation': conversation,
+        'history': history,
+        'older_cursor': older_cursor,
         'form': form
-    })
\ No newline at end of file
+    })
+
+@login_required
+def message_history(request, pk):
+    """
+    Older messages with ``?cursor=``, or messages newer than ``?after=<id>``,
+    as JSON or (by default) as rendered message HTML.
+    """
+    conversation = get_object_or_404(Conversation.objects.for_user(request.user), pk=pk)
+
+    after = request.GET.get('after', '')
+    if after.isdigit():
+        rows = list(conversation.messages.with_related().since(int(after))[:MESSAGES_PER_PAGE + 1])
+        history, older_cursor = rows[:MESSAGES_PER_PAGE], None
+        has_newer = len(rows) > MESSAGES_PER_PAGE
+    else:
+        history, older_cursor = get_message_window(request, conversation)
+        has_newer = False
+
+    if request.GET.get('format') == 'json' or 'application/json' in request.headers.get('Accept', ''):
+        return JsonResponse({
+            'messages': [serialize_message(message) for message in history],
+            'older_cursor': older_cursor,
+            'has_newer': has_newer,
+        })
+
+    response = render(request, 'conversation/messages.html', {'history': history})
+    response['X-Older-Cursor'] = older_cursor or ''
+    response['X-Has-Newer'] = 'true' if has_newer else 'false'
+    return response
@@ -1,3 +1,59 @@
 from django.contrib import admin
+from django.db.models import Avg, Count, Max, Sum
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 
-# Register your models here.
+from .models import SlowQuery
+
+# Fingerprints listed on the summary page, costliest first
+FINGERPRINTS_SHOWN = 100
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'duration_ms', 'view', 'origin', 'short_sql', 'fingerprint')
+    list_filter = ('view', 'database', 'analyzed')
+    search_fields = ('sql', 'origin', 'fingerprint')
+    date_hierarchy = 'created_at'
+    readonly_fields = [field.name for field in SlowQuery._meta.fields]
+    change_list_template = 'admin/core/slowquery/change_list.html'
+
+    def short_sql(self, obj):
+        return obj.sql[:120]
+    short_sql.short_description = 'SQL'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('fingerprints/', self.admin_site.admin_view(self.fingerprints_view), name='core_slowquery_fingerprints'),
+            *super().get_urls(),
+        ]
+
+    def fingerprints_view(self, request):
+        """
+        Captured queries grouped by fingerprint, by total time spent in
+        them, each with its latest example and plan.
+        """
+        groups = list(
+            SlowQuery.objects.order_by().values('fingerprint').annotate(
+                count=Count('id'), total_ms=Sum('duration_ms'), average_ms=Avg('duration_ms'),
+                max_ms=Max('duration_ms'), latest_id=Max('id'), last_seen=Max('created_at'),
+            ).order_by('-total_ms')[:FINGERPRINTS_SHOWN]
+        )
+        latest = SlowQuery.objects.in_bulk([group['latest_id'] for group in groups])
+        changelist_url = reverse('admin:core_slowquery_changelist')
+        for group in groups:
+            group['latest'] = latest.get(group['latest_id'])
+            group['url'] = f"{changelist_url}?fingerprint={group['fingerprint']}"
+
+        return TemplateResponse(request, 'admin/core/slowquery/fingerprints.html', {
+            **self.admin_site.each_context(request),
+            'title': 'Slow queries by fingerprint',
+            'opts': self.model._meta,
+            'groups': groups,
+        })
@@ -0,0 +1,31 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import render
+
+
+async def aget_user(request):
+    # request.user loads the session and user lazily, which must not happen on the event loop
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+def async_login_required(view):
+    # django.contrib.auth.decorators.login_required only wraps sync views before Django 5.0
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def arender(request, template_name, context=None):
+    """
+    ``render()`` for async views. Templates may still evaluate lazy querysets
+    (e.g. inside a cached fragment that missed), so they render on the
+    request's sync thread.
+    """
+    return await sync_to_async(render)(request, template_name, context)
@@ -0,0 +1,40 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.BACKGROUND_WORKERS, thread_name_prefix='background'
+        )
+    return _executor
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        close_old_connections()
+
+
+def run_in_background(func, *args):
+    """
+    Run ``func(*args)`` on a worker thread once the current transaction
+    commits, so the task sees the rows the request just wrote. With
+    ``BACKGROUND_TASKS_EAGER`` it runs inline instead (tests, scripts).
+    """
+    if settings.BACKGROUND_TASKS_EAGER:
+        transaction.on_commit(lambda: func(*args))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run, func, args))
@@ -0,0 +1,151 @@
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .metrics import record_cache
+
+logger = logging.getLogger(__name__)
+
+# How long a stale fragment may still be served while one process re-renders it
+STALE_GRACE = 60
+LOCK_TIMEOUT = 10
+# A cold miss waits up to LOCK_WAIT_STEPS * LOCK_WAIT_INTERVAL seconds for the process holding the lock
+LOCK_WAIT_STEPS = 20
+LOCK_WAIT_INTERVAL = 0.05
+
+
+def _cache_errors():
+    try:
+        from redis.exceptions import RedisError
+    except ImportError:
+        return (OSError,)
+    return (RedisError, OSError)
+
+
+def _call(method, *args, **kwargs):
+    # Keep serving from process memory when Redis is unreachable
+    try:
+        return getattr(caches['default'], method)(*args, **kwargs)
+    except _cache_errors():
+        logger.warning('Default cache unavailable, using the local memory cache', exc_info=True)
+        return getattr(caches['local'], method)(*args, **kwargs)
+
+
+def _version_key(namespace):
+    return f'fragment-version:{namespace}'
+
+
+def get_versions(namespaces):
+    keys = [_version_key(namespace) for namespace in namespaces]
+    versions = _call('get_many', keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so an evicted version never reuses an old number
+            _call('add', key, int(time.time() * 1000), None)
+            versions[key] = _call('get', key)
+    return [versions[key] for key in keys]
+
+
+def _bump(key):
+    try:
+        _call('incr', key)
+    except ValueError:
+        _call('add', key, int(time.time() * 1000), None)
+
+
+def bump_version(namespace):
+    key = _version_key(namespace)
+    _bump(key)
+    # Again once the transaction commits, in case another process re-rendered from the old rows in between
+    transaction.on_commit(lambda: _bump(key))
+
+
+def fragment_key(name, namespaces, vary_on=()):
+    versions = get_versions(namespaces)
+    digest = hashlib.md5(
+        ':'.join(str(part) for part in [*versions, *vary_on]).encode(),
+        usedforsecurity=False,
+    ).hexdigest()
+    return f'fragment:{name}:{digest}'
+
+
+def get_or_compute(key, compute, timeout=None):
+    """
+    Return the cached value for ``key``, calling ``compute`` to fill it.
+
+    Values are stored with a refresh time ahead of their expiry. Once it has
+    passed, the first process to take the lock recomputes while everyone else
+    keeps serving the old value, and on a cold miss the others wait for it,
+    so an invalidation never sends every request to the database at once.
+    """
+    timeout = timeout or settings.FRAGMENT_CACHE_TIMEOUT
+    lock_key = f'{key}:lock'
+
+    entry = _call('get', key)
+    record_cache(entry is not None)
+    if entry is not None:
+        value, refresh_at = entry
+        if time.time() < refresh_at or not _call('add', lock_key, 1, LOCK_TIMEOUT):
+            return value
+        locked = True
+    else:
+        locked = _call('add', lock_key, 1, LOCK_TIMEOUT)
+        if not locked:
+            for _ in range(LOCK_WAIT_STEPS):
+                time.sleep(LOCK_WAIT_INTERVAL)
+                entry = _call('get', key)
+                if entry is not None:
+                    return entry[0]
+
+    try:
+        value = compute()
+        _call('set', key, (value, time.time() + timeout), timeout + STALE_GRACE)
+    finally:
+        if locked:
+            _call('delete', lock_key)
+    return value
+
+
+def _log_key(log):
+    return f'change-log:{log}'
+
+
+def append_change(log, change, timeout):
+    """
+    Add ``change`` to the named log of changes, kept for ``timeout``
+    seconds, and return its sequence number.
+    """
+    key = _log_key(log)
+    try:
+        sequence = _call('incr', key)
+    except ValueError:
+        _call('add', key, 0, None)
+        sequence = _call('incr', key)
+    _call('set', f'{key}:{sequence}', change, timeout)
+    return sequence
+
+
+def get_changes(log, after, limit):
+    """
+    ``(sequence, changes)``: the latest sequence number of the log and the
+    changes made after ``after``, in order. A change that has expired, or
+    whose writer hasn't stored it yet, is None; ``changes`` is None when
+    there are more than ``limit`` of them.
+    """
+    key = _log_key(log)
+    sequence = _call('get', key) or 0
+    if sequence <= after:
+        return sequence, []
+    if sequence - after > limit:
+        return sequence, None
+    keys = [f'{key}:{number}' for number in range(after + 1, sequence + 1)]
+    changes = _call('get_many', keys)
+    return sequence, [changes.get(change_key) for change_key in keys]
+
+
+def get_sequence(log):
+    return _call('get', _log_key(log)) or 0
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # Cache versions, the autocomplete change log and snapshots only reach other workers through a shared cache
+    if settings.CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache':
+        return []
+    return [Warning(
+        'The default cache is local to each process.',
+        hint=(
+            'Set REDIS_URL when running more than one worker. Otherwise invalidations only reach the '
+            'process that made them, and the others serve stale fragments, category trees and '
+            'suggestions until these expire.'
+        ),
+        id='core.W001',
+    )]
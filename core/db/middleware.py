@@ -0,0 +1,47 @@
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from .routers import end_request, start_request
+
+PIN_COOKIE = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+def _start(request):
+    # Requests that change state read what they are about to change from the primary
+    return start_request(pinned=PIN_COOKIE in request.COOKIES or request.method not in SAFE_METHODS)
+
+
+def _finish(request, response, state):
+    # The cookie expires once the replicas should have caught up with this request's writes
+    if state['wrote'] and request.method not in SAFE_METHODS:
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+        )
+    return response
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    """
+    Lets core.db.routers.ReplicaRouter send this request's reads to a replica
+    and pins the client to the primary for a while after it writes.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token, state = _start(request)
+            try:
+                response = await get_response(request)
+            finally:
+                end_request(token)
+            return _finish(request, response, state)
+    else:
+        def middleware(request):
+            token, state = _start(request)
+            try:
+                response = get_response(request)
+            finally:
+                end_request(token)
+            return _finish(request, response, state)
+    return middleware
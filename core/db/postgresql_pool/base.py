@@ -0,0 +1,79 @@
+"""
+PostgreSQL backend that takes connections from a psycopg_pool
+ConnectionPool instead of opening one per thread. Under ASGI every request
+runs on a new thread, so Django's persistent connections are never reused;
+a pool shared by the process is.
+
+Configured with ``OPTIONS['pool']`` (``min_size``, ``max_size``,
+``timeout``); ``CONN_MAX_AGE`` should be 0 so connections go back to the
+pool at the end of each request.
+"""
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg import IsolationLevel
+from psycopg_pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, options):
+    with _pools_lock:
+        if alias not in _pools:
+            _pools[alias] = ConnectionPool(
+                kwargs=conn_params,
+                min_size=options.get('min_size', 2),
+                max_size=options.get('max_size', 10),
+                timeout=options.get('timeout', 10),
+                # Health check on checkout: a connection the server dropped is replaced, not handed out
+                check=ConnectionPool.check_connection,
+                name=alias,
+                open=True,
+            )
+        return _pools[alias]
+
+
+def pool_stats():
+    """
+    Current figures for every pool in this process, by database alias:
+    connections checked out, requests waiting for one, and connections
+    created since start.
+    """
+    stats = {}
+    with _pools_lock:
+        pools = dict(_pools)
+    for alias, pool in pools.items():
+        pool_stats = pool.get_stats()
+        stats[alias] = {
+            'checked_out': pool_stats.get('pool_size', 0) - pool_stats.get('pool_available', 0),
+            'available': pool_stats.get('pool_available', 0),
+            'size': pool_stats.get('pool_size', 0),
+            'max_size': pool_stats.get('pool_max', 0),
+            'waiting': pool_stats.get('requests_waiting', 0),
+            'created': pool_stats.get('connections_num', 0),
+            'errors': pool_stats.get('connections_errors', 0) + pool_stats.get('requests_errors', 0),
+            'lost': pool_stats.get('connections_lost', 0),
+            'wait_ms': pool_stats.get('requests_wait_ms', 0),
+        }
+    return stats
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        conn_params.pop('pool', None)
+        return conn_params
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = IsolationLevel(options.get('isolation_level', IsolationLevel.READ_COMMITTED))
+        connection = get_pool(self.alias, conn_params, options.get('pool', {})).getconn()
+        connection.isolation_level = self.isolation_level
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # The pool rolls back anything left open and discards broken connections
+            with self.wrap_database_errors:
+                _pools[self.alias].putconn(self.connection)
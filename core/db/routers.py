@@ -0,0 +1,101 @@
+"""
+Sends reads for the apps in DATABASE_REPLICA_APPS to the aliases in
+DATABASE_REPLICAS, and everything else to ``default``.
+
+Reads only go to a replica while a request is being served (see
+core.db.middleware): management commands and background jobs, which often
+read and then write, stay on the primary. So do unsafe requests (POST and
+friends), the rest of any request once it has written, and a client for
+DATABASE_REPLICA_PIN_SECONDS after one of its unsafe requests wrote, so users
+see their own changes before the replicas catch up.
+"""
+import contextvars
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+logger = logging.getLogger(__name__)
+
+# Per request state, set by core.db.middleware.replica_middleware
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+
+# Replica alias -> time.monotonic() before which it isn't tried again
+_down_until = {}
+
+
+def start_request(pinned=False):
+    state = {'pinned': pinned, 'wrote': False}
+    return _request_state.set(state), state
+
+
+def end_request(token):
+    _request_state.reset(token)
+
+
+def pin_to_primary():
+    # Reads for the rest of the request go to the primary
+    state = _request_state.get()
+    if state is not None:
+        state['pinned'] = True
+
+
+def mark_unavailable(alias):
+    _down_until[alias] = time.monotonic() + settings.DATABASE_REPLICA_RETRY_SECONDS
+
+
+def is_available(alias):
+    if alias not in connections:
+        return False
+    if _down_until.get(alias, 0) > time.monotonic():
+        return False
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError as e:
+        logger.warning('Replica %s is unavailable, reading from the primary: %s', alias, e)
+        mark_unavailable(alias)
+        return False
+    _down_until.pop(alias, None)
+    return True
+
+
+def get_replica():
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        if is_available(alias):
+            return alias
+    return None
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is None or state['pinned'] or not settings.DATABASE_REPLICAS:
+            return None
+        if model._meta.app_label not in settings.DATABASE_REPLICA_APPS:
+            return None
+        return get_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['wrote'] = True
+            state['pinned'] = True
+        # Instances read from a replica are still saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
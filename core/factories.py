@@ -0,0 +1,136 @@
+import random
+from decimal import Decimal
+from io import StringIO
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+
+from conversation.inbox import refresh_inbox_state
+from conversation.models import Conversation, ConversationMember, ConversationMessage
+from item.categories import refresh_category_counts
+from item.geo import locate_items
+from item.models import Category, Item, ItemFavorite, ItemView
+from item.search import rebuild_search_index
+
+ITEM_NOUNS = ['chair', 'table', 'sofa', 'phone', 'laptop', 'bicycle', 'jacket', 'shoes', 'television', 'fridge']
+ITEM_ADJECTIVES = ['red', 'used', 'vintage', 'wooden', 'leather', 'compact', 'large', 'modern', 'classic', 'portable']
+LOCATIONS = ['Nairobi', 'Nairobi CBD', 'Mombasa', 'Kisumu', 'Nakuru', 'Eldoret', 'Thika', 'Westlands']
+
+
+def create_users(count, prefix='user', password='password'):
+    password = make_password(password)
+    User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password)
+        for i in range(count)
+    ])
+    return list(User.objects.filter(username__startswith=prefix).order_by('id'))
+
+
+def create_items(users, categories, count, rng):
+    conditions = [choice for choice, label in Item.CONDITION_CHOICES]
+    Item.objects.bulk_create([
+        Item(
+            category=rng.choice(categories),
+            created_by=rng.choice(users),
+            name=f'{rng.choice(ITEM_ADJECTIVES)} {rng.choice(ITEM_NOUNS)} {i}',
+            description=' '.join(rng.choice(ITEM_ADJECTIVES + ITEM_NOUNS) for _ in range(20)),
+            price=Decimal(rng.randint(100, 100000)),
+            condition=rng.choice(conditions),
+            status='active' if rng.random() < 0.9 else rng.choice(['sold', 'pending', 'expired']),
+            location=rng.choice(LOCATIONS),
+            delivery_available=rng.random() < 0.5,
+            views=rng.randint(0, 5000),
+            favorites=rng.randint(0, 200),
+        )
+        for i in range(count)
+    ], batch_size=500)
+    # bulk_create() skips the signal that sets coordinates
+    locate_items()
+    return list(Item.objects.order_by('id'))
+
+
+def create_item_views(items, users, count, rng):
+    ItemView.objects.bulk_create([
+        ItemView(
+            item=rng.choice(items),
+            user=rng.choice(users) if rng.random() < 0.5 else None,
+            ip_address=f'10.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+        )
+        for _ in range(count)
+    ], batch_size=500, ignore_conflicts=True)
+
+
+def create_item_favorites(items, users, count, rng):
+    pairs = {(rng.choice(items).pk, rng.choice(users).pk) for _ in range(count)}
+    ItemFavorite.objects.bulk_create([
+        ItemFavorite(item_id=item_id, user_id=user_id) for item_id, user_id in pairs
+    ], batch_size=500)
+
+
+def create_conversations(items, users, count, rng):
+    # One thread per (item, buyer), as the unique constraint requires
+    pairs = {}
+    while len(pairs) < count:
+        item = rng.choice(items)
+        buyer = rng.choice([user for user in users[:10] if user.pk != item.created_by_id])
+        pairs[(item.pk, buyer.pk)] = item
+    Conversation.objects.bulk_create([
+        Conversation(item=item, buyer_id=buyer_id) for (item_id, buyer_id), item in pairs.items()
+    ])
+    conversations = list(Conversation.objects.select_related('item').order_by('id'))
+
+    memberships = []
+    for conversation in conversations:
+        seller_id = conversation.item.created_by_id
+        memberships.append(ConversationMember(conversation_id=conversation.pk, user_id=conversation.buyer_id, counterpart_id=seller_id))
+        memberships.append(ConversationMember(conversation_id=conversation.pk, user_id=seller_id, counterpart_id=conversation.buyer_id))
+    ConversationMember.objects.bulk_create(memberships, batch_size=500)
+    return conversations
+
+
+def create_conversation_messages(conversations, count, rng):
+    members = {}
+    for membership in ConversationMember.objects.all():
+        members.setdefault(membership.conversation_id, []).append(membership.user_id)
+
+    ConversationMessage.objects.bulk_create([
+        ConversationMessage(
+            conversation=conversation,
+            created_by_id=rng.choice(members[conversation.pk]),
+            content=' '.join(rng.choice(ITEM_ADJECTIVES + ITEM_NOUNS) for _ in range(12)),
+        )
+        for conversation in (rng.choice(conversations) for _ in range(count))
+    ], batch_size=500)
+
+
+def seed_dataset(users=50, items=2000, views=5000, favorites=1000, conversations=200, messages=2000, seed=0):
+    """
+    Fill the database with a realistic marketplace for benchmarks. Rows are
+    inserted in bulk, so the search index, category counts and inbox state
+    are rebuilt once at the end.
+    """
+    rng = random.Random(seed)
+
+    call_command('create_categories', stdout=StringIO())
+    categories = list(Category.objects.all())
+
+    user_rows = create_users(users)
+    item_rows = create_items(user_rows, categories, items, rng)
+    create_item_views(item_rows, user_rows, views, rng)
+    create_item_favorites(item_rows, user_rows, favorites, rng)
+    conversation_rows = create_conversations(item_rows, user_rows, conversations, rng)
+    create_conversation_messages(conversation_rows, messages, rng)
+    rebuild_search_index()
+    refresh_category_counts()
+    refresh_inbox_state()
+
+    return {
+        'categories': len(categories),
+        'users': users,
+        'items': items,
+        'item_views': ItemView.objects.count(),
+        'item_favorites': ItemFavorite.objects.count(),
+        'conversations': conversations,
+        'conversation_messages': messages,
+    }
@@ -0,0 +1,126 @@
+import json
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_PATHS = ['/', '/items/', '/items/?sort_by=most_viewed']
+
+
+def process_rss(pid):
+    """
+    Resident memory in bytes of ``pid`` and all of its descendants (the
+    workers of a gunicorn or uvicorn master). Linux only.
+    """
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # The command name may contain spaces; fields resume after its closing parenthesis
+                ppid = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        pending.extend(children.get(current, []))
+        try:
+            with open(f'/proc/{current}/status') as status:
+                for line in status:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a running server with concurrent GETs and report throughput, latency and '
+        'server memory, to compare WSGI and ASGI deployments (e.g. `gunicorn puddle.wsgi -w 4` '
+        'against `daphne puddle.asgi:application`) at equal memory'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the server under test')
+        parser.add_argument(
+            '--path', action='append', dest='paths',
+            help=f'Path to request, repeatable (default: {", ".join(DEFAULT_PATHS)})'
+        )
+        parser.add_argument('--concurrency', type=int, default=32, help='Requests in flight at once')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run for')
+        parser.add_argument('--pid', type=int, help='Server master PID, to report its resident memory with workers')
+        parser.add_argument('--label', default='', help='Name of this run in the report, e.g. "wsgi x4"')
+        parser.add_argument('--report', help='Append the results as a JSON line to this file')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or DEFAULT_PATHS
+        base_url = options['url'].rstrip('/')
+        deadline = time.monotonic() + options['duration']
+
+        lock = threading.Lock()
+        latencies = []
+        errors = []
+
+        def worker(index):
+            request_number = index
+            while time.monotonic() < deadline:
+                url = base_url + paths[request_number % len(paths)]
+                request_number += options['concurrency']
+                start = time.perf_counter()
+                try:
+                    with urlopen(url, timeout=30) as response:
+                        response.read()
+                except (HTTPError, URLError, OSError) as e:
+                    with lock:
+                        errors.append(str(e))
+                    continue
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            list(pool.map(worker, range(options['concurrency'])))
+        elapsed = time.monotonic() - started
+
+        if not latencies:
+            raise CommandError(f'No successful requests ({len(errors)} errors, e.g. {errors[:1]})')
+
+        latencies.sort()
+        result = {
+            'label': options['label'],
+            'url': base_url,
+            'paths': paths,
+            'concurrency': options['concurrency'],
+            'requests': len(latencies),
+            'errors': len(errors),
+            'requests_per_second': round(len(latencies) / elapsed, 1),
+            'p50_ms': round(statistics.median(latencies) * 1000, 1),
+            'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+            'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        }
+        if options['pid']:
+            rss = process_rss(options['pid'])
+            result['rss_mb'] = round(rss / 2 ** 20, 1)
+            # The figure to compare: throughput bought per unit of memory
+            result['requests_per_second_per_gb'] = round(result['requests_per_second'] / (rss / 2 ** 30), 1) if rss else None
+
+        if options['report']:
+            with open(options['report'], 'a') as report:
+                report.write(json.dumps(result) + '\n')
+
+        for key, value in result.items():
+            self.stdout.write(f'{key}: {value}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{result["requests_per_second"]} req/s, p95 {result["p95_ms"]} ms, {len(errors)} errors'
+        ))
@@ -0,0 +1,271 @@
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Upper bounds of the histogram buckets: seconds for timings, queries for query counts
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    'puddle_request_duration_seconds': ('Time to respond, by view', SECONDS_BUCKETS),
+    'puddle_request_sql_seconds': ('Time spent in SQL per request, by view', SECONDS_BUCKETS),
+    'puddle_request_sql_queries': ('SQL queries per request, by view', QUERY_BUCKETS),
+    'puddle_request_template_seconds': ('Time spent rendering templates per request, by view', SECONDS_BUCKETS),
+    'puddle_request_images_seconds': ('Time spent building image URLs per request, by view', SECONDS_BUCKETS),
+}
+COUNTERS = {
+    'puddle_fragment_cache_requests_total': 'Cached fragment and count lookups, by view and result',
+}
+
+PROCESSES_KEY = 'metrics:processes'
+
+_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    What one request spent its time on. Collected through a ContextVar, so
+    work the request hands to sync_to_async threads is counted too.
+    """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.started = time.perf_counter()
+        self.seconds = {'sql': 0.0, 'template': 0.0, 'images': 0.0}
+        self.queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.nesting = {}
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start_request(request=None):
+    timings = RequestTimings(request)
+    return _timings.set(timings), timings
+
+
+def end_request(token):
+    _timings.reset(token)
+
+
+def current_view():
+    # The view name (or path, before URL resolution) of the request being served, if any
+    timings = _timings.get()
+    if timings is None or timings.request is None:
+        return ''
+    match = getattr(timings.request, 'resolver_match', None)
+    return match.view_name if match else timings.request.path
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to the current request's ``name``
+    timing. Nested blocks of the same name count once.
+    """
+    timings = _timings.get()
+    if timings is None or timings.nesting.get(name):
+        yield
+        return
+    timings.nesting[name] = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.seconds[name] += time.perf_counter() - start
+        timings.nesting[name] = False
+
+
+def record_query(execute, sql, params, many, context):
+    # Installed as an execute wrapper on every connection (see CoreConfig.ready)
+    timings = _timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.seconds['sql'] += time.perf_counter() - start
+        timings.queries += 1
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_cache(hit):
+    timings = _timings.get()
+    if timings is not None:
+        if hit:
+            timings.cache_hits += 1
+        else:
+            timings.cache_misses += 1
+
+
+def server_timing(timings):
+    """The ``Server-Timing`` header value for a finished request."""
+    def milliseconds(seconds):
+        return f'{seconds * 1000:.1f}'
+
+    return ', '.join([
+        f'sql;dur={milliseconds(timings.seconds["sql"])};desc="{timings.queries} queries"',
+        f'cache;desc="hits {timings.cache_hits} / misses {timings.cache_misses}"',
+        f'template;dur={milliseconds(timings.seconds["template"])}',
+        f'images;dur={milliseconds(timings.seconds["images"])}',
+        f'total;dur={milliseconds(timings.elapsed())}',
+    ])
+
+
+class Registry:
+    """
+    This process's histograms and counters by label set, as plain lists so
+    a snapshot can be published to the cache and summed with the other
+    processes' for /metrics.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {name: {} for name in HISTOGRAMS}
+        self.counters = {name: {} for name in COUNTERS}
+        self.published = 0.0
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][1]
+        with self.lock:
+            # Per bucket counts, then the sum and count of all observations
+            series = self.histograms[name].setdefault(labels, [0] * len(buckets) + [0.0, 0])
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def increment(self, name, labels, amount=1):
+        if amount:
+            with self.lock:
+                self.counters[name][labels] = self.counters[name].get(labels, 0) + amount
+
+    def record(self, view, timings):
+        labels = (('view', view),)
+        self.observe('puddle_request_duration_seconds', labels, timings.elapsed())
+        self.observe('puddle_request_sql_seconds', labels, timings.seconds['sql'])
+        self.observe('puddle_request_sql_queries', labels, timings.queries)
+        self.observe('puddle_request_template_seconds', labels, timings.seconds['template'])
+        self.observe('puddle_request_images_seconds', labels, timings.seconds['images'])
+        self.increment('puddle_fragment_cache_requests_total', labels + (('result', 'hit'),), timings.cache_hits)
+        self.increment('puddle_fragment_cache_requests_total', labels + (('result', 'miss'),), timings.cache_misses)
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'histograms': {name: {labels: list(series) for labels, series in values.items()} for name, values in self.histograms.items()},
+                'counters': {name: dict(values) for name, values in self.counters.items()},
+            }
+
+
+registry = Registry()
+
+
+def process_id():
+    # Read on each call: workers forked from a preloaded parent share its import-time state
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def publish(force=False):
+    """
+    Store this process's totals in the cache for /metrics, at most every
+    METRICS_PUBLISH_INTERVAL seconds. Processes that stop publishing drop
+    out after a few intervals.
+    """
+    now = time.time()
+    if not force and now - registry.published < settings.METRICS_PUBLISH_INTERVAL:
+        return
+    registry.published = now
+    timeout = max(settings.METRICS_PUBLISH_INTERVAL * 6, 60)
+
+    process = process_id()
+    cache = caches['default']
+    cache.set(f'metrics:process:{process}', registry.snapshot(), timeout)
+    processes = cache.get(PROCESSES_KEY) or {}
+    if process not in processes or now - processes[process] > timeout / 2:
+        processes = {other: seen for other, seen in processes.items() if now - seen < timeout}
+        processes[process] = now
+        cache.set(PROCESSES_KEY, processes, None)
+
+
+def collect():
+    # Every live process's totals summed
+    publish(force=True)
+    processes = caches['default'].get(PROCESSES_KEY) or {}
+    snapshots = caches['default'].get_many([f'metrics:process:{process}' for process in processes])
+
+    histograms = {name: {} for name in HISTOGRAMS}
+    counters = {name: {} for name in COUNTERS}
+    for snapshot in snapshots.values():
+        for name, values in snapshot['histograms'].items():
+            totals = histograms.setdefault(name, {})
+            for labels, series in values.items():
+                totals[labels] = [total + value for total, value in zip(totals.get(labels, [0] * len(series)), series)]
+        for name, values in snapshot['counters'].items():
+            totals = counters.setdefault(name, {})
+            for labels, value in values.items():
+                totals[labels] = totals.get(labels, 0) + value
+    return histograms, counters
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    escaped = [(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for name, value in pairs]
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def render_prometheus(histograms, counters, gauges=()):
+    """
+    The Prometheus text exposition format. ``gauges`` are ``(name, help,
+    {labels: value})`` for figures read at scrape time.
+    """
+    lines = []
+    for name, (help_text, buckets) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for labels, series in sorted(histograms.get(name, {}).items()):
+            cumulative = 0
+            for bound, count in zip(buckets, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels([*labels, ("le", bound)])} {cumulative}')
+            lines.append(f'{name}_bucket{_labels([*labels, ("le", "+Inf")])} {series[-1]}')
+            lines.append(f'{name}_sum{_labels(labels)} {series[-2]}')
+            lines.append(f'{name}_count{_labels(labels)} {series[-1]}')
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for labels, value in sorted(counters.get(name, {}).items()):
+            lines.append(f'{name}{_labels(labels)} {value}')
+    for name, help_text, values in gauges:
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for labels, value in sorted(values.items()):
+            lines.append(f'{name}{_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def report_to_sentry(timings):
+    # Attaches the figures to the request's Sentry transaction when tracing is on
+    if not settings.SENTRY_DSN:
+        return
+    try:
+        import sentry_sdk
+    except ImportError:
+        return
+    sentry_sdk.set_measurement('sql_queries', timings.queries)
+    sentry_sdk.set_measurement('sql_time', timings.seconds['sql'] * 1000, 'millisecond')
+    sentry_sdk.set_measurement('template_time', timings.seconds['template'] * 1000, 'millisecond')
+    sentry_sdk.set_measurement('cache_misses', timings.cache_misses)
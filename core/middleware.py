@@ -0,0 +1,56 @@
+import logging
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.decorators import sync_and_async_middleware
+
+from .metrics import end_request, publish, registry, report_to_sentry, server_timing, start_request
+
+logger = logging.getLogger(__name__)
+
+
+def _shows_timings(request):
+    # Only staff see the breakdown; reading request.user may load the session
+    user = getattr(request, 'user', None)
+    return settings.DEBUG or bool(user and user.is_staff)
+
+
+def _finish(request, response, timings):
+    match = getattr(request, 'resolver_match', None)
+    registry.record(match.view_name if match else 'unmatched', timings)
+    report_to_sentry(timings)
+    if _shows_timings(request):
+        response['Server-Timing'] = server_timing(timings)
+    try:
+        publish()
+    except Exception:
+        # Metrics must never fail the request they describe
+        logger.warning('Publishing request metrics failed', exc_info=True)
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    """
+    Times each request's SQL, template rendering and image URL building,
+    counts its fragment cache hits and misses, and adds them to the
+    per-view histograms served at /metrics. Staff also get the figures in
+    a Server-Timing header.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token, timings = start_request(request)
+            try:
+                response = await get_response(request)
+            finally:
+                end_request(token)
+            return await sync_to_async(_finish)(request, response, timings)
+    else:
+        def middleware(request):
+            token, timings = start_request(request)
+            try:
+                response = get_response(request)
+            finally:
+                end_request(token)
+            return _finish(request, response, timings)
+    return middleware
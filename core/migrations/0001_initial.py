@@ -0,0 +1,35 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:39
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, max_length=32)),
+                ('sql', models.TextField()),
+                ('database', models.CharField(max_length=100)),
+                ('view', models.CharField(blank=True, db_index=True, max_length=200)),
+                ('origin', models.CharField(blank=True, max_length=500)),
+                ('stack', models.TextField(blank=True)),
+                ('duration_ms', models.FloatField()),
+                ('plan', models.TextField(blank=True)),
+                ('analyzed', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name_plural': 'slow queries',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
@@ -1,3 +1,28 @@
 from django.db import models
+from django.utils import timezone
 
-# Create your models here.
+
+class SlowQuery(models.Model):
+    """
+    A query that took longer than SLOW_QUERY_THRESHOLD_MS, captured by
+    core.slow_queries. Only the newest SLOW_QUERY_MAX_ROWS are kept.
+    """
+    fingerprint = models.CharField(max_length=32, db_index=True)
+    # Normalized: literals and parameters are replaced by ?
+    sql = models.TextField()
+    database = models.CharField(max_length=100)
+    view = models.CharField(max_length=200, blank=True, db_index=True)
+    origin = models.CharField(max_length=500, blank=True)
+    stack = models.TextField(blank=True)
+    duration_ms = models.FloatField()
+    # Values in its conditions are replaced by ? too
+    plan = models.TextField(blank=True)
+    analyzed = models.BooleanField(default=False)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        ordering = ('-created_at',)
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f'{self.duration_ms:.0f} ms {self.sql[:80]}'
@@ -0,0 +1,160 @@
+import base64
+import binascii
+import datetime
+import decimal
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.http import QueryDict
+
+# Below this many estimated rows an exact COUNT(*) is cheap and the planner estimate is unreliable
+EXACT_COUNT_THRESHOLD = 1000
+
+
+def _encode_value(value):
+    # Full precision on purpose: a cursor rounded to milliseconds would skip or repeat rows
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    raise TypeError(f'Cannot encode {type(value).__name__} in a cursor')
+
+
+def encode_cursor(values, reverse=False):
+    payload = json.dumps({'v': values, 'r': reverse}, default=_encode_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return payload['v'], bool(payload.get('r'))
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None, False
+
+
+def estimate_count(queryset):
+    """
+    Row count for result headers. On Postgres large results use the planner's
+    estimate instead of a full COUNT(*) scan.
+    """
+    queryset = queryset.order_by()
+
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.explain(format='json'))
+        estimate = plan[0]['Plan']['Plan Rows']
+        if estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate
+
+    return queryset.count()
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor, query_params=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.query_params = query_params
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def _url_for(self, cursor):
+        params = self.query_params.copy() if self.query_params is not None else QueryDict(mutable=True)
+        params.pop('page', None)
+        params['cursor'] = cursor
+        return f'?{params.urlencode()}'
+
+    @property
+    def next_url(self):
+        return self._url_for(self.next_cursor) if self.has_next() else None
+
+    @property
+    def previous_url(self):
+        return self._url_for(self.previous_cursor) if self.has_previous() else None
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over a fixed ordering. Each page is a range scan that
+    continues from the last row seen, so it needs neither COUNT(*) nor OFFSET.
+
+    ``ordering`` must end in a unique field (normally ``id``) so that every
+    row has a distinct position.
+    """
+
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.keys = [(field.lstrip('-'), field.startswith('-')) for field in self.ordering]
+
+    def _position(self, obj):
+        # Rows may be model instances or dicts from values()
+        if isinstance(obj, dict):
+            return [obj[name] for name, descending in self.keys]
+        return [getattr(obj, name) for name, descending in self.keys]
+
+    def _seek(self, queryset, values, reverse):
+        condition = Q()
+        for index, (name, descending) in enumerate(self.keys):
+            lookup = 'lt' if descending != reverse else 'gt'
+            clause = Q(**{self.keys[i][0]: values[i] for i in range(index)})
+            clause &= Q(**{f'{name}__{lookup}': values[index]})
+            condition |= clause
+        return queryset.filter(condition)
+
+    def get_page(self, cursor=None, query_params=None):
+        values, reverse = decode_cursor(cursor) if cursor else (None, False)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            values, reverse = None, False
+
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            try:
+                queryset = self._seek(queryset, values, reverse)
+            except (ValidationError, ValueError, TypeError):
+                # A tampered or stale cursor restarts from the first page
+                return self.get_page(None, query_params)
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = encode_cursor(self._position(rows[-1])) if rows and has_next else None
+        previous_cursor = encode_cursor(self._position(rows[0]), reverse=True) if rows and has_previous else None
+
+        return KeysetPage(rows, next_cursor, previous_cursor, query_params)
+
+
+def paginate(request, queryset, ordering, per_page=12):
+    paginator = KeysetPaginator(queryset, per_page, ordering)
+    return paginator.get_page(request.GET.get('cursor'), request.GET)
@@ -0,0 +1,189 @@
+import hashlib
+import logging
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from .background import run_in_background
+from .metrics import current_view
+
+logger = logging.getLogger(__name__)
+
+# Captured queries waiting to be written; the oldest are dropped if the writer falls behind
+BUFFER_SIZE = 200
+# Frames shown with each query, innermost first
+STACK_DEPTH = 8
+# Instrumentation that sits between the app and the database, skipped when finding a query's origin
+INSTRUMENTATION = ('core/slow_queries.py', 'core/metrics.py', 'core/middleware.py', 'core/template_backend.py', 'core/db/')
+
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+VALUE_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+# A number compared against in a plan's conditions, unlike its costs and row counts (rows=10)
+PLAN_NUMBER_RE = re.compile(r'(?<=[=<>] )-?\d+(?:\.\d+)?\b')
+SPACE_RE = re.compile(r'\s+')
+
+_capturing = ContextVar('capturing_slow_query', default=False)
+_buffer = deque(maxlen=BUFFER_SIZE)
+_flush_lock = threading.Lock()
+_flush_requested = None
+
+
+def normalize_sql(sql):
+    """
+    ``sql`` with its literals and parameters replaced by ``?`` and value
+    lists collapsed, so queries differing only in their values match.
+    """
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql.replace('%s', '?'))
+    sql = VALUE_LIST_RE.sub('(...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+def redact_plan(plan):
+    """
+    ``plan`` with the values the query compared against replaced by ``?``.
+    Postgres prints parameters into the plan's conditions, and they may be
+    anything a user typed.
+    """
+    return PLAN_NUMBER_RE.sub('?', STRING_RE.sub('?', plan))
+
+
+def fingerprint(normalized_sql):
+    return hashlib.md5(normalized_sql.encode(), usedforsecurity=False).hexdigest()
+
+
+def get_stack():
+    """
+    ``(origin, stack)``: the innermost frame of this project's code that
+    led to the query, and up to STACK_DEPTH project frames as text.
+    """
+    base = str(Path(settings.BASE_DIR)) + '/'
+    frames = []
+    for frame in reversed(traceback.extract_stack()):
+        if not frame.filename.startswith(base) or 'site-packages' in frame.filename:
+            continue
+        path = frame.filename[len(base):]
+        if any(path.startswith(prefix) for prefix in INSTRUMENTATION):
+            continue
+        frames.append(f'{path}:{frame.lineno} in {frame.name}\n    {frame.line or ""}')
+        if len(frames) == STACK_DEPTH:
+            break
+    return (frames[0].split('\n')[0] if frames else ''), '\n'.join(frames)
+
+
+def explain(connection, sql, params, analyze=False):
+    """
+    The database's plan for ``sql``. It runs on a fresh backend cursor in a
+    savepoint, so it isn't counted as one of the request's queries and a
+    failure can't break the request's transaction.
+    """
+    options = {'analyze': True} if analyze else {}
+    prefix = connection.ops.explain_query_prefix(**options)
+    try:
+        with transaction.atomic(using=connection.alias):
+            cursor = connection.create_cursor()
+            try:
+                cursor.execute(f'{prefix} {sql}', params)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+    except DatabaseError as exc:
+        return f'EXPLAIN failed: {exc}'
+    # One line per row; SQLite's QUERY PLAN rows end with the step's description
+    return '\n'.join(str(row[-1]) if connection.vendor == 'sqlite' else str(row[0]) for row in rows)
+
+
+def record_slow_query(execute, sql, params, many, context):
+    # Installed as an execute wrapper on every connection (see CoreConfig.ready)
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold is None or _capturing.get():
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - start) * 1000
+    if duration_ms >= threshold:
+        token = _capturing.set(True)
+        try:
+            capture(context['connection'], sql, params, many, duration_ms)
+        except Exception:
+            logger.warning('Capturing a slow query failed', exc_info=True)
+        finally:
+            _capturing.reset(token)
+    return result
+
+
+def install_slow_query_recorder(sender, connection, **kwargs):
+    if record_slow_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_slow_query)
+
+
+def capture(connection, sql, params, many, duration_ms):
+    normalized = normalize_sql(sql)
+    # Plans need a single statement's parameters; EXPLAIN ANALYZE runs the query again, so only reads
+    analyze = (
+        settings.SLOW_QUERY_EXPLAIN_ANALYZE and connection.vendor == 'postgresql'
+        and normalized.upper().startswith('SELECT')
+    )
+    plan = '' if many else redact_plan(explain(connection, sql, params, analyze))
+    origin, stack = get_stack()
+    _buffer.append({
+        'fingerprint': fingerprint(normalized),
+        'sql': normalized,
+        'database': connection.alias,
+        'view': current_view()[:200],
+        'origin': origin[:500],
+        'stack': stack,
+        'duration_ms': duration_ms,
+        'plan': plan,
+        'analyzed': analyze,
+    })
+    _request_flush()
+
+
+def _request_flush():
+    # One flush at a time; a request that never commits can only hold the flush back for a minute
+    global _flush_requested
+
+    with _flush_lock:
+        now = time.monotonic()
+        if _flush_requested is not None and now - _flush_requested < 60:
+            return
+        _flush_requested = now
+    run_in_background(flush_slow_queries)
+
+
+def flush_slow_queries():
+    """
+    Write the captured queries to SlowQuery, keeping only the newest
+    SLOW_QUERY_MAX_ROWS rows. Returns the number written.
+    """
+    from .models import SlowQuery
+
+    global _flush_requested
+
+    with _flush_lock:
+        records = list(_buffer)
+        _buffer.clear()
+        _flush_requested = None
+    if not records:
+        return 0
+
+    token = _capturing.set(True)
+    try:
+        SlowQuery.objects.bulk_create([SlowQuery(**record) for record in records])
+        limit = settings.SLOW_QUERY_MAX_ROWS
+        oldest_kept = list(SlowQuery.objects.order_by('-id').values_list('id', flat=True)[limit - 1:limit])
+        if oldest_kept:
+            SlowQuery.objects.filter(id__lt=oldest_kept[0]).delete()
+    finally:
+        _capturing.reset(token)
+    return len(records)
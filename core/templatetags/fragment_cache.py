@@ -0,0 +1,49 @@
+from django import template
+
+from core.cache import fragment_key, get_or_compute
+
+register = template.Library()
+
+
+class CacheFragmentNode(template.Node):
+    def __init__(self, nodelist, name, depends, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.depends = depends
+        self.vary_on = vary_on
+
+    def render(self, context):
+        namespaces = [namespace.strip() for namespace in self.depends.resolve(context).split(',')]
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = fragment_key(self.name, namespaces, vary_on)
+        return get_or_compute(key, lambda: self.nodelist.render(context))
+
+
+@register.tag('cachefragment')
+def do_cachefragment(parser, token):
+    """
+    Cache the contents of a template fragment until one of the models it
+    depends on changes::
+
+        {% load fragment_cache %}
+        {% cachefragment item_card 'category' item.pk item.updated_at %}
+            .. card ..
+        {% endcachefragment %}
+
+    The second argument lists the cache version namespaces (see
+    ``core.cache``) the fragment depends on, comma separated; any further
+    arguments are added to the key like ``{% cache %}``'s ``vary_on``.
+    """
+    nodelist = parser.parse(('endcachefragment',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 3:
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' tag requires a fragment name and the namespaces it depends on"
+        )
+    return CacheFragmentNode(
+        nodelist,
+        bits[1],
+        parser.compile_filter(bits[2]),
+        [parser.compile_filter(bit) for bit in bits[3:]],
+    )
@@ -1,3 +1,483 @@
-from django.test import TestCase
+import json
+import os
+import shutil
+import sqlite3
+import statistics
+import tempfile
+import time
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from asgiref.sync import async_to_sync
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from conversation.threads import start_conversation
+from core.db.routers import mark_unavailable
+from item.models import Category, Item
+from item.tracking import save_views
+
+from .checks import check_shared_cache
+from .db.postgresql_pool import base as postgresql_pool
+from .factories import create_users, seed_dataset
+from .models import SlowQuery
+from .pagination import KeysetPaginator, encode_cursor
+from .slow_queries import normalize_sql, redact_plan
+
+BENCHMARKED_URLCONFS = ['core.urls', 'item.urls', 'dashboard.urls', 'conversation.urls', 'accounts.urls', 'api.urls']
+
+# Set BENCHMARK_REPORT=path/to/report.json to write the measurements out for comparison between commits
+REPORT_PATH = os.environ.get('BENCHMARK_REPORT')
+MAX_SECONDS = float(os.environ.get('BENCHMARK_MAX_SECONDS', '1.0'))
+REPEAT = int(os.environ.get('BENCHMARK_REPEAT', '3'))
+
+
+class ViewCase:
+    def __init__(
+        self, name, budget, kwargs=None, query='', method='get', login=False, label=None, repeat=True, data=None,
+        headers=None,
+    ):
+        self.name = name
+        self.budget = budget
+        self.kwargs = kwargs or {}
+        self.query = query
+        self.method = method
+        self.login = login
+        self.label = label or name
+        # Views that change state (e.g. delete) can only be measured once
+        self.repeat = repeat
+        self.data = data
+        self.headers = headers or {}
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    VIEW_TRACKING_BUFFER='memory',
+    VIEW_TRACKING_FLUSH_INTERVAL=0,
+    BACKGROUND_TASKS_EAGER=True,
+    METRICS_TOKEN='benchmark',
+)
+class ViewPerformanceTests(TestCase):
+    """
+    Seeds a few thousand rows and requests every public URL, failing when a
+    view exceeds its SQL query budget or the wall-clock limit. Query budgets
+    must not depend on the number of rows, so an N+1 regression trips them.
+    """
+
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = seed_dataset()
+        cls.user = create_users(1, prefix='benchmark')[0]
+
+        other_items = Item.objects.exclude(created_by=cls.user).active()
+        cls.item = other_items.first()
+        cls.uncontacted_item = other_items.exclude(conversations__members=cls.user).last()
+        cls.own_item = Item.objects.create(
+            category=Category.objects.first(), created_by=cls.user, name='Benchmark item', price=100,
+        )
+        cls.disposable_item = Item.objects.create(
+            category=Category.objects.first(), created_by=cls.user, name='Disposable item', price=100,
+        )
+
+        cls.conversation, _ = start_conversation(cls.item, cls.user, 'Is this still available?')
+
+    def setUp(self):
+        # Cached fragments and the category tree would outlive each test's rollback
+        cache.clear()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        if REPORT_PATH and cls.results:
+            with open(REPORT_PATH, 'w') as report:
+                json.dump({
+                    'database': connection.vendor,
+                    'dataset': cls.dataset,
+                    'max_seconds': MAX_SECONDS,
+                    'views': sorted(cls.results, key=lambda result: result['name']),
+                }, report, indent=2)
+
+    def get_cases(self):
+        category = Category.objects.first()
+        return [
+            ViewCase('core:index', 5),
+            ViewCase('core:contact', 0),
+            ViewCase('core:featured', 0),
+            ViewCase('core:order_protection', 0),
+            ViewCase('core:become_supplier', 0),
+            ViewCase('core:help_center', 0),
+            ViewCase('core:buyer_central', 0),
+            ViewCase('core:faq', 0),
+            ViewCase('core:signup', 0),
+            ViewCase('core:login', 0),
+            ViewCase('core:database_health', 1),
+            ViewCase('core:metrics', 0, headers={'HTTP_AUTHORIZATION': 'Bearer benchmark'}),
+            ViewCase('item:items', 5),
+            ViewCase('item:autocomplete', 0, query='?q=woo'),
+            ViewCase('item:items', 5, query='?query=wooden+chair&sort_by=relevance', label='item:items search'),
+            ViewCase('item:items', 5, query=f'?category={category.pk}&sort_by=price_low&delivery_available=on', label='item:items filtered'),
+            ViewCase('item:items', 5, query='?sort_by=most_viewed', label='item:items most viewed'),
+            ViewCase('item:items', 5, query='?location=Nairobi&sort_by=distance', label='item:items nearby'),
+            ViewCase('item:new', 6, login=True),
+            ViewCase('item:detail', 8, kwargs={'pk': self.item.pk}, login=True),
+            ViewCase('item:edit', 6, kwargs={'pk': self.own_item.pk}, login=True),
+            ViewCase('item:delete', 15, kwargs={'pk': self.disposable_item.pk}, login=True, repeat=False),
+            ViewCase('dashboard:index', 6, login=True),
+            ViewCase('conversation:inbox', 5, login=True),
+            ViewCase('conversation:detail', 6, kwargs={'pk': self.conversation.pk}, login=True),
+            ViewCase('conversation:messages', 4, kwargs={'pk': self.conversation.pk}, login=True),
+            ViewCase('conversation:new', 4, kwargs={'item_pk': self.uncontacted_item.pk}, login=True),
+            ViewCase('accounts:profile', 8, login=True),
+            ViewCase('accounts:favorites', 6, login=True),
+            ViewCase('accounts:settings', 6, login=True),
+            ViewCase('accounts:toggle_favorite', 12, kwargs={'item_id': self.item.pk}, method='post', login=True),
+            ViewCase('api:token', 1, method='post', data={'username': self.user.username, 'password': 'password'}),
+            ViewCase('api:token_refresh', 0, method='post', data={'refresh': str(RefreshToken.for_user(self.user))}),
+            ViewCase('api:categories', 0),
+            ViewCase('api:items', 2),
+            ViewCase('api:items', 2, query=f'?category={category.pk}&sort_by=price_low&fields=id,name,price', label='api:items filtered'),
+            ViewCase('api:item_detail', 3, kwargs={'pk': self.item.pk}),
+            ViewCase('api:favorites', 5, login=True),
+            ViewCase('api:conversations', 4, login=True),
+        ]
+
+    def measure(self, case):
+        url = reverse(case.name, kwargs=case.kwargs) + case.query
+        timings = []
+        for _ in range(REPEAT if case.repeat else 1):
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = getattr(self.client, case.method)(url, case.data, **case.headers)
+                timings.append(time.perf_counter() - start)
+        return url, response, len(queries), statistics.median(timings)
+
+    def test_every_url_is_benchmarked(self):
+        benchmarked = {case.name for case in self.get_cases()}
+
+        for urlconf in BENCHMARKED_URLCONFS:
+            module = import_module(urlconf)
+            for pattern in module.urlpatterns:
+                if isinstance(pattern, URLPattern):
+                    self.assertIn(f'{module.app_name}:{pattern.name}', benchmarked)
+
+    def test_view_budgets(self):
+        for case in self.get_cases():
+            with self.subTest(view=case.label):
+                if case.login:
+                    self.client.force_login(self.user)
+                else:
+                    self.client.logout()
+
+                url, response, query_count, seconds = self.measure(case)
+
+                self.results.append({
+                    'name': case.label,
+                    'url': url,
+                    'method': case.method.upper(),
+                    'status': response.status_code,
+                    'queries': query_count,
+                    'query_budget': case.budget,
+                    'seconds': round(seconds, 5),
+                })
+
+                self.assertLess(response.status_code, 400)
+                self.assertLessEqual(query_count, case.budget)
+                self.assertLessEqual(seconds, MAX_SECONDS)
+
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    VIEW_TRACKING_BUFFER='memory',
+    VIEW_TRACKING_FLUSH_INTERVAL=0,
+    BACKGROUND_TASKS_EAGER=True,
+)
+class CoreTestCase(TestCase):
+    # A seller with a few listings and a buyer who has asked about one of them
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller, cls.buyer = create_users(2, prefix='core-tests')
+        cls.category = Category.objects.create(name='Furniture', slug='furniture')
+        for name in ['Wooden chair', 'Wooden table', 'Red sofa']:
+            Item.objects.create(category=cls.category, created_by=cls.seller, name=name, price=100)
+        cls.item = Item.objects.first()
+        cls.conversation, _ = start_conversation(cls.item, cls.buyer, 'Is this still available?')
+
+    def setUp(self):
+        cache.clear()
+
+    def create_staff(self, prefix='staff', superuser=False):
+        user = create_users(1, prefix=prefix)[0]
+        user.is_staff = True
+        user.is_superuser = superuser
+        user.save()
+        return user
+
+    def add_replica(self, alias, name):
+        connections.settings[alias] = {**connection.settings_dict, 'NAME': name}
+
+        def remove():
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        self.addCleanup(remove)
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_deploy_check_warns_about_a_process_local_cache(self):
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['core.W001'])
+        with self.settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache'}}):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class KeysetPaginatorTests(CoreTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Several items on each price, so pages break inside runs of equal keys
+        Item.objects.bulk_create([
+            Item(category=cls.category, created_by=cls.seller, name=f'Lot {number}', price=price)
+            for number, price in enumerate([300, 100, 200, 100, 300, 100, 200])
+        ])
+        cls.lots = Item.objects.filter(name__startswith='Lot')
+
+    def walk(self, paginator, page, direction):
+        # The ids of every page from ``page`` on, and the page the walk ended on
+        pages = [[item.pk for item in page]]
+        while getattr(page, f'has_{direction}')():
+            page = paginator.get_page(getattr(page, f'{direction}_cursor'))
+            pages.append([item.pk for item in page])
+        return pages, page
+
+    def test_cursors_walk_every_row_once_in_both_directions(self):
+        for ordering in [('price', 'id'), ('-price', '-id'), ('-created_at', '-id')]:
+            with self.subTest(ordering=ordering):
+                paginator = KeysetPaginator(self.lots, 2, ordering)
+                expected = list(self.lots.order_by(*ordering).values_list('pk', flat=True))
+
+                forward, last = self.walk(paginator, paginator.get_page(), 'next')
+                self.assertEqual([pk for page in forward for pk in page], expected)
+                self.assertEqual([len(page) for page in forward], [2, 2, 2, 1])
+
+                backward, first = self.walk(paginator, last, 'previous')
+                self.assertEqual(backward, forward[::-1])
+                self.assertFalse(first.has_previous())
+
+    def test_bad_cursors_restart_from_the_first_page(self):
+        paginator = KeysetPaginator(self.lots, 2, ('price', 'id'))
+        first = [item.pk for item in paginator.get_page()]
+        for cursor in [
+            'not base64!', encode_cursor(['100']), encode_cursor({'price': 100}),
+            encode_cursor(['cheap', 1]), encode_cursor([100, 'x']), encode_cursor([[100], {}]),
+        ]:
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertEqual([item.pk for item in page], first)
+                self.assertFalse(page.has_previous())
+
+
+class FragmentCacheTests(CoreTestCase):
+    def test_homepage_fragments_are_cached_and_invalidated(self):
+        self.client.get(reverse('core:index'))
+
+        with self.assertNumQueries(0):
+            self.client.get(reverse('core:index'))
+
+        item = Item.objects.public().first()
+        item.name = 'Freshly renamed item'
+        item.save()
+
+        self.assertContains(self.client.get(reverse('core:index')), 'Freshly renamed item')
+
+    def test_item_cards_follow_view_counts(self):
+        search = {'query': self.item.name}
+        self.assertContains(self.client.get(reverse('item:items'), search), '<span>0</span>')
+
+        # View counts are rolled up with update(), which leaves updated_at alone
+        save_views([(self.item.pk, self.buyer.pk, '10.0.0.1')])
+        self.assertContains(self.client.get(reverse('item:items'), search), '<span>1</span>')
+
+
+class AsyncViewTests(CoreTestCase):
+    def test_hot_views_serve_under_asgi(self):
+        client = AsyncClient()
+        client.force_login(self.buyer)
+        urls = [
+            reverse('core:index'),
+            reverse('item:items') + '?query=chair&sort_by=relevance',
+            reverse('item:detail', kwargs={'pk': self.item.pk}),
+            reverse('conversation:inbox'),
+        ]
+
+        async def fetch_all():
+            responses = [await client.get(url) for url in urls]
+            return responses, await AsyncClient().get(reverse('conversation:inbox'))
+
+        responses, anonymous_inbox = async_to_sync(fetch_all)()
+        for url, response in zip(urls, responses):
+            self.assertEqual(response.status_code, 200, url)
+        self.assertEqual(anonymous_inbox.status_code, 302)
+
+
+class ReplicaTests(CoreTestCase):
+    def test_reads_go_to_replicas_until_the_client_writes(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        # The replica is a copy of the primary taken before the new listing
+        replica = sqlite3.connect(os.path.join(directory, 'replica.sqlite3'))
+        connection.ensure_connection()
+        # The test data is uncommitted, so the primary can't be backed up or vacuumed into a
+        # file. The full text index (a virtual table) doesn't survive a dump and isn't needed
+        replica.executescript('\n'.join(
+            statement for statement in connection.connection.iterdump() if 'item_search' not in statement
+        ))
+        replica.close()
+        self.add_replica('replica', os.path.join(directory, 'replica.sqlite3'))
+        self.add_replica('broken', os.path.join(directory, 'missing', 'replica.sqlite3'))
+
+        listing = Item.objects.create(category=self.category, name='Replicated chair', price=10, created_by=self.seller)
+        detail_url = reverse('item:detail', kwargs={'pk': listing.pk})
+
+        with override_settings(DATABASE_REPLICAS=['replica']):
+            self.assertEqual(self.client.get(detail_url).status_code, 404)
+            # Outside a request everything reads from the primary
+            self.assertTrue(Item.objects.filter(pk=listing.pk).exists())
+
+            self.client.force_login(self.buyer)
+            response = self.client.post(reverse('accounts:toggle_favorite', kwargs={'item_id': listing.pk}))
+            self.assertLess(response.status_code, 400)
+            self.assertIn('primary_pin', response.cookies)
+            self.assertEqual(self.client.get(detail_url).status_code, 200)
+
+            self.client.cookies.pop('primary_pin')
+            self.assertEqual(self.client.get(detail_url).status_code, 404)
+            mark_unavailable('replica')
+            self.assertEqual(self.client.get(detail_url).status_code, 200)
+
+        with override_settings(DATABASE_REPLICAS=['broken']):
+            self.assertEqual(self.client.get(detail_url).status_code, 200)
+
+
+class DatabaseHealthTests(CoreTestCase):
+    def test_health_reports_each_database(self):
+        url = reverse('core:database_health')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'ok': True, 'databases': {'default': {'ok': True}}})
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.add_replica('broken', os.path.join(directory, 'missing', 'replica.sqlite3'))
+        with self.assertLogs('core.views', 'ERROR'):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['databases'], {'default': {'ok': True}, 'broken': {'ok': False}})
+
+    def test_pool_stats_summarize_each_pool(self):
+        class FakePool:
+            def get_stats(self):
+                return {
+                    'pool_size': 6, 'pool_available': 2, 'pool_max': 10, 'requests_waiting': 3,
+                    'connections_num': 8, 'connections_errors': 1, 'requests_errors': 2, 'requests_wait_ms': 40,
+                }
+
+        expected = {
+            'checked_out': 4, 'available': 2, 'size': 6, 'max_size': 10, 'waiting': 3,
+            'created': 8, 'errors': 3, 'lost': 0, 'wait_ms': 40,
+        }
+        with mock.patch.dict(postgresql_pool._pools, {'default': FakePool()}):
+            self.assertEqual(postgresql_pool.pool_stats(), {'default': expected})
+            # The health check adds them for databases on the pooled backend
+            with mock.patch.dict(connection.settings_dict, {'ENGINE': 'core.db.postgresql_pool'}):
+                response = self.client.get(reverse('core:database_health'))
+            self.assertEqual(response.json()['databases']['default'], {'ok': True, 'pool': expected})
+        self.assertEqual(postgresql_pool.pool_stats(), {})
+
+
+class MetricsTests(CoreTestCase):
+    def test_requests_are_timed_for_staff_and_metrics(self):
+        url = reverse('item:items')
+        response = self.client.get(url)
+        self.assertNotIn('Server-Timing', response)
+
+        self.client.force_login(self.create_staff())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        timing = dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+        self.assertEqual(set(timing), {'sql', 'cache', 'template', 'images', 'total'})
+        # The staff check itself runs after the figures are taken
+        self.assertIn(f'desc="{len(queries)} queries"', timing['sql'])
+
+        metrics = self.client.get(reverse('core:metrics')).content.decode()
+        self.assertIn('# TYPE puddle_request_duration_seconds histogram', metrics)
+        self.assertRegex(metrics, r'puddle_request_sql_queries_count\{view="item:items"\} [2-9]')
+        self.assertIn('puddle_request_template_seconds_bucket{view="item:items",le="+Inf"}', metrics)
+        self.assertIn('puddle_fragment_cache_requests_total{view="item:items",result="hit"}', metrics)
+
+    def test_metrics_are_only_served_to_staff_and_scrapers(self):
+        url = reverse('core:metrics')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        # An empty token is no token
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        with self.settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.client.logout()
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_AUTHORIZATION='Bearer secret')
+            self.assertEqual(response.status_code, 200)
+
+        self.client.force_login(self.create_staff())
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class SlowQueryTests(CoreTestCase):
+    def test_slow_queries_are_captured_with_plans(self):
+        self.assertEqual(
+            normalize_sql("SELECT * FROM t WHERE a = 'x' AND b IN (1, 2, %s) LIMIT 10"),
+            'SELECT * FROM t WHERE a = ? AND b IN (...) LIMIT ?',
+        )
+        self.assertEqual(
+            redact_plan("Index Scan on t  (cost=0.29..8.31 rows=1 width=4)\n  Filter: ((a = 'x@example.com'::text) AND (b > 42))"),
+            'Index Scan on t  (cost=0.29..8.31 rows=1 width=4)\n  Filter: ((a = ?::text) AND (b > ?))',
+        )
+
+        url = reverse('item:items')
+        with self.settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_MAX_ROWS=50):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(url, {'location': 'Atlantis', 'sort_by': 'most_favorited'})
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(url, {'location': 'Lemuria', 'sort_by': 'most_favorited'})
+
+        # The two requests differ only in their values, so each of their queries matches one from the other
+        listing = SlowQuery.objects.filter(view='item:items', sql__contains='LIKE')
+        counts = listing.order_by().values('fingerprint').annotate(count=Count('id')).values_list('count', flat=True)
+        self.assertTrue(counts)
+        self.assertEqual(set(counts), {2})
+        first = listing.first()
+        self.assertNotIn('Atlantis', first.sql)
+        self.assertNotIn('Atlantis', first.plan)
+        self.assertTrue(first.plan)
+        self.assertTrue(first.origin.startswith(('item/', 'core/')))
+        self.assertLessEqual(SlowQuery.objects.count(), 50)
+
+        self.client.force_login(self.create_staff('admin', superuser=True))
+        # The admin's CSS isn't collected for tests
+        with self.settings(STATICFILES_STORAGE='django.contrib.staticfiles.storage.StaticFilesStorage'):
+            response = self.client.get(reverse('admin:core_slowquery_fingerprints'))
+            self.assertContains(response, first.fingerprint)
+            response = self.client.get(reverse('admin:core_slowquery_changelist'), {'fingerprint': first.fingerprint})
+            self.assertEqual(response.status_code, 200)
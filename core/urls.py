@@ -16,5 +16,7 @@ urlpatterns = [
     path('buyer-central/', views.buyer_central, name='buyer_central'),
     path('faq/', views.faq, name='faq'),
     path('signup/', views.signup, name='signup'),
+    path('health/db/', views.database_health, name='database_health'),
+    path('metrics/', views.metrics, name='metrics'),
     path('login/', auth_views.LoginView.as_view(template_name='core/login.html', authentication_form=LoginForm), name='login'),
 ]
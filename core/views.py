@@ -1,14 +1,27 @@
+import hmac
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse
 from django.shortcuts import render, redirect
 
-from item.models import Category, Item
+from item.categories import get_category_tree
+from item.models import Item
 
+from .async_views import arender
 from .forms import SignupForm
+from .metrics import collect, process_id, render_prometheus
+
+logger = logging.getLogger(__name__)
 
-def index(request):
-    items = Item.objects.filter(status='active', admin_approved=True)[0:6]
-    categories = Category.objects.all()
+async def index(request):
+    # Left lazy: the item grid is a cached fragment and only queries when it misses
+    items = Item.objects.public()[0:6]
+    categories = (await sync_to_async(get_category_tree)()).active()
 
-    return render(request, 'core/index.html', {
+    return await arender(request, 'core/index.html', {
         'categories': categories,
         'items': items,
     })
@@ -47,4 +60,55 @@ def signup(request):
 
     return render(request, 'core/signup.html', {
         'form': form
-    })
\ No newline at end of file
+    })
+
+def database_health(request):
+    """
+    Whether each configured database answers, with connection pool figures
+    (checked out, waiting, created) for those using core.db.postgresql_pool.
+    """
+    databases = {}
+    for alias in connections:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT 1')
+            databases[alias] = {'ok': True}
+        except DatabaseError:
+            logger.exception('Database %s is unavailable', alias)
+            databases[alias] = {'ok': False}
+
+        if connections[alias].settings_dict['ENGINE'] == 'core.db.postgresql_pool':
+            from .db.postgresql_pool.base import pool_stats
+            databases[alias]['pool'] = pool_stats().get(alias)
+
+    ok = all(database['ok'] for database in databases.values())
+    return JsonResponse({'ok': ok, 'databases': databases}, status=200 if ok else 503)
+
+def metrics(request):
+    """
+    Request histograms of every process in the Prometheus text format, plus
+    this process's connection pool figures. Served to scrapers presenting
+    ``METRICS_TOKEN`` and to staff.
+    """
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    # The token is checked first so a scraper's requests don't load a session
+    scraper = bool(settings.METRICS_TOKEN) and hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode())
+    if not scraper and not request.user.is_staff:
+        return HttpResponseForbidden()
+
+    gauges = []
+    pooled = [alias for alias in connections if connections[alias].settings_dict['ENGINE'] == 'core.db.postgresql_pool']
+    if pooled:
+        from .db.postgresql_pool.base import pool_stats
+
+        values = {}
+        for alias, stats in pool_stats().items():
+            for state in ('checked_out', 'available', 'waiting'):
+                values[(('alias', alias), ('process', process_id()), ('state', state))] = stats[state]
+        gauges.append(('puddle_db_pool_connections', 'Pooled database connections by state', values))
+
+    histograms, counters = collect()
+    return HttpResponse(
+        render_prometheus(histograms, counters, gauges),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
@@ -1,12 +1,14 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, get_object_or_404
 
+from core.pagination import estimate_count, paginate
 from item.models import Item
 
 @login_required
 def index(request):
-    items = Item.objects.filter(created_by=request.user)
+    items = Item.objects.filter(created_by=request.user).prefetch_related('images')
 
     return render(request, 'dashboard/index.html', {
-        'items': items,
+        'items': paginate(request, items, ('-created_at', '-id')),
+        'total_items': estimate_count(items),
     })
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Category, Item, ItemView, ItemFavorite
-from accounts.models import AdminAction
+from .images import primary_image
+from .models import Category, Item, ItemImage, ItemView, ItemFavorite
+from accounts.moderation import moderate_selection
 
 
 @admin.register(Category)
@@ -13,8 +14,8 @@ class CategoryAdmin(admin.ModelAdmin):
     list_editable = ('is_active',)
 
     def items_count(self, obj):
-        return obj.items.count()
-    items_count.short_description = 'Items Count'
+        return obj.total_active_items_count
+    items_count.short_description = 'Active Items'
 
 
 @admin.register(Item)
@@ -62,7 +63,16 @@ class ItemAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('images')
+
     def get_image(self, obj):
+        image = primary_image(obj)
+        if image:
+            return format_html(
+                '<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />',
+                image.variant_url('thumb')
+            )
         if obj.image:
             return format_html(
                 '<img src="{}" width="50" height="50" style="object-fit: cover; border-radius: 8px;" />',
@@ -71,59 +81,39 @@ class ItemAdmin(admin.ModelAdmin):
         return 'No Image'
     get_image.short_description = 'Image'
 
+    def moderate(self, request, queryset, action_type, verb):
+        changed, job = moderate_selection(request.user, action_type, queryset)
+        if job:
+            self.message_user(request, f"{job.total} items are being {verb} in the background (moderation job #{job.pk}).")
+        else:
+            self.message_user(request, f"{changed} items have been {verb}.")
+
     def approve_items(self, request, queryset):
-        queryset.update(admin_approved=True, status='active')
-        for item in queryset:
-            AdminAction.objects.create(
-                admin=request.user,
-                target_item=item,
-                target_user=item.created_by,
-                action_type='approve_listing',
-                reason=f"Bulk approval by {request.user.username}"
-            )
-        self.message_user(request, f"{queryset.count()} items have been approved.")
+        self.moderate(request, queryset, 'approve_listing', 'approved')
     approve_items.short_description = "Approve selected items"
 
     def remove_items(self, request, queryset):
-        queryset.update(admin_approved=False, status='removed')
-        for item in queryset:
-            AdminAction.objects.create(
-                admin=request.user,
-                target_item=item,
-                target_user=item.created_by,
-                action_type='remove_listing',
-                reason=f"Bulk removal by {request.user.username}"
-            )
-        self.message_user(request, f"{queryset.count()} items have been removed.")
+        self.moderate(request, queryset, 'remove_listing', 'removed')
     remove_items.short_description = "Remove selected items"
 
     def feature_items(self, request, queryset):
-        queryset.update(is_featured=True)
-        for item in queryset:
-            AdminAction.objects.create(
-                admin=request.user,
-                target_item=item,
-                target_user=item.created_by,
-                action_type='feature_listing',
-                reason=f"Bulk featuring by {request.user.username}"
-            )
-        self.message_user(request, f"{queryset.count()} items have been featured.")
+        self.moderate(request, queryset, 'feature_listing', 'featured')
     feature_items.short_description = "Feature selected items"
 
     def unfeature_items(self, request, queryset):
-        queryset.update(is_featured=False)
-        for item in queryset:
-            AdminAction.objects.create(
-                admin=request.user,
-                target_item=item,
-                target_user=item.created_by,
-                action_type='unfeature_listing',
-                reason=f"Bulk unfeaturing by {request.user.username}"
-            )
-        self.message_user(request, f"{queryset.count()} items have been unfeatured.")
+        self.moderate(request, queryset, 'unfeature_listing', 'unfeatured')
     unfeature_items.short_description = "Unfeature selected items"
 
 
+@admin.register(ItemImage)
+class ItemImageAdmin(admin.ModelAdmin):
+    list_display = ('item', 'position', 'status', 'width', 'height', 'created_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('item__name',)
+    readonly_fields = ('width', 'height', 'variants', 'status', 'error', 'created_at')
+    list_select_related = ('item',)
+
+
 @admin.register(ItemView)
 class ItemViewAdmin(admin.ModelAdmin):
     list_display = ('item', 'user', 'ip_address', 'timestamp')
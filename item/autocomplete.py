@@ -0,0 +1,270 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from core.cache import append_change, bump_version, fragment_key, get_changes, get_or_compute, get_sequence, get_versions
+
+from .categories import counted_category_id, get_category_tree
+
+# A new snapshot is built when either moves on; item changes go through the change log instead
+SNAPSHOT_NAMESPACES = ['autocomplete', 'category']
+CHANGE_LOG = 'autocomplete'
+
+MAX_SUGGESTIONS = 8
+# Keys are the entry's text from each word on, cut to this length
+MAX_KEY_LENGTH = 48
+# Prefixes matching more keys than this keep their top MEMO_SIZE entries between lookups,
+# updated in place as entries change
+MEMO_MIN_RANGE = 256
+MEMO_SIZE = MAX_SUGGESTIONS * 2
+# An index further behind the change log than this reloads the snapshot instead
+MAX_REPLAY = 1000
+
+WORD_RE = re.compile(r'\w+')
+
+Suggestion = namedtuple('Suggestion', 'text kind weight target')
+
+
+def normalize(text):
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+class PrefixIndex:
+    """
+    Suggestions by prefix: a sorted array of ``(key, entry_id)`` where each
+    entry has a key for every word it contains, so "chair" finds "Wooden
+    chair". A lookup bisects the range of keys starting with the prefix and
+    takes the heaviest entries in it; wide ranges (short prefixes) keep
+    their result, which adding and removing entries updates.
+    """
+
+    def __init__(self):
+        self.keys = []
+        self.entries = {}
+        self.entry_keys = {}
+        self.top = {}
+
+    @staticmethod
+    def keys_for(text):
+        words = normalize(text).split()
+        return sorted({' '.join(words[start:])[:MAX_KEY_LENGTH] for start in range(len(words))})
+
+    def load(self, entries):
+        # Builds the index from ``{entry_id: Suggestion}`` in one sort
+        self.entries = dict(entries)
+        self.entry_keys = {entry_id: self.keys_for(entry.text) for entry_id, entry in self.entries.items()}
+        self.keys = sorted((key, entry_id) for entry_id, keys in self.entry_keys.items() for key in keys)
+        self.top = {}
+
+    def rank(self, entry_id):
+        entry = self.entries[entry_id]
+        return entry.weight, entry.text
+
+    def _memoized(self, keys):
+        # The remembered prefixes of ``keys``
+        prefixes = {key[:end] for key in keys for end in range(1, len(key) + 1)}
+        return [prefix for prefix in prefixes if prefix in self.top]
+
+    def remove(self, entry_id):
+        keys = self.entry_keys.pop(entry_id, [])
+        for key in keys:
+            position = bisect_left(self.keys, (key, entry_id))
+            if position < len(self.keys) and self.keys[position] == (key, entry_id):
+                del self.keys[position]
+        for prefix in self._memoized(keys):
+            top = self.top[prefix]
+            if entry_id in top:
+                top.remove(entry_id)
+                # The spare entries are used up, so the next lookup rescans the range
+                if len(top) < MAX_SUGGESTIONS:
+                    del self.top[prefix]
+        self.entries.pop(entry_id, None)
+
+    def add(self, entry_id, suggestion):
+        self.remove(entry_id)
+        keys = self.keys_for(suggestion.text)
+        if not keys:
+            return
+        self.entries[entry_id] = suggestion
+        self.entry_keys[entry_id] = keys
+        for key in keys:
+            insort(self.keys, (key, entry_id))
+        rank = self.rank(entry_id)
+        for prefix in self._memoized(keys):
+            top = self.top[prefix]
+            position = next((index for index, other in enumerate(top) if self.rank(other) < rank), len(top))
+            top.insert(position, entry_id)
+            del top[MEMO_SIZE:]
+
+    def search(self, prefix, limit=MAX_SUGGESTIONS):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        top = self.top.get(prefix)
+        if top is None:
+            start = bisect_left(self.keys, (prefix,))
+            end = bisect_left(self.keys, (prefix + '\uffff',), start)
+            entry_ids = {entry_id for key, entry_id in self.keys[start:end]}
+            top = heapq.nlargest(max(limit, MEMO_SIZE), entry_ids, key=self.rank)
+            if end - start > MEMO_MIN_RANGE:
+                self.top[prefix] = top
+        return [self.entries[entry_id] for entry_id in top[:limit]]
+
+
+def item_suggestion(pk, name, views):
+    return Suggestion(name, 'item', views + 1, pk)
+
+
+def build_snapshot():
+    """
+    Everything the index is built from, in plain tuples so it pickles small:
+    listed items with their views, and active categories and locations
+    weighted by the views of the items listed under them. ``sequence`` is
+    the change log's position before the items were read; later changes
+    are replayed on top.
+    """
+    from .models import Item
+
+    sequence = get_sequence(CHANGE_LOG)
+    items = list(Item.objects.active().order_by().values_list('pk', 'name', 'views'))
+
+    tree = get_category_tree()
+    category_views = {}
+    for category_id, views in Item.objects.active().order_by().values_list('category_id').annotate(views=Sum('views')):
+        for ancestor_id in tree.ancestor_ids(category_id):
+            category_views[ancestor_id] = category_views.get(ancestor_id, 0) + views
+    categories = [
+        (category.pk, category.name, category_views.get(category.pk, 0))
+        for category in tree.active()
+    ]
+
+    # Spellings of one place are merged under the most viewed one
+    locations = {}
+    rows = Item.objects.active().exclude(location='').order_by().values_list('location').annotate(views=Sum('views'))
+    for location, views in rows:
+        key = normalize(location)
+        if not key:
+            continue
+        name, total, best = locations.get(key, (location.strip(), 0, -1))
+        if views > best:
+            name, best = location.strip(), views
+        locations[key] = (name, total + views, best)
+
+    return {
+        'sequence': sequence,
+        'items': items,
+        'categories': categories,
+        'locations': [(name, views) for name, views, best in locations.values()],
+    }
+
+
+class AutocompleteIndex:
+    def __init__(self, snapshot):
+        self.sequence = snapshot['sequence']
+        self.prefixes = PrefixIndex()
+        entries = {f'item:{pk}': item_suggestion(pk, name, views) for pk, name, views in snapshot['items']}
+        # Categories and places outrank single listings with the same views
+        for pk, name, views in snapshot['categories']:
+            entries[f'category:{pk}'] = Suggestion(name, 'category', views + 2, pk)
+        for name, views in snapshot['locations']:
+            entries[f'location:{normalize(name)}'] = Suggestion(name, 'location', views + 2, name)
+        self.prefixes.load(entries)
+
+    def apply(self, change):
+        pk, name, views, listed = change
+        if listed:
+            self.prefixes.add(f'item:{pk}', item_suggestion(pk, name, views))
+        else:
+            self.prefixes.remove(f'item:{pk}')
+
+    def catch_up(self):
+        """
+        Apply the item changes logged since this index was built. Returns
+        False when one is missing, so the index should be rebuilt instead.
+        """
+        sequence, changes = get_changes(CHANGE_LOG, self.sequence, MAX_REPLAY)
+        if changes is None:
+            return False
+        self.sequence = sequence
+        complete = True
+        for change in changes:
+            if change is None:
+                complete = False
+            else:
+                self.apply(change)
+        return complete
+
+    def search(self, prefix, limit=MAX_SUGGESTIONS):
+        return self.prefixes.search(prefix, limit)
+
+
+def load_snapshot():
+    key = fragment_key('autocomplete', SNAPSHOT_NAMESPACES)
+    return get_or_compute(key, build_snapshot, settings.AUTOCOMPLETE_SNAPSHOT_TIMEOUT)
+
+
+_index = None
+_index_versions = None
+_index_loaded_at = 0
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """
+    The autocomplete index for this process. It is loaded from the shared
+    snapshot when the snapshot's versions move on or it is older than
+    ``PROCESS_CACHE_MAX_AGE``, and otherwise kept current from the change
+    log, so a lookup costs two cache reads and no queries.
+    """
+    global _index, _index_versions, _index_loaded_at
+
+    versions = get_versions(SNAPSHOT_NAMESPACES)
+    with _index_lock:
+        expired = time.monotonic() - _index_loaded_at > settings.PROCESS_CACHE_MAX_AGE
+        if _index is None or _index_versions != versions or expired:
+            _index = AutocompleteIndex(load_snapshot())
+            _index_versions = versions
+            _index_loaded_at = time.monotonic()
+        if not _index.catch_up():
+            # A change expired or is still being written; start over from the newest snapshot
+            _index = AutocompleteIndex(load_snapshot())
+            if not _index.catch_up():
+                # Still too far behind: serve the snapshot as it is until the next one is built
+                _index.sequence = get_sequence(CHANGE_LOG)
+        return _index
+
+
+def suggest(prefix, limit=MAX_SUGGESTIONS):
+    """Suggestions for ``prefix`` as dicts with ``text``, ``kind`` and ``url``."""
+    items_url = reverse('item:items')
+    suggestions = []
+    for suggestion in get_index().search(prefix, limit):
+        if suggestion.kind == 'item':
+            url = reverse('item:detail', kwargs={'pk': suggestion.target})
+        elif suggestion.kind == 'category':
+            url = f"{items_url}?{urlencode({'category': suggestion.target})}"
+        else:
+            url = f"{items_url}?{urlencode({'location': suggestion.target, 'sort_by': 'distance'})}"
+        suggestions.append({'text': suggestion.text, 'kind': suggestion.kind, 'url': url})
+    return suggestions
+
+
+def record_item_change(item, deleted=False):
+    # Logged once the save commits, so the change is never ahead of the database
+    change = (item.pk, item.name, item.views, not deleted and counted_category_id(item) is not None)
+    transaction.on_commit(lambda: append_change(CHANGE_LOG, change, settings.AUTOCOMPLETE_SNAPSHOT_TIMEOUT * 2))
+
+
+def refresh_autocomplete():
+    # Have every process load a snapshot built from the database now
+    bump_version('autocomplete')
+    return len(load_snapshot()['items'])
@@ -0,0 +1,183 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from core.cache import bump_version, get_versions
+
+# 'category' changes with the categories themselves, 'category-counts' with their item counts
+TREE_NAMESPACES = ['category', 'category-counts']
+
+
+class CategoryTree:
+    """
+    Every category linked to its parent and subcategories, built from one
+    query. Each category gets ``children`` and ``depth`` attributes and the
+    tree iterates depth first, alphabetically within each level.
+    """
+
+    def __init__(self, categories):
+        self.by_id = {category.pk: category for category in categories}
+        self.roots = []
+        for category in categories:
+            category.children = []
+        for category in categories:
+            parent = self.by_id.get(category.parent_id)
+            if parent is None:
+                self.roots.append(category)
+            else:
+                parent.children.append(category)
+
+        self.ordered = []
+        self._walk(self.roots, 0)
+        # Categories in a parent cycle are unreachable from the roots; list them at the top level
+        seen = {category.pk for category in self.ordered}
+        for category in categories:
+            if category.pk not in seen:
+                category.depth = 0
+                self.ordered.append(category)
+
+    def _walk(self, categories, depth):
+        for category in categories:
+            category.depth = depth
+            self.ordered.append(category)
+            self._walk(category.children, depth + 1)
+
+    def __iter__(self):
+        return iter(self.ordered)
+
+    def __len__(self):
+        return len(self.ordered)
+
+    def get(self, category_id):
+        return self.by_id.get(category_id)
+
+    def active(self):
+        return [category for category in self.ordered if category.is_active]
+
+    def ancestor_ids(self, category_id):
+        # The category itself first, then up to its root
+        ids = []
+        while category_id in self.by_id and category_id not in ids:
+            ids.append(category_id)
+            category_id = self.by_id[category_id].parent_id
+        return ids
+
+    def descendant_ids(self, category_id):
+        ids = []
+        pending = [self.by_id[category_id]] if category_id in self.by_id else []
+        while pending:
+            category = pending.pop()
+            if category.pk not in ids:
+                ids.append(category.pk)
+                pending.extend(category.children)
+        return ids
+
+
+_tree = None
+_tree_versions = None
+_tree_built_at = 0
+_tree_lock = threading.Lock()
+
+
+def get_category_tree():
+    """
+    The category tree for this process. It is rebuilt when the cache
+    versions it was built from have moved on, or once it is older than
+    ``PROCESS_CACHE_MAX_AGE`` in case this process missed a bump, so a
+    request that renders it usually costs one cache lookup and no queries.
+    """
+    from .models import Category
+
+    global _tree, _tree_versions, _tree_built_at
+
+    versions = get_versions(TREE_NAMESPACES)
+    with _tree_lock:
+        expired = time.monotonic() - _tree_built_at > settings.PROCESS_CACHE_MAX_AGE
+        if _tree is None or _tree_versions != versions or expired:
+            _tree = CategoryTree(list(Category.objects.order_by('name')))
+            _tree_versions = versions
+            _tree_built_at = time.monotonic()
+        return _tree
+
+
+def counted_category_id(item):
+    # The category an item adds to the counts of, or None while it isn't listed
+    if item.status == 'active' and item.admin_approved:
+        return item.category_id
+    return None
+
+
+def adjust_category_counts(old_category_id, new_category_id):
+    """
+    Move one active item from ``old_category_id`` to ``new_category_id``
+    (either may be None), updating the category and every ancestor in a
+    single UPDATE.
+    """
+    from .models import Category
+
+    if old_category_id == new_category_id:
+        return
+
+    tree = get_category_tree()
+    direct = {}
+    totals = {}
+    for category_id, delta in ((old_category_id, -1), (new_category_id, 1)):
+        if category_id is None:
+            continue
+        direct[category_id] = direct.get(category_id, 0) + delta
+        for ancestor_id in tree.ancestor_ids(category_id):
+            totals[ancestor_id] = totals.get(ancestor_id, 0) + delta
+
+    # Moves within a subtree cancel out on the shared ancestors
+    totals = {category_id: delta for category_id, delta in totals.items() if delta}
+
+    def shift(field, deltas):
+        return Greatest(
+            F(field) + Case(
+                *[When(pk=category_id, then=Value(delta)) for category_id, delta in deltas.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ),
+            Value(0),
+        )
+
+    Category.objects.filter(pk__in=set(direct) | set(totals)).update(
+        active_items_count=shift('active_items_count', direct),
+        total_active_items_count=shift('total_active_items_count', totals),
+    )
+    bump_version('category-counts')
+
+
+def refresh_category_counts():
+    """
+    Recount every category from scratch, for changes made with
+    ``QuerySet.update()`` or ``bulk_create()`` that skip the item signals.
+    Returns the number of categories whose counts changed.
+    """
+    from .models import Category, Item
+
+    direct = dict(
+        Item.objects.active().order_by().values_list('category_id').annotate(count=Count('id'))
+    )
+    tree = CategoryTree(list(Category.objects.all()))
+
+    totals = {}
+    for category_id, count in direct.items():
+        for ancestor_id in tree.ancestor_ids(category_id):
+            totals[ancestor_id] = totals.get(ancestor_id, 0) + count
+
+    changed = []
+    for category in tree:
+        active_items_count = direct.get(category.pk, 0)
+        total_active_items_count = totals.get(category.pk, 0)
+        if (category.active_items_count, category.total_active_items_count) != (active_items_count, total_active_items_count):
+            category.active_items_count = active_items_count
+            category.total_active_items_count = total_active_items_count
+            changed.append(category)
+
+    Category.objects.bulk_update(changed, ['active_items_count', 'total_active_items_count'])
+    bump_version('category-counts')
+    return len(changed)
@@ -0,0 +1,100 @@
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from core.cache import bump_version
+
+COUNTER_FIELDS = ('views', 'favorites')
+
+
+def increment(item_id, field, amount=1):
+    """
+    Add ``amount`` to one of the item's counter shards. Writers pick a random
+    shard, so hot items don't serialize every request on a single row.
+    """
+    from .models import ItemCounterShard
+
+    shard = random.randrange(settings.ITEM_COUNTER_SHARDS)
+    shards = ItemCounterShard.objects.filter(item_id=item_id, field=field, shard=shard)
+
+    if shards.update(delta=F('delta') + amount):
+        return
+
+    try:
+        with transaction.atomic():
+            ItemCounterShard.objects.create(item_id=item_id, field=field, shard=shard, delta=amount)
+    except IntegrityError:
+        # Another request created the shard first
+        shards.update(delta=F('delta') + amount)
+
+
+def pending_counts(item_ids):
+    from .models import ItemCounterShard
+
+    counts = {}
+    rows = (
+        ItemCounterShard.objects.filter(item_id__in=item_ids)
+        .values('item_id', 'field')
+        .annotate(total=Sum('delta'))
+    )
+    for row in rows:
+        counts.setdefault(row['item_id'], {})[row['field']] = row['total']
+    return counts
+
+
+def apply_pending(items):
+    """
+    Add increments that haven't been rolled up yet to ``views``/``favorites``
+    on the given item instances, for responses that need exact counts.
+    """
+    counts = pending_counts([item.pk for item in items])
+    for item in items:
+        for field, total in counts.get(item.pk, {}).items():
+            setattr(item, field, max(0, getattr(item, field) + total))
+    return items
+
+
+def rollup_counters():
+    """
+    Fold every pending shard into ``Item.views``/``Item.favorites`` with one
+    UPDATE and clear the shards. Returns the number of items updated.
+    """
+    from .models import Item, ItemCounterShard
+
+    with transaction.atomic():
+        # Locking the shards makes concurrent increments wait and then start a new shard
+        shards = list(
+            ItemCounterShard.objects.select_for_update().values_list('pk', 'item_id', 'field', 'delta')
+        )
+        if not shards:
+            return 0
+
+        totals = {field: {} for field in COUNTER_FIELDS}
+        for pk, item_id, field, delta in shards:
+            totals[field][item_id] = totals[field].get(item_id, 0) + delta
+
+        item_ids = set()
+        updates = {}
+        for field, deltas in totals.items():
+            deltas = {item_id: delta for item_id, delta in deltas.items() if delta}
+            if not deltas:
+                continue
+            item_ids.update(deltas)
+            updates[field] = Greatest(
+                F(field) + Case(
+                    *[When(pk=item_id, then=Value(delta)) for item_id, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                ),
+                Value(0),
+            )
+
+        if updates:
+            Item.objects.filter(pk__in=item_ids).update(**updates)
+            bump_version('item-counts')
+        ItemCounterShard.objects.filter(pk__in=[shard[0] for shard in shards]).delete()
+
+    return len(item_ids)
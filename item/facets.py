@@ -0,0 +1,221 @@
+from decimal import Decimal
+
+from django.db.models import Case, Count, IntegerField, Value, When
+
+from core.cache import fragment_key, get_or_compute
+
+from .categories import get_category_tree
+from .geo import get_center
+from .search import get_search_terms
+
+# Upper bounds (exclusive, KSh) of the price facet's buckets; the last bucket is open ended
+PRICE_BUCKETS = [1000, 5000, 20000, 100000]
+
+FLAG_FACETS = [
+    ('delivery_available', 'Delivery available'),
+    ('pickup_available', 'Pickup available'),
+    ('is_negotiable', 'Negotiable'),
+]
+
+# The cached counts change with the items and with the category tree
+FACET_NAMESPACES = ['item', 'category']
+
+
+def get_selection(cleaned_data):
+    # The facet filters chosen in an ItemFilterForm
+    return {
+        'category': cleaned_data.get('category'),
+        'condition': cleaned_data.get('condition') or [],
+        **{field: bool(cleaned_data.get(field)) for field, label in FLAG_FACETS},
+    }
+
+
+def apply_selection(items, selection):
+    if selection.get('category'):
+        # A parent category also lists the items of its subcategories
+        items = items.filter(category__in=get_category_tree().descendant_ids(selection['category'].pk))
+    if selection.get('condition'):
+        items = items.filter(condition__in=selection['condition'])
+    for field, label in FLAG_FACETS:
+        if selection.get(field):
+            items = items.filter(**{field: True})
+    return items
+
+
+def get_signature(cleaned_data):
+    """
+    The filters applied before faceting (search, location or distance,
+    price range), normalised so equivalent requests share cached counts.
+    """
+    def price(value):
+        return '' if value is None else str(value.normalize())
+
+    return (
+        ' '.join(get_search_terms(cleaned_data.get('query') or '')),
+        get_center(cleaned_data) or (cleaned_data.get('location') or '').strip().lower(),
+        price(cleaned_data.get('min_price')),
+        price(cleaned_data.get('max_price')),
+    )
+
+
+def price_bucket():
+    return Case(
+        *[When(price__lt=bound, then=Value(index)) for index, bound in enumerate(PRICE_BUCKETS)],
+        default=Value(len(PRICE_BUCKETS)),
+        output_field=IntegerField(),
+    )
+
+
+def get_facet_groups(items, signature):
+    """
+    ``(category_id, condition, price bucket, *flags, count)`` for every
+    combination present in ``items``, from one GROUP BY and cached per
+    filter signature. Facet counts for any selection are sums over them.
+    """
+    def compute():
+        return list(
+            items.order_by().prefetch_related(None)
+            .annotate(price_bucket=price_bucket())
+            .values_list('category_id', 'condition', 'price_bucket', *[field for field, label in FLAG_FACETS])
+            .annotate(count=Count('id'))
+        )
+
+    return get_or_compute(fragment_key('facets', FACET_NAMESPACES, signature), compute)
+
+
+class FacetCounter:
+    """
+    Counts the groups matching a selection. Each facet is counted against
+    the other facets' filters only, so its unselected options show how many
+    items choosing them would add.
+    """
+
+    def __init__(self, groups, selection):
+        self.groups = groups
+        category = selection.get('category')
+        self.category_ids = set(get_category_tree().descendant_ids(category.pk)) if category else None
+        self.conditions = set(selection.get('condition') or [])
+        self.flags = [bool(selection.get(field)) for field, label in FLAG_FACETS]
+
+    def matches(self, group, skip=None):
+        category_id, condition, bucket, *flags = group[:-1]
+        if skip != 'category' and self.category_ids is not None and category_id not in self.category_ids:
+            return False
+        if skip != 'condition' and self.conditions and condition not in self.conditions:
+            return False
+        for (field, label), required, value in zip(FLAG_FACETS, self.flags, flags):
+            if skip != field and required and not value:
+                return False
+        return True
+
+    def count(self, position, skip=None):
+        # Matching items by the value at ``position`` in the group
+        counts = {}
+        for group in self.groups:
+            if self.matches(group, skip):
+                counts[group[position]] = counts.get(group[position], 0) + group[-1]
+        return counts
+
+    def total(self):
+        return sum(group[-1] for group in self.groups if self.matches(group))
+
+
+def _url(params, **changes):
+    params = params.copy()
+    # A different result set starts from its first page
+    params.pop('cursor', None)
+    params.pop('page', None)
+    for key, value in changes.items():
+        if value is None or value == []:
+            params.pop(key, None)
+        elif isinstance(value, list):
+            params.setlist(key, value)
+        else:
+            params[key] = value
+    return f'?{params.urlencode()}'
+
+
+def _price_label(index):
+    if index == 0:
+        return f'Under {PRICE_BUCKETS[0]:,}'
+    if index == len(PRICE_BUCKETS):
+        return f'{PRICE_BUCKETS[-1]:,}+'
+    return f'{PRICE_BUCKETS[index - 1]:,} – {PRICE_BUCKETS[index]:,}'
+
+
+def get_facets(items, cleaned_data, params):
+    """
+    Counts and links for the browse sidebar. ``items`` are the items
+    matching the search, location and price filters, before the facet
+    filters in ``cleaned_data``; ``params`` is the request's query string.
+    """
+    from .models import Item
+
+    selection = get_selection(cleaned_data)
+    counter = FacetCounter(get_facet_groups(items, get_signature(cleaned_data)), selection)
+    tree = get_category_tree()
+
+    # Items in a subcategory count towards every ancestor, as the category filter includes them
+    category_counts = {}
+    for category_id, count in counter.count(0, skip='category').items():
+        for ancestor_id in tree.ancestor_ids(category_id):
+            category_counts[ancestor_id] = category_counts.get(ancestor_id, 0) + count
+    selected_category = selection['category'].pk if selection['category'] else None
+    categories = [
+        {
+            'category': category,
+            'count': category_counts.get(category.pk, 0),
+            'selected': category.pk == selected_category,
+            'url': _url(params, category=str(category.pk)),
+        }
+        for category in tree.active()
+        if category_counts.get(category.pk) or category.pk == selected_category
+    ]
+
+    condition_counts = counter.count(1, skip='condition')
+    conditions = []
+    for value, label in Item.CONDITION_CHOICES:
+        selected = value in selection['condition']
+        toggled = [other for other in selection['condition'] if other != value] if selected else [*selection['condition'], value]
+        conditions.append({
+            'value': value,
+            'label': label,
+            'count': condition_counts.get(value, 0),
+            'selected': selected,
+            'url': _url(params, condition=toggled),
+        })
+
+    # The price range is filtered in SQL, so these count within the chosen range
+    price_counts = counter.count(2)
+    min_price, max_price = cleaned_data.get('min_price'), cleaned_data.get('max_price')
+    prices = []
+    for index in range(len(PRICE_BUCKETS) + 1):
+        low = Decimal(PRICE_BUCKETS[index - 1]) if index else None
+        # Prices have two decimal places, so this is the bucket's bound exactly
+        high = Decimal(PRICE_BUCKETS[index]) - Decimal('0.01') if index < len(PRICE_BUCKETS) else None
+        prices.append({
+            'label': _price_label(index),
+            'count': price_counts.get(index, 0),
+            'selected': (min_price, max_price) == (low, high),
+            'url': _url(params, min_price=low and str(low), max_price=high and str(high)),
+        })
+
+    flags = []
+    for position, (field, label) in enumerate(FLAG_FACETS, start=3):
+        selected = selection[field]
+        flags.append({
+            'field': field,
+            'label': label,
+            'count': counter.count(position, skip=field).get(True, 0),
+            'selected': selected,
+            'url': _url(params, **{field: None if selected else 'on'}),
+        })
+
+    return {
+        'total': counter.total(),
+        'all_categories_url': _url(params, category=None),
+        'categories': categories,
+        'conditions': conditions,
+        'prices': prices,
+        'flags': flags,
+    }
@@ -1,14 +1,68 @@
 from django import forms
+from django.forms.models import ModelChoiceIterator
+from .categories import get_category_tree
+from .geo import MAX_RADIUS_KM
 from .models import Item, Category
 
 INPUT_CLASSES = 'w-full py-4 px-6 rounded-xl border border-gray-300 focus:outline-none focus:ring-2 focus:ring-primary-500 focus:border-transparent transition-all duration-200'
 
-class NewItemForm(forms.ModelForm):
+class CategoryChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ('', self.field.empty_label)
+        for category in get_category_tree().active():
+            yield self.choice(category)
+
+    def __len__(self):
+        return len(get_category_tree().active()) + (self.field.empty_label is not None)
+
+class CategoryChoiceField(forms.ModelChoiceField):
+    """
+    Active categories from the in-memory category tree, so rendering and
+    validating the field doesn't query the database.
+    """
+
+    iterator = CategoryChoiceIterator
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('queryset', Category.objects.active())
+        super().__init__(**kwargs)
+
+    def label_from_instance(self, obj):
+        return f'{"— " * getattr(obj, "depth", 0)}{obj.name}'
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            category = get_category_tree().get(int(value))
+        except (TypeError, ValueError):
+            category = None
+        if category is None or not category.is_active:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'], code='invalid_choice', params={'value': value}
+            )
+        return category
+
+def image_field():
+    return forms.ImageField(required=False, widget=forms.FileInput(attrs={
+        'class': INPUT_CLASSES,
+        'accept': 'image/*'
+    }))
+
+class ItemImagesForm(forms.Form):
+    # Uploads are handed to item.images.accept_item_images rather than saved on the model
+    image = image_field()
+    image_2 = image_field()
+    image_3 = image_field()
+    image_4 = image_field()
+    image_5 = image_field()
+
+class NewItemForm(ItemImagesForm, forms.ModelForm):
     class Meta:
         model = Item
         fields = ('category', 'name', 'description', 'price', 'condition', 'location', 
-                 'delivery_available', 'pickup_available', 'is_negotiable', 
-                 'image', 'image_2', 'image_3', 'image_4', 'image_5')
+                 'delivery_available', 'pickup_available', 'is_negotiable')
         widgets = {
             'category': forms.Select(attrs={
                 'class': INPUT_CLASSES,
@@ -45,39 +99,20 @@ class NewItemForm(forms.ModelForm):
             'is_negotiable': forms.CheckboxInput(attrs={
                 'class': 'rounded border-gray-300 text-primary-600 focus:ring-primary-500'
             }),
-            'image': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_2': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_3': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_4': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_5': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
+        }
+        field_classes = {
+            'category': CategoryChoiceField,
         }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.fields['category'].queryset = Category.objects.filter(is_active=True).order_by('name')
         self.fields['category'].empty_label = "Select a category"
 
-class EditItemForm(forms.ModelForm):
+class EditItemForm(ItemImagesForm, forms.ModelForm):
     class Meta:
         model = Item
         fields = ('name', 'description', 'price', 'condition', 'location',
-                 'delivery_available', 'pickup_available', 'is_negotiable', 'status',
-                 'image', 'image_2', 'image_3', 'image_4', 'image_5')
+                 'delivery_available', 'pickup_available', 'is_negotiable', 'status')
         widgets = {
             'name': forms.TextInput(attrs={
                 'class': INPUT_CLASSES,
@@ -113,41 +148,18 @@ class EditItemForm(forms.ModelForm):
             'status': forms.Select(attrs={
                 'class': INPUT_CLASSES
             }),
-            'image': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_2': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_3': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_4': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
-            'image_5': forms.FileInput(attrs={
-                'class': INPUT_CLASSES,
-                'accept': 'image/*'
-            }),
         }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fields['category'].queryset = Category.objects.filter(is_active=True).order_by('name')
-        self.fields['category'].empty_label = "Select a category"
-
 class ItemFilterForm(forms.Form):
     SORT_CHOICES = [
+        ('relevance', 'Most Relevant'),
         ('newest', 'Newest First'),
         ('oldest', 'Oldest First'),
         ('price_low', 'Price: Low to High'),
         ('price_high', 'Price: High to Low'),
         ('most_viewed', 'Most Viewed'),
         ('most_favorited', 'Most Favorited'),
+        ('distance', 'Nearest First'),
     ]
     
     query = forms.CharField(
@@ -157,8 +169,7 @@ class ItemFilterForm(forms.Form):
             'class': 'w-full pl-10 pr-4 py-3 border border-gray-300 rounded-lg focus:outline-none focus:ring-2 focus:ring-primary-500'
         })
     )
-    category = forms.ModelChoiceField(
-        queryset=Category.objects.filter(is_active=True),
+    category = CategoryChoiceField(
         required=False,
         empty_label="All Categories",
         widget=forms.Select(attrs={
@@ -193,6 +204,10 @@ class ItemFilterForm(forms.Form):
             'placeholder': 'Min price KSh',
         })
     )
+    # Search radius in km around the location, or around lat/lng when the browser shares them
+    radius = forms.IntegerField(required=False, min_value=1, max_value=MAX_RADIUS_KM)
+    lat = forms.FloatField(required=False, min_value=-90, max_value=90, widget=forms.HiddenInput)
+    lng = forms.FloatField(required=False, min_value=-180, max_value=180, widget=forms.HiddenInput)
     delivery_available = forms.BooleanField(required=False)
     pickup_available = forms.BooleanField(required=False)
     is_negotiable = forms.BooleanField(required=False)
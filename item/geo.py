@@ -0,0 +1,199 @@
+import csv
+import functools
+import math
+import re
+from collections import namedtuple
+from pathlib import Path
+
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Power, Sqrt
+
+GAZETTEER_PATH = Path(__file__).resolve().parent / 'data' / 'places.csv'
+
+# Precision stored on items (cells of about 5 by 5 metres)
+GEOHASH_PRECISION = 9
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+KM_PER_DEGREE = 111.195
+DEFAULT_RADIUS_KM = 25
+MAX_RADIUS_KM = 200
+# A radius search looks up at most this many geohash prefixes
+MAX_CELLS = 16
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+
+Place = namedtuple('Place', 'name parent latitude longitude radius_km')
+
+
+class Gazetteer:
+    """
+    Known places by name and alias. ``lookup`` finds the most specific place
+    mentioned in free text: "Westlands, Nairobi" is Westlands and "Nairobi
+    CBD" the CBD rather than Nairobi.
+    """
+
+    def __init__(self, rows):
+        self.by_name = {}
+        for row in rows:
+            place = Place(
+                row['name'], row['parent'] or None,
+                float(row['latitude']), float(row['longitude']), float(row['radius_km']),
+            )
+            for name in [row['name'], *row['aliases'].split(';')]:
+                key = ' '.join(WORD_RE.findall(name.lower().replace('’', "'")))
+                if key:
+                    self.by_name.setdefault(key, place)
+        self.max_words = max(len(name.split()) for name in self.by_name)
+
+    def lookup(self, text):
+        words = WORD_RE.findall((text or '').lower().replace('’', "'"))
+        matches = []
+        for size in range(1, min(self.max_words, len(words)) + 1):
+            for start in range(len(words) - size + 1):
+                place = self.by_name.get(' '.join(words[start:start + size]))
+                if place is not None:
+                    # Longer names first, then places inside another one, then the earliest mention
+                    matches.append((size, place.parent is not None, -start, place))
+        return max(matches, key=lambda match: match[:3])[3] if matches else None
+
+
+@functools.cache
+def get_gazetteer():
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as places:
+        return Gazetteer(list(csv.DictReader(places)))
+
+
+def geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    latitudes, longitudes = [-90.0, 90.0], [-180.0, 180.0]
+    code = []
+    bits = bit_count = 0
+    even = True
+    while len(code) < precision:
+        interval, value = (longitudes, longitude) if even else (latitudes, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            code.append(GEOHASH_ALPHABET[bits])
+            bits = bit_count = 0
+    return ''.join(code)
+
+
+def cell_size(precision):
+    # (height, width) in degrees of a geohash cell; longitude gets the odd bit
+    bits = 5 * precision
+    return 180 / 2 ** (bits // 2), 360 / 2 ** ((bits + 1) // 2)
+
+
+def covering_cells(latitude, longitude, radius_km):
+    """
+    The geohash prefixes of the smallest cells that cover the circle's
+    bounding box in at most MAX_CELLS lookups.
+    """
+    lat_span = radius_km / KM_PER_DEGREE
+    lng_span = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    south, north = max(latitude - lat_span, -90), min(latitude + lat_span, 90)
+    west, east = max(longitude - lng_span, -180), min(longitude + lng_span, 180)
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = range(math.floor((south + 90) / height), math.floor((north + 90) / height) + 1)
+        columns = range(math.floor((west + 180) / width), math.floor((east + 180) / width) + 1)
+        if len(rows) * len(columns) <= MAX_CELLS:
+            return sorted({
+                geohash((row + 0.5) * height - 90, (column + 0.5) * width - 180, precision)
+                for row in rows for column in columns
+            })
+    return ['']
+
+
+def locate(text):
+    # (latitude, longitude, geohash) of the place named in ``text``, or Nones
+    place = get_gazetteer().lookup(text)
+    if place is None:
+        return None, None, ''
+    return place.latitude, place.longitude, geohash(place.latitude, place.longitude)
+
+
+def get_center(cleaned_data):
+    """
+    ``(latitude, longitude, radius_km)`` to search around for an
+    ItemFilterForm: the browser's position when given, else the place named
+    as the location, or None to match the location as text. Coordinates are
+    rounded to about 100m so nearby requests share cached counts.
+    """
+    radius = cleaned_data.get('radius')
+    latitude, longitude = cleaned_data.get('lat'), cleaned_data.get('lng')
+    if latitude is None or longitude is None:
+        place = get_gazetteer().lookup(cleaned_data.get('location'))
+        if place is None:
+            return None
+        latitude, longitude = place.latitude, place.longitude
+        radius = radius or place.radius_km
+    return round(latitude, 3), round(longitude, 3), radius or DEFAULT_RADIUS_KM
+
+
+def distance_km(latitude, longitude):
+    # Equirectangular approximation, well within 1% at the radii searched here
+    scale = math.cos(math.radians(latitude))
+    return Sqrt(
+        Power((F('longitude') - longitude) * scale, 2) + Power(F('latitude') - latitude, 2),
+        output_field=FloatField(),
+    ) * KM_PER_DEGREE
+
+
+def within_radius(items, latitude, longitude, radius_km):
+    """
+    ``items`` within ``radius_km`` of the point, annotated with their
+    ``distance`` in km. The geohash prefixes narrow the search to nearby
+    index cells before distances are computed.
+    """
+    cells = Q()
+    for cell in covering_cells(latitude, longitude, radius_km):
+        cells |= Q(geohash__startswith=cell)
+    return (
+        items.exclude(geohash='').filter(cells)
+        .annotate(distance=distance_km(latitude, longitude))
+        .filter(distance__lte=radius_km)
+    )
+
+
+def locate_items(batch_size=500):
+    """
+    Recompute every item's coordinates from its location, for listings
+    saved before the gazetteer knew their place. Returns the number changed.
+    """
+    from core.cache import bump_version
+
+    from .models import Item
+
+    changed = 0
+    last_pk = 0
+    while True:
+        items = list(
+            Item.objects.filter(pk__gt=last_pk).order_by('pk')
+            .only('pk', 'location', 'latitude', 'longitude', 'geohash')[:batch_size]
+        )
+        if not items:
+            break
+        last_pk = items[-1].pk
+
+        updated = []
+        for item in items:
+            located = locate(item.location)
+            if located != (item.latitude, item.longitude, item.geohash):
+                item.latitude, item.longitude, item.geohash = located
+                updated.append(item)
+        Item.objects.bulk_update(updated, ['latitude', 'longitude', 'geohash'])
+        changed += len(updated)
+
+    if changed:
+        # bulk_update() skips the item signals
+        bump_version('item')
+    return changed
@@ -0,0 +1,142 @@
+import logging
+from functools import partial
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from core.background import run_in_background
+from core.cache import bump_version
+
+# Longest side in pixels of each variant rendered from an upload
+VARIANT_SIZES = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 1280,
+}
+
+# Default `sizes` attribute for each variant in <picture> markup
+VARIANT_DISPLAY_SIZES = {
+    'thumb': '160px',
+    'card': '(min-width: 768px) 33vw, 100vw',
+    'detail': '(min-width: 1024px) 50vw, 100vw',
+}
+
+# Preferred first; formats the installed Pillow can't encode are skipped
+FORMATS = {
+    'avif': {'quality': 50},
+    'webp': {'quality': 80, 'method': 4},
+}
+
+IMAGE_FIELDS = ('image', 'image_2', 'image_3', 'image_4', 'image_5')
+
+logger = logging.getLogger(__name__)
+
+
+def get_formats():
+    return [image_format for image_format in FORMATS if features.check(image_format)]
+
+
+def accept_item_images(item, files):
+    """
+    Store the photos uploaded for ``item`` (``image`` .. ``image_5`` in
+    ``files``) as pending ItemImages and queue their variants. Only the
+    original is written during the request.
+    """
+    from .models import ItemImage
+
+    images = []
+    with transaction.atomic():
+        for position, field in enumerate(IMAGE_FIELDS):
+            upload = files.get(field)
+            if not upload:
+                continue
+            # A new upload replaces the photo in that slot
+            for previous in ItemImage.objects.filter(item=item, position=position):
+                previous.delete()
+                transaction.on_commit(partial(delete_image_files, previous))
+            images.append(ItemImage.objects.create(item=item, position=position, original=upload))
+
+        for image in images:
+            run_in_background(process_item_image, image.pk)
+    return images
+
+
+def delete_image_files(image):
+    storage = image.original.storage
+    for formats in image.variants.values():
+        for variant in formats.values():
+            storage.delete(variant['name'])
+    image.original.delete(save=False)
+
+
+def render_variant(source, size, image_format):
+    variant = source.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    buffer = BytesIO()
+    variant.save(buffer, image_format.upper(), **FORMATS[image_format])
+    return variant.size, buffer.getvalue()
+
+
+def process_item_image(image_id):
+    """
+    Render every variant of an ItemImage into its storage and record their
+    names and dimensions.
+    """
+    from .models import Item, ItemImage
+
+    image = ItemImage.objects.filter(pk=image_id).first()
+    if image is None:
+        return
+
+    storage = image.original.storage
+    try:
+        with image.original.open('rb') as original:
+            source = ImageOps.exif_transpose(Image.open(original))
+            source.load()
+        if source.mode not in ('RGB', 'RGBA'):
+            source = source.convert('RGBA' if 'transparency' in source.info else 'RGB')
+
+        variants = {}
+        for name, size in VARIANT_SIZES.items():
+            for image_format in get_formats():
+                (width, height), content = render_variant(source, size, image_format)
+                saved_name = storage.save(f'items/variants/{image.pk}/{name}.{image_format}', ContentFile(content))
+                variants.setdefault(name, {})[image_format] = {'name': saved_name, 'width': width, 'height': height}
+    except Exception as e:
+        ItemImage.objects.filter(pk=image.pk).update(status='failed', error=str(e))
+        raise
+
+    ItemImage.objects.filter(pk=image.pk).update(status='ready', variants=variants, error='')
+    # Cached cards and detail bodies vary on updated_at
+    Item.objects.filter(pk=image.item_id).update(updated_at=timezone.now())
+    bump_version('item')
+
+
+def process_pending_images():
+    """
+    Process every pending ItemImage and return how many were processed and
+    how many failed. A broken upload is marked failed and skipped.
+    """
+    from .models import ItemImage
+
+    processed = failed = 0
+    for image_id in ItemImage.objects.filter(status='pending').values_list('pk', flat=True):
+        try:
+            process_item_image(image_id)
+        except Exception:
+            logger.exception('Processing item image %s failed', image_id)
+            failed += 1
+        else:
+            processed += 1
+    return processed, failed
+
+
+def primary_image(item):
+    # Uses the prefetched images (see ItemQuerySet.with_related) when available
+    for image in item.images.all():
+        if image.status == 'ready':
+            return image
+    return None
@@ -0,0 +1,147 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.utils import timezone
+
+from core.cache import bump_version
+
+from .categories import refresh_category_counts
+from .search import unindex_items
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+# Listings in these states are archived once unchanged for ITEM_ARCHIVE_AFTER_DAYS
+ARCHIVED_STATUSES = ('sold', 'removed', 'expired')
+
+# Deleting an item deletes these with it, so items that have any stay in the item table
+KEPT_RELATIONS = ('conversations', 'adminaction', 'report', 'reviews')
+
+
+def expire_listings(now):
+    """
+    Mark active listings whose ``expires_at`` has passed as expired,
+    BATCH_SIZE at a time. Returns the number expired.
+    """
+    from .models import Item
+
+    expired = 0
+    while True:
+        ids = list(
+            Item.objects.filter(status='active', expires_at__lte=now).values_list('pk', flat=True)[:BATCH_SIZE]
+        )
+        if not ids:
+            break
+        expired += Item.objects.filter(pk__in=ids, status='active').update(status='expired', updated_at=now)
+
+    if expired:
+        # QuerySet.update() skips the item signals
+        refresh_category_counts()
+        bump_version('item')
+        bump_version('autocomplete')
+    return expired
+
+
+def _move_views(views):
+    # Moves up to BATCH_SIZE of ``views`` to the archive; returns how many
+    from .models import ArchivedItemView, ItemView
+
+    rows = list(views.order_by('pk').values_list('pk', 'item_id', 'user_id', 'ip_address', 'timestamp')[:BATCH_SIZE])
+    if not rows:
+        return 0
+
+    ArchivedItemView.objects.bulk_create([
+        ArchivedItemView(id=pk, item_id=item_id, user_id=user_id, ip_address=ip_address, timestamp=timestamp)
+        for pk, item_id, user_id, ip_address, timestamp in rows
+    ], ignore_conflicts=True)
+    ItemView.objects.filter(pk__in=[row[0] for row in rows]).delete()
+    return len(rows)
+
+
+def archive_item_views(cutoff):
+    from .models import ItemView
+
+    moved = 0
+    while True:
+        with transaction.atomic():
+            count = _move_views(ItemView.objects.filter(timestamp__lt=cutoff))
+        if not count:
+            return moved
+        moved += count
+
+
+def archivable_items(cutoff):
+    from .models import Item
+
+    return Item.objects.filter(status__in=ARCHIVED_STATUSES, updated_at__lt=cutoff).filter(
+        **{f'{relation}__isnull': True for relation in KEPT_RELATIONS}
+    )
+
+
+def archive_items(cutoff):
+    """
+    Move items that left the market before ``cutoff`` to ArchivedItem along
+    with their views, BATCH_SIZE per transaction. Their favorites, counter
+    shards, related items and image rows are deleted; the image files stay
+    in storage and their names in the archived row. Returns the number of
+    items moved.
+
+    The items are deleted without their delete signals, which would clean
+    up after each one: their search rows go per batch, and the caches and
+    category counts are refreshed once at the end. Archived items aren't
+    listed, so the autocomplete index never had them.
+    """
+    from .models import ArchivedItem, Item, ItemView
+
+    fields = [field.name for field in Item._meta.concrete_fields if field.name not in ('id', 'search_vector')]
+    moved = 0
+    while True:
+        with transaction.atomic():
+            items = list(
+                archivable_items(cutoff).defer('search_vector').prefetch_related('images').order_by('pk')[:BATCH_SIZE]
+            )
+            if not items:
+                break
+            ids = [item.pk for item in items]
+
+            while _move_views(ItemView.objects.filter(item_id__in=ids)):
+                pass
+
+            archived = []
+            for item, record in zip(items, serializers.serialize('python', items, fields=fields)):
+                data = {'id': item.pk, **record['fields']}
+                data['images'] = [image.original.name for image in item.images.all()]
+                archived.append(ArchivedItem(
+                    id=item.pk, category_id=item.category_id, created_by_id=item.created_by_id,
+                    name=item.name, status=item.status, created_at=item.created_at, data=data,
+                ))
+            ArchivedItem.objects.bulk_create(archived, ignore_conflicts=True)
+            for relation in Item._meta.related_objects:
+                relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': ids}).delete()
+            Item.objects.filter(pk__in=ids)._raw_delete(Item.objects.db)
+            unindex_items(ids)
+        moved += len(items)
+
+    if moved:
+        refresh_category_counts()
+        bump_version('item')
+    return moved
+
+
+def run_lifecycle(now=None):
+    """
+    Expire listings, then archive old non-active items and item views.
+    Returns the rows changed by each step.
+    """
+    now = now or timezone.now()
+    report = {
+        'expired': expire_listings(now),
+        'archived_items': archive_items(now - timedelta(days=settings.ITEM_ARCHIVE_AFTER_DAYS)),
+        'archived_views': archive_item_views(now - timedelta(days=settings.ITEM_VIEW_RETENTION_DAYS)),
+    }
+    logger.info('Item lifecycle run: %s', report)
+    return report
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from item.tracking import flush_view_buffer
+
+class Command(BaseCommand):
+    help = 'Write buffered item views to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and flush every N seconds instead of once'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+
+        while True:
+            count = flush_view_buffer()
+            self.stdout.write(
+                self.style.SUCCESS(f'Recorded {count} new item views')
+            )
+
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from item.geo import locate_items
+
+class Command(BaseCommand):
+    help = 'Recompute item coordinates from their locations using the bundled gazetteer'
+
+    def handle(self, *args, **options):
+        changed = locate_items()
+        self.stdout.write(self.style.SUCCESS(f'Updated the coordinates of {changed} items'))
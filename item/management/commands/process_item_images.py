@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from item.images import process_pending_images
+
+class Command(BaseCommand):
+    help = 'Render the variants of item photos still waiting to be processed'
+
+    def handle(self, *args, **options):
+        processed, failed = process_pending_images()
+        self.stdout.write(
+            self.style.SUCCESS(f'Processed {processed} item images')
+        )
+        if failed:
+            self.stdout.write(
+                self.style.ERROR(f'Failed to process {failed} item images')
+            )
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from item.autocomplete import refresh_autocomplete
+
+class Command(BaseCommand):
+    help = 'Rebuild the search suggestion snapshot that every process loads its autocomplete index from'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and repeat every N seconds instead of once'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+
+        while True:
+            items = refresh_autocomplete()
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt the autocomplete snapshot with {items} items'))
+
+            if not interval:
+                break
+            time.sleep(interval)
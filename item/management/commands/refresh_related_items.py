@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from item.recommendations import refresh_related_items
+
+class Command(BaseCommand):
+    help = 'Recompute the related items lists of listings changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute every listed item, e.g. nightly'
+        )
+
+    def handle(self, *args, **options):
+        count = refresh_related_items(full=options['full'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Refreshed related items for {count} items')
+        )
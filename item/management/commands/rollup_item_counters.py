@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from item.counters import rollup_counters
+
+class Command(BaseCommand):
+    help = 'Fold pending view and favorite counter shards into the item columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and roll up every N seconds instead of once'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+
+        while True:
+            count = rollup_counters()
+            self.stdout.write(
+                self.style.SUCCESS(f'Rolled up counters for {count} items')
+            )
+
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from item.lifecycle import run_lifecycle
+
+class Command(BaseCommand):
+    help = 'Expire listings past their expiry date and archive old listings and item views'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Keep running and repeat every N seconds instead of once'
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+
+        while True:
+            report = run_lifecycle()
+            self.stdout.write(self.style.SUCCESS(
+                f"Expired {report['expired']} listings, archived {report['archived_items']} items "
+                f"and {report['archived_views']} item views"
+            ))
+
+            if not interval:
+                break
+            time.sleep(interval)
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:29
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+POSTGRES_FORWARDS = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    "UPDATE item_item SET search_vector = "
+    "setweight(to_tsvector('english', COALESCE(name, '')), 'A') || "
+    "setweight(to_tsvector('english', COALESCE(description, '')), 'B') || "
+    "setweight(to_tsvector('english', COALESCE(location, '')), 'C')",
+    'CREATE INDEX item_search_vector_gin ON item_item USING gin (search_vector)',
+    'CREATE INDEX item_name_trgm_gin ON item_item USING gin (name gin_trgm_ops)',
+]
+
+POSTGRES_BACKWARDS = [
+    'DROP INDEX IF EXISTS item_name_trgm_gin',
+    'DROP INDEX IF EXISTS item_search_vector_gin',
+]
+
+SQLITE_FORWARDS = [
+    "CREATE VIRTUAL TABLE item_search USING fts5("
+    "name, description, location, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO item_search (rowid, name, description, location) "
+    "SELECT id, name, COALESCE(description, ''), location FROM item_item",
+]
+
+SQLITE_BACKWARDS = [
+    'DROP TABLE IF EXISTS item_search',
+]
+
+
+def run_for_vendor(postgres_statements, sqlite_statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        if vendor == 'postgresql':
+            statements = postgres_statements
+        elif vendor == 'sqlite':
+            statements = sqlite_statements
+        else:
+            statements = []
+
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0004_alter_category_category_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARDS, SQLITE_FORWARDS),
+            run_for_vendor(POSTGRES_BACKWARDS, SQLITE_BACKWARDS),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0005_item_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['views', 'id'], name='item_item_views_2b86c4_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['favorites', 'id'], name='item_item_favorit_97d34a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='itemfavorite',
+            index=models.Index(fields=['user', 'created_at'], name='item_itemfa_user_id_3066ac_idx'),
+        ),
+    ]
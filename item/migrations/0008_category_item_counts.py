@@ -0,0 +1,50 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:42
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_active_items(apps, schema_editor):
+    Category = apps.get_model('item', 'Category')
+    Item = apps.get_model('item', 'Item')
+
+    direct = dict(
+        Item.objects.filter(status='active', admin_approved=True)
+        .order_by().values_list('category_id').annotate(count=Count('id'))
+    )
+    categories = list(Category.objects.all())
+    parents = {category.pk: category.parent_id for category in categories}
+
+    totals = {}
+    for category_id, count in direct.items():
+        seen = set()
+        while category_id is not None and category_id not in seen:
+            seen.add(category_id)
+            totals[category_id] = totals.get(category_id, 0) + count
+            category_id = parents.get(category_id)
+
+    for category in categories:
+        category.active_items_count = direct.get(category.pk, 0)
+        category.total_active_items_count = totals.get(category.pk, 0)
+    Category.objects.bulk_update(categories, ['active_items_count', 'total_active_items_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0007_itemcountershard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='active_items_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='total_active_items_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_active_items, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 12:47
+
+from django.db import migrations, models
+import django.db.models.deletion
+import item.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0008_category_item_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField(default=0)),
+                ('original', models.ImageField(height_field='height', storage=item.models.get_item_image_storage, upload_to='items/originals/%Y/%m/', width_field='width')),
+                ('width', models.PositiveIntegerField(blank=True, null=True)),
+                ('height', models.PositiveIntegerField(blank=True, null=True)),
+                ('variants', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='item.item')),
+            ],
+            options={
+                'ordering': ('position',),
+                'unique_together': {('item', 'position')},
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:20
+
+from datetime import timedelta
+
+from django.conf import settings
+import django.core.serializers.json
+from django.db import migrations, models
+import django.utils.timezone
+import item.models
+
+
+def set_listing_expiry(apps, schema_editor):
+    # Listings live when expiry starts being enforced get a full listing period from now
+    Item = apps.get_model('item', 'Item')
+    Item.objects.filter(status='active', expires_at=None).update(
+        expires_at=django.utils.timezone.now() + timedelta(days=settings.ITEM_LISTING_DAYS)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0010_relateditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('category_id', models.BigIntegerField()),
+                ('created_by_id', models.IntegerField(db_index=True)),
+                ('name', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=20)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('data', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedItemView',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('item_id', models.BigIntegerField(db_index=True)),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('ip_address', models.GenericIPAddressField()),
+                ('timestamp', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, default=item.models.default_expiry, null=True),
+        ),
+        migrations.RunPython(set_listing_expiry, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.16 on 2026-10-18 13:28
+
+from django.db import migrations, models
+
+from item.geo import locate
+
+
+def locate_existing_items(apps, schema_editor):
+    Item = apps.get_model('item', 'Item')
+    items = []
+    for item in Item.objects.exclude(location='').only('pk', 'location').iterator(chunk_size=500):
+        item.latitude, item.longitude, item.geohash = locate(item.location)
+        if item.geohash:
+            items.append(item)
+    Item.objects.bulk_update(items, ['latitude', 'longitude', 'geohash'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0011_item_lifecycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.RunPython(locate_existing_items, migrations.RunPython.noop),
+    ]
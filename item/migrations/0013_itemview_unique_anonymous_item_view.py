@@ -0,0 +1,31 @@
+# Generated by Django 4.2.16 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+def remove_duplicate_anonymous_views(apps, schema_editor):
+    # Keeps the first view of each anonymous viewer
+    ItemView = apps.get_model('item', 'ItemView')
+    duplicates = (
+        ItemView.objects.filter(user=None).values('item_id', 'ip_address')
+        .annotate(first=models.Min('id'), count=models.Count('id')).filter(count__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        ItemView.objects.filter(
+            user=None, item_id=duplicate['item_id'], ip_address=duplicate['ip_address'],
+        ).exclude(pk=duplicate['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('item', '0012_item_coordinates'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_anonymous_views, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='itemview',
+            constraint=models.UniqueConstraint(condition=models.Q(('user', None)), fields=('item', 'ip_address'), name='unique_anonymous_item_view'),
+        ),
+    ]
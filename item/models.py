@@ -1,7 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.postgres.search import SearchVectorField
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.utils import timezone
+from django.utils.module_loading import import_string
 from cloudinary.models import CloudinaryField
 
+class CategoryQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(is_active=True)
+
 class Category(models.Model):
     CATEGORY_TYPES = [
         ('electronics', 'Electronics & Appliances'),
@@ -26,6 +37,12 @@ class Category(models.Model):
     is_active = models.BooleanField(default=True)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, related_name='subcategories')
     created_at = models.DateTimeField(auto_now_add=True)
+    
+    # Active items in this category, and including its subcategories (maintained by item.categories)
+    active_items_count = models.PositiveIntegerField(default=0, editable=False)
+    total_active_items_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CategoryQuerySet.as_manager()
 
     class Meta:
         ordering = ('name',)
@@ -34,6 +51,24 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+def default_expiry():
+    return timezone.now() + timedelta(days=settings.ITEM_LISTING_DAYS)
+
+class ItemQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status='active', admin_approved=True)
+
+    def with_related(self):
+        return self.select_related('category', 'created_by').prefetch_related('images')
+
+    def public(self):
+        # Listing pages never read the search vector, so don't ship it over the wire
+        return self.active().with_related().defer('search_vector')
+
+    def related_to(self, item_id):
+        # The precomputed list (see item.recommendations), closest first
+        return self.filter(recommended_in__item=item_id).order_by('recommended_in__rank')
+
 class Item(models.Model):
     CONDITION_CHOICES = [
         ('new', 'Brand New'),
@@ -68,6 +103,10 @@ class Item(models.Model):
     
     # Location and delivery
     location = models.CharField(max_length=255, blank=True)
+    # Where ``location`` is, from the gazetteer in item.geo; blank when it names no known place
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    geohash = models.CharField(max_length=12, blank=True, db_index=True, editable=False)
     delivery_available = models.BooleanField(default=False)
     pickup_available = models.BooleanField(default=True)
     
@@ -86,12 +125,18 @@ class Item(models.Model):
     created_by = models.ForeignKey(User, related_name='items', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    expires_at = models.DateTimeField(null=True, blank=True)
+    # Active listings past this are expired by item.lifecycle
+    expires_at = models.DateTimeField(null=True, blank=True, default=default_expiry)
     
     # SEO fields
     meta_title = models.CharField(max_length=60, blank=True)
     meta_description = models.CharField(max_length=160, blank=True)
     
+    # Full-text search (maintained by item.search; GIN indexes are created in migration 0005)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    objects = ItemQuerySet.as_manager()
+    
     class Meta:
         ordering = ('-created_at',)
         indexes = [
@@ -99,11 +144,20 @@ class Item(models.Model):
             models.Index(fields=['category', 'status']),
             models.Index(fields=['created_at']),
             models.Index(fields=['price']),
+            models.Index(fields=['views', 'id']),
+            models.Index(fields=['favorites', 'id']),
         ]
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        # Only kept by reference: the save signals read it to see what changed (see item.signals)
+        item._loaded_row = (field_names, values)
+        return item
+    
     @property
     def is_sold(self):
         return self.status == 'sold'
@@ -113,7 +167,8 @@ class Item(models.Model):
         return self.status == 'active' and self.admin_approved
     
     def get_all_images(self):
-        images = []
+        # Processed uploads first, then any photos stored on the legacy Cloudinary fields
+        images = [image.variant_url('detail') for image in self.images.all() if image.status == 'ready']
         for i in range(1, 6):
             img = getattr(self, f'image{"" if i == 1 else f"_{i}"}', None)
             if img:
@@ -128,6 +183,12 @@ class ItemView(models.Model):
     
     class Meta:
         unique_together = ['item', 'user', 'ip_address']
+        constraints = [
+            # NULLs never conflict, so anonymous viewers need their own constraint
+            models.UniqueConstraint(
+                fields=['item', 'ip_address'], condition=models.Q(user=None), name='unique_anonymous_item_view',
+            ),
+        ]
 
 class ItemFavorite(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='item_favorites')
@@ -135,4 +196,124 @@ class ItemFavorite(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
-        unique_together = ['item', 'user']
\ No newline at end of file
+        unique_together = ['item', 'user']
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+class ItemCounterShard(models.Model):
+    """
+    Pending increments for ``Item.views``/``Item.favorites``, spread over
+    several rows per item so concurrent writers don't queue on one row lock.
+    Folded into the item columns by ``item.counters.rollup_counters``.
+    """
+
+    FIELD_CHOICES = [
+        ('views', 'Views'),
+        ('favorites', 'Favorites'),
+    ]
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='counter_shards')
+    field = models.CharField(max_length=20, choices=FIELD_CHOICES)
+    shard = models.PositiveSmallIntegerField()
+    delta = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ['item', 'field', 'shard']
+
+class RelatedItem(models.Model):
+    """
+    One entry of an item's precomputed related items list, ``rank`` 0 being
+    the closest. Written by ``item.recommendations.refresh_related_items``.
+    """
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='related_entries')
+    related = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='recommended_in')
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ('item', 'rank')
+        unique_together = ['item', 'rank']
+
+class ArchivedItem(models.Model):
+    """
+    A sold, removed or expired listing moved out of the item table by
+    ``item.lifecycle``, keeping its primary key. ``data`` holds every column
+    of the original row.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    category_id = models.BigIntegerField()
+    created_by_id = models.IntegerField(db_index=True)
+    name = models.CharField(max_length=255)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now, db_index=True)
+    data = models.JSONField(encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return self.name
+
+class ArchivedItemView(models.Model):
+    # An ItemView past settings.ITEM_VIEW_RETENTION_DAYS, or of an archived item
+    id = models.BigIntegerField(primary_key=True)
+    item_id = models.BigIntegerField(db_index=True)
+    user_id = models.IntegerField(null=True, blank=True)
+    ip_address = models.GenericIPAddressField()
+    timestamp = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+def get_item_image_storage():
+    return import_string(settings.ITEM_IMAGE_STORAGE)()
+
+class ItemImage(models.Model):
+    """
+    An uploaded item photo and the resized variants ``item.images`` renders
+    from it in the background, e.g. ``{'card': {'webp': {'name': ...,
+    'width': 400, 'height': 300}}}``.
+    """
+
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='images')
+    position = models.PositiveSmallIntegerField(default=0)
+    original = models.ImageField(
+        upload_to='items/originals/%Y/%m/', storage=get_item_image_storage,
+        width_field='width', height_field='height',
+    )
+    width = models.PositiveIntegerField(null=True, blank=True)
+    height = models.PositiveIntegerField(null=True, blank=True)
+    variants = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ('position',)
+        unique_together = ['item', 'position']
+
+    def __str__(self):
+        return f'{self.item} #{self.position + 1}'
+
+    def variant(self, name, image_format='webp'):
+        return self.variants.get(name, {}).get(image_format)
+
+    def variant_url(self, name, image_format='webp'):
+        variant = self.variant(name, image_format)
+        return self.original.storage.url(variant['name']) if variant else self.original.url
+
+    def srcset(self, image_format='webp'):
+        # One candidate per width: variants of a small original can come out the same size
+        candidates = {
+            formats[image_format]['width']: formats[image_format]['name']
+            for formats in self.variants.values() if image_format in formats
+        }
+        return ', '.join(
+            f'{self.original.storage.url(name)} {width}w' for width, name in sorted(candidates.items())
+        )
@@ -0,0 +1,360 @@
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from core.cache import bump_version, get_or_compute
+
+from .categories import CategoryTree
+from .search import search_any_terms
+
+# Entries kept per item; the detail page shows the first few that are still listed
+TOP_K = 12
+BATCH_SIZE = 500
+
+# What each signal, scaled to 0..1, adds to a candidate's score
+WEIGHTS = {
+    'favorites': 3.0,
+    'views': 2.0,
+    'text': 2.0,
+    'category': 1.0,
+    'price': 0.5,
+}
+
+# Candidates each signal puts forward; all of them are then scored on every signal
+CANDIDATES_PER_SIGNAL = 50
+# Visitors with more items than this (crawlers, bulk favoriters) say little about any pair
+MAX_VISITOR_ITEMS = 200
+# Listings kept per term for finding candidates, those the term weighs most in
+MAX_POSTINGS = 200
+# An incremental run looks up the listings sharing this many of a changed item's heaviest terms
+MAX_QUERY_TERMS = 5
+# Incremental runs weigh terms by document frequencies recounted this often, in seconds
+DOCUMENT_FREQUENCY_TIMEOUT = 24 * 60 * 60
+
+TOKEN_RE = re.compile(r'[a-z0-9]{2,}')
+STOP_WORDS = frozenset([
+    'and', 'are', 'for', 'from', 'has', 'have', 'in', 'is', 'it', 'of', 'on', 'or',
+    'the', 'this', 'to', 'with', 'new', 'used', 'good', 'condition', 'sale', 'selling',
+])
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall((text or '').lower()) if token not in STOP_WORDS]
+
+
+def count_terms(name, description):
+    # The name counts twice
+    return Counter(tokenize(name) * 2 + tokenize(description))
+
+
+def weigh_terms(counts, document_frequency):
+    # The TF-IDF ``{term: weight}`` vector of unit length for a document's term counts
+    documents, frequency = document_frequency
+    vector = {
+        term: (1 + math.log(count)) * (math.log((1 + documents) / (1 + frequency[term])) + 1)
+        for term, count in counts.items()
+    }
+    norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1
+    return {term: weight / norm for term, weight in vector.items()}
+
+
+def price_band(price):
+    # Half-octave bands: 10 and 14 share one, 10 and 40 are four apart
+    return math.floor(math.log2(float(price) + 1) * 2)
+
+
+def _chunks(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+class Catalog:
+    """
+    Listed items, most viewed first, with a TF-IDF vector of each one's
+    name (counted twice) and description as a sparse ``{term: weight}``
+    dict of unit length, and an inverted index from each term to the
+    MAX_POSTINGS items it weighs most in.
+
+    Terms are weighed by ``document_frequency``, a ``(documents, {term:
+    count})`` pair, when the rows are only part of the listings.
+    """
+
+    def __init__(self, rows, tree, document_frequency=None):
+        self.items = {}
+        self.by_category = defaultdict(list)
+        term_counts = {}
+        for pk, category_id, price, name, description in rows:
+            self.items[pk] = (category_id, price_band(price))
+            self.by_category[category_id].append(pk)
+            term_counts[pk] = count_terms(name, description)
+        if document_frequency is None:
+            document_frequency = (len(term_counts), Counter(term for counts in term_counts.values() for term in counts))
+
+        self.vectors = {}
+        self.postings = defaultdict(list)
+        for pk, counts in term_counts.items():
+            vector = weigh_terms(counts, document_frequency)
+            self.vectors[pk] = vector
+            for term, weight in vector.items():
+                self.postings[term].append((weight, pk))
+        for term, postings in self.postings.items():
+            self.postings[term] = heapq.nlargest(MAX_POSTINGS, postings)
+
+        self.ancestors = {category_id: tree.ancestor_ids(category_id) for category_id in self.by_category}
+
+    def text_candidates(self, pk):
+        # The items closest in text, going by the (truncated) inverted index
+        scores = defaultdict(float)
+        for term, weight in self.vectors[pk].items():
+            for other_weight, other in self.postings.get(term, ()):
+                scores[other] += weight * other_weight
+        scores.pop(pk, None)
+        return heapq.nlargest(CANDIDATES_PER_SIGNAL, scores, key=scores.get)
+
+    def text_similarity(self, pk, other):
+        vector, other_vector = self.vectors[pk], self.vectors[other]
+        if len(other_vector) < len(vector):
+            vector, other_vector = other_vector, vector
+        return sum(weight * other_vector.get(term, 0) for term, weight in vector.items())
+
+    def category_similarity(self, pk, other):
+        category_id, other_category_id = self.items[pk][0], self.items[other][0]
+        if category_id == other_category_id:
+            return 1.0
+        ancestors = self.ancestors[category_id]
+        other_ancestors = self.ancestors[other_category_id]
+        # One inside the other, or siblings
+        if category_id in other_ancestors or other_category_id in ancestors:
+            return 0.5
+        if ancestors[1:2] and ancestors[1:2] == other_ancestors[1:2]:
+            return 0.5
+        return 0.0
+
+    def price_similarity(self, pk, other):
+        return max(0.0, 1 - abs(self.items[pk][1] - self.items[other][1]) / 4)
+
+
+def count_document_frequency():
+    from .models import Item
+
+    documents = 0
+    frequency = Counter()
+    for name, description in Item.objects.active().values_list('name', 'description').iterator(chunk_size=BATCH_SIZE):
+        documents += 1
+        frequency.update(count_terms(name, description).keys())
+    return documents, frequency
+
+
+def get_document_frequency():
+    return get_or_compute('related-items:document-frequency', count_document_frequency, DOCUMENT_FREQUENCY_TIMEOUT)
+
+
+def load_catalog(item_ids=None, linked=()):
+    """
+    Every listed item, or only what the lists of ``item_ids`` can be made
+    of: those items, the ``linked`` ones (shared favorites and views), the
+    most viewed listings of their categories and listings sharing one of
+    their heaviest terms.
+    """
+    from .models import Category, Item
+
+    tree = CategoryTree(list(Category.objects.all()))
+    listed = Item.objects.active().order_by('-views', '-id')
+    columns = ('pk', 'category_id', 'price', 'name', 'description')
+    if item_ids is None:
+        return Catalog(list(listed.values_list(*columns)), tree)
+
+    document_frequency = get_document_frequency()
+    changed = list(listed.filter(pk__in=item_ids).values_list('category_id', 'name', 'description'))
+    candidate_ids = {*item_ids, *linked}
+    for category_id in {category_id for category_id, name, description in changed}:
+        candidate_ids.update(
+            listed.filter(category_id=category_id).values_list('pk', flat=True)[:CANDIDATES_PER_SIGNAL + 1]
+        )
+    for category_id, name, description in changed:
+        vector = weigh_terms(count_terms(name, description), document_frequency)
+        terms = heapq.nlargest(MAX_QUERY_TERMS, vector, key=vector.get)
+        if terms:
+            candidate_ids.update(search_any_terms(listed, terms).values_list('pk', flat=True)[:MAX_POSTINGS])
+
+    rows = []
+    for chunk in _chunks(candidate_ids):
+        rows.extend(listed.filter(pk__in=chunk).values_list('views', *columns))
+    rows.sort(key=lambda row: (-row[0], -row[1]))
+    return Catalog([row[1:] for row in rows], tree, document_frequency)
+
+
+def _visitor_pairs(queryset, by_address):
+    # (item_id, visitor); anonymous views are told apart by IP address
+    if by_address:
+        for item_id, user_id, ip_address in queryset.values_list('item_id', 'user_id', 'ip_address'):
+            yield item_id, user_id or f'ip:{ip_address}'
+    else:
+        yield from queryset.values_list('item_id', 'user_id')
+
+
+def co_occurrence(model, item_ids):
+    """
+    Cosine similarity between each of ``item_ids`` and the items sharing
+    visitors with it in ``model`` (ItemFavorite or ItemView): the shared
+    visitors over the geometric mean of both items' visitor counts.
+    """
+    from .models import ItemView
+
+    by_address = model is ItemView
+    visitors_of = defaultdict(set)
+    for chunk in _chunks(item_ids):
+        for item_id, visitor in _visitor_pairs(model.objects.filter(item_id__in=chunk), by_address):
+            visitors_of[item_id].add(visitor)
+
+    visitors = set().union(*visitors_of.values())
+    users = [visitor for visitor in visitors if not isinstance(visitor, str)]
+    addresses = [visitor[3:] for visitor in visitors if isinstance(visitor, str)]
+    items_of = defaultdict(set)
+    for chunk in _chunks(users):
+        for item_id, visitor in _visitor_pairs(model.objects.filter(user_id__in=chunk), by_address):
+            items_of[visitor].add(item_id)
+    for chunk in _chunks(addresses):
+        for item_id, visitor in _visitor_pairs(model.objects.filter(user=None, ip_address__in=chunk), by_address):
+            items_of[visitor].add(item_id)
+    items_of = {visitor: items for visitor, items in items_of.items() if len(items) <= MAX_VISITOR_ITEMS}
+
+    totals = {}
+    for chunk in _chunks(set().union(*items_of.values())):
+        totals.update(
+            model.objects.filter(item_id__in=chunk).order_by().values_list('item_id').annotate(count=Count('id'))
+        )
+
+    similarities = {}
+    for item_id, item_visitors in visitors_of.items():
+        shared = Counter()
+        for visitor in item_visitors:
+            shared.update(items_of.get(visitor, ()))
+        shared.pop(item_id, None)
+        similarities[item_id] = {
+            other: count / math.sqrt(len(item_visitors) * max(totals.get(other, 0), count))
+            for other, count in shared.items()
+        }
+    return similarities
+
+
+def compute_related_items(item_ids, catalog=None):
+    """
+    The TOP_K best related listings for each of ``item_ids`` as
+    ``{item_id: [(related_id, score), ...]}``, best first. Items that aren't
+    listed get an empty list. Without a ``catalog`` only the candidates of
+    these items are loaded.
+    """
+    from .models import ItemFavorite, ItemView
+
+    favorites = co_occurrence(ItemFavorite, item_ids)
+    views = co_occurrence(ItemView, item_ids)
+    if catalog is None:
+        linked = set()
+        for similarities in (*favorites.values(), *views.values()):
+            linked.update(heapq.nlargest(CANDIDATES_PER_SIGNAL, similarities, key=similarities.get))
+        catalog = load_catalog(item_ids, linked)
+
+    related = {}
+    for pk in item_ids:
+        if pk not in catalog.items:
+            related[pk] = []
+            continue
+
+        item_favorites = favorites.get(pk, {})
+        item_views = views.get(pk, {})
+        candidates = set(catalog.text_candidates(pk))
+        candidates.update(heapq.nlargest(CANDIDATES_PER_SIGNAL, item_favorites, key=item_favorites.get))
+        candidates.update(heapq.nlargest(CANDIDATES_PER_SIGNAL, item_views, key=item_views.get))
+        candidates.update(catalog.by_category[catalog.items[pk][0]][:CANDIDATES_PER_SIGNAL + 1])
+        candidates.discard(pk)
+
+        scores = {}
+        for other in candidates:
+            if other not in catalog.items:
+                continue
+            scores[other] = (
+                WEIGHTS['favorites'] * item_favorites.get(other, 0) +
+                WEIGHTS['views'] * item_views.get(other, 0) +
+                WEIGHTS['text'] * catalog.text_similarity(pk, other) +
+                WEIGHTS['category'] * catalog.category_similarity(pk, other) +
+                WEIGHTS['price'] * catalog.price_similarity(pk, other)
+            )
+        # Ties go to the newer listing
+        related[pk] = heapq.nlargest(TOP_K, scores.items(), key=lambda entry: (entry[1], entry[0]))
+    return related
+
+
+def store_related_items(related, computed_at):
+    from .models import RelatedItem
+
+    with transaction.atomic():
+        for chunk in _chunks(related):
+            RelatedItem.objects.filter(item_id__in=chunk).delete()
+        RelatedItem.objects.bulk_create([
+            RelatedItem(item_id=pk, related_id=related_id, rank=rank, score=score, computed_at=computed_at)
+            for pk, entries in related.items()
+            for rank, (related_id, score) in enumerate(entries)
+        ], batch_size=BATCH_SIZE)
+
+
+def get_changed_item_ids(since):
+    """
+    Items whose lists may be out of date since ``since``: edited ones, ones
+    with new favorites or views, and those listing any of these.
+    """
+    from .models import Item, ItemFavorite, ItemView, RelatedItem
+
+    changed = set(Item.objects.filter(updated_at__gte=since).values_list('pk', flat=True))
+    changed.update(ItemFavorite.objects.filter(created_at__gte=since).values_list('item_id', flat=True))
+    changed.update(ItemView.objects.filter(timestamp__gte=since).values_list('item_id', flat=True))
+    for chunk in _chunks(changed):
+        changed.update(RelatedItem.objects.filter(related_id__in=chunk).values_list('item_id', flat=True))
+    return changed
+
+
+def refresh_related_items(full=False):
+    """
+    Recompute the related items lists of the items changed since the last
+    run, or of every listed item when ``full`` (or on the first run).
+    Removed favorites don't mark an item as changed, so a periodic full
+    run is still worthwhile. Returns the number of items refreshed.
+    """
+    from .models import Item, RelatedItem
+
+    started = timezone.now()
+    since = None if full else RelatedItem.objects.aggregate(since=Max('computed_at'))['since']
+    # A full run loads every listing once; an incremental one only each chunk's candidates
+    catalog = load_catalog() if since is None else None
+    item_ids = list(catalog.items) if since is None else sorted(get_changed_item_ids(since))
+
+    for chunk in _chunks(item_ids):
+        store_related_items(compute_related_items(chunk, catalog), started)
+    if full:
+        # Lists of items that are no longer listed
+        RelatedItem.objects.exclude(item__in=Item.objects.active()).delete()
+
+    bump_version('related-items')
+    return len(item_ids)
+
+
+def get_related_items(item, limit=3):
+    """
+    The first ``limit`` entries of the item's precomputed list, topped up
+    from its category while the list is short or hasn't been computed yet
+    (new listings until the next ``refresh_related_items`` run).
+    """
+    from .models import Item
+
+    related = list(Item.objects.public().related_to(item.pk)[:limit])
+    if len(related) < limit:
+        related += Item.objects.public().filter(category=item.category_id).exclude(
+            pk__in=[item.pk, *(other.pk for other in related)]
+        )[:limit - len(related)]
+    return related
@@ -0,0 +1,246 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+SEARCH_TABLE = 'item_search'
+MAX_SEARCH_TERMS = 10
+# Saves that leave these alone don't touch the index
+INDEXED_FIELDS = frozenset(['name', 'description', 'location'])
+
+TERM_RE = re.compile(r'\w+')
+
+
+def get_search_terms(query):
+    return TERM_RE.findall(query.lower())[:MAX_SEARCH_TERMS]
+
+
+class PostgresSearchBackend:
+    """
+    Ranks items against the weighted ``Item.search_vector`` column (GIN indexed)
+    and falls back to trigram similarity on the name for partial or misspelled words.
+    """
+
+    def get_search_vector(self, item=None):
+        def source(field):
+            # An item's own values, unlike its columns, can go into the INSERT or UPDATE that saves it
+            return field if item is None else Value(getattr(item, field) or '')
+
+        return (
+            SearchVector(source('name'), weight='A', config=SEARCH_CONFIG) +
+            SearchVector(source('description'), weight='B', config=SEARCH_CONFIG) +
+            SearchVector(source('location'), weight='C', config=SEARCH_CONFIG)
+        )
+
+    def prepare_item(self, item):
+        item.search_vector = self.get_search_vector(item)
+
+    def index_item(self, item, update_fields=None):
+        from .models import Item
+
+        if update_fields is None:
+            # Written with the row by prepare_item; leave the column to be loaded if it's ever read
+            item.__dict__.pop('search_vector', None)
+            return
+        Item.objects.filter(pk=item.pk).update(search_vector=self.get_search_vector())
+
+    def unindex_items(self, item_ids):
+        # The vector lives on the item row itself and goes away with it
+        pass
+
+    def rebuild(self):
+        from .models import Item
+
+        return Item.objects.update(search_vector=self.get_search_vector())
+
+    def get_search_query(self, terms):
+        # Prefix matching on every term so results show up while the user is still typing
+        return SearchQuery(
+            ' & '.join(f'{term}:*' for term in terms),
+            search_type='raw',
+            config=SEARCH_CONFIG,
+        )
+
+    def search(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            return queryset
+
+        return queryset.filter(
+            Q(search_vector=self.get_search_query(terms)) | Q(name__trigram_similar=query)
+        )
+
+    def search_any(self, queryset, terms):
+        return queryset.filter(
+            # Weights A and B are the name and the description
+            search_vector=SearchQuery(' | '.join(f'{term}:AB' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+        )
+
+    def rank(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), self.get_search_query(terms)) + TrigramSimilarity('name', query)
+        )
+
+
+class SQLiteSearchBackend:
+    """
+    Keeps an FTS5 virtual table keyed by item id in step with ``Item`` and
+    ranks matches with bm25, weighting name over description over location.
+    """
+
+    match_sql = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+    # bm25() only works in a MATCH query. LIMIT -1 keeps SQLite from flattening the
+    # scores into a MATCH per item: they are computed once and looked up by rowid
+    rank_sql = (
+        f'SELECT score FROM (SELECT rowid AS item_id, -bm25({SEARCH_TABLE}, 10.0, 5.0, 2.0) AS score '
+        f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s LIMIT -1) WHERE item_id = item_item.id'
+    )
+
+    def prepare_item(self, item):
+        pass
+
+    def index_item(self, item, update_fields=None):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [item.pk])
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, location) VALUES (%s, %s, %s, %s)',
+                [item.pk, item.name, item.description or '', item.location or ''],
+            )
+
+    def unindex_items(self, item_ids):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({', '.join(['%s'] * len(item_ids))})", list(item_ids),
+            )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, location) '
+                f"SELECT id, name, COALESCE(description, ''), location FROM item_item"
+            )
+            return cursor.rowcount
+
+    def get_match_expression(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def search(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            return queryset
+
+        # A single MATCH subquery keeps counts and non-relevance sorts cheap
+        return queryset.filter(id__in=RawSQL(self.match_sql, [self.get_match_expression(terms)]))
+
+    def search_any(self, queryset, terms):
+        any_term = ' OR '.join(f'"{term}"' for term in terms)
+        return queryset.filter(id__in=RawSQL(self.match_sql, [f'{{name description}} : ({any_term})']))
+
+    def rank(self, queryset, query):
+        terms = get_search_terms(query)
+        if not terms:
+            return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+        # Ranked items are the ones search() matched, so every item finds its row
+        return queryset.annotate(
+            rank=RawSQL(self.rank_sql, [self.get_match_expression(terms)], output_field=FloatField())
+        )
+
+
+class FallbackSearchBackend:
+    """
+    Substring matching for databases without a full-text engine.
+    """
+
+    def prepare_item(self, item):
+        pass
+
+    def index_item(self, item, update_fields=None):
+        pass
+
+    def unindex_items(self, item_ids):
+        pass
+
+    def rebuild(self):
+        return 0
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(location__icontains=query)
+        )
+
+    def search_any(self, queryset, terms):
+        matches = Q()
+        for term in terms:
+            matches |= Q(name__icontains=term) | Q(description__icontains=term)
+        return queryset.filter(matches)
+
+    def rank(self, queryset, query):
+        return queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_search_backend():
+    return BACKENDS.get(connection.vendor, FallbackSearchBackend)()
+
+
+def search_items(queryset, query):
+    return get_search_backend().search(queryset, query)
+
+
+def search_any_terms(queryset, terms):
+    """
+    The items of ``queryset`` whose name or description contains any of
+    ``terms``, which are plain lowercase words.
+    """
+    return get_search_backend().search_any(queryset, terms)
+
+
+def rank_items(queryset, query):
+    """
+    Annotate each item in ``queryset`` with a ``rank`` against ``query``,
+    where higher means more relevant. Apply only when ordering by relevance.
+    """
+    return get_search_backend().rank(queryset, query)
+
+
+def prepare_item(item):
+    """
+    Set up a full save of ``item`` to write its search data with the row,
+    where the backend keeps it there.
+    """
+    get_search_backend().prepare_item(item)
+
+
+def index_item(item, update_fields=None):
+    if update_fields is not None and not INDEXED_FIELDS.intersection(update_fields):
+        return
+    get_search_backend().index_item(item, update_fields)
+
+
+def unindex_item(item_id):
+    unindex_items([item_id])
+
+
+def unindex_items(item_ids):
+    if item_ids:
+        get_search_backend().unindex_items(item_ids)
+
+
+def rebuild_search_index():
+    return get_search_backend().rebuild()
@@ -0,0 +1,108 @@
+from types import SimpleNamespace
+
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from core.cache import bump_version
+
+from .autocomplete import record_item_change
+from .categories import adjust_category_counts, counted_category_id, refresh_category_counts
+from .geo import locate
+from .models import Category, Item, default_expiry
+from .search import index_item, prepare_item, unindex_item
+
+# Marks an item loaded without the fields its counted category depends on
+UNKNOWN = object()
+COUNTED_FIELDS = frozenset(['status', 'admin_approved', 'category_id'])
+
+def loaded_values(instance):
+    # The item's values as loaded from the database, by attname; empty for one built in code
+    field_names, values = instance.__dict__.get('_loaded_row', ((), ()))
+    return dict(zip(field_names, values))
+
+def loaded_status(instance):
+    # As loaded, until a save renews it
+    if '_loaded_status' in instance.__dict__:
+        return instance._loaded_status
+    return loaded_values(instance).get('status')
+
+def loaded_counted_category_id(instance):
+    # As loaded, until a save records the new one
+    if '_counted_category_id' in instance.__dict__:
+        return instance._counted_category_id
+    values = loaded_values(instance)
+    if not COUNTED_FIELDS.issubset(values):
+        return UNKNOWN
+    return counted_category_id(SimpleNamespace(**values))
+
+@receiver(pre_save, sender=Item)
+def locate_item(sender, instance, update_fields=None, **kwargs):
+    # Saves of other fields leave the coordinates as they are
+    if update_fields is not None and 'location' not in update_fields:
+        return
+    instance.latitude, instance.longitude, instance.geohash = locate(instance.location)
+
+@receiver(pre_save, sender=Item)
+def renew_listing(sender, instance, update_fields=None, **kwargs):
+    # A listing put back on the market gets a new listing period, or the next lifecycle run expires it again
+    if update_fields is not None and 'expires_at' not in update_fields:
+        return
+    if instance.status == 'active' and loaded_status(instance) not in (None, 'active'):
+        instance.expires_at = default_expiry()
+    instance._loaded_status = instance.status
+
+@receiver(pre_save, sender=Item)
+def prepare_search_index(sender, instance, update_fields=None, **kwargs):
+    # Saves of some fields only update the index afterwards, if they touched it at all
+    if update_fields is None:
+        prepare_item(instance)
+
+@receiver(post_save, sender=Item)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    index_item(instance, update_fields)
+
+@receiver(post_delete, sender=Item)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_item(instance.pk)
+
+@receiver(post_save, sender=Item)
+def update_autocomplete(sender, instance, **kwargs):
+    record_item_change(instance)
+
+@receiver(post_delete, sender=Item)
+def remove_from_autocomplete(sender, instance, **kwargs):
+    record_item_change(instance, deleted=True)
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_item_fragments(sender, **kwargs):
+    bump_version('item')
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_fragments(sender, **kwargs):
+    bump_version('category')
+
+@receiver(post_save, sender=Item)
+def update_category_counts(sender, instance, created, **kwargs):
+    previous = None if created else loaded_counted_category_id(instance)
+    current = counted_category_id(instance)
+    if previous is UNKNOWN:
+        refresh_category_counts()
+    else:
+        adjust_category_counts(previous, current)
+    instance._counted_category_id = current
+
+@receiver(post_delete, sender=Item)
+def remove_from_category_counts(sender, instance, **kwargs):
+    previous = loaded_counted_category_id(instance)
+    if previous is UNKNOWN:
+        refresh_category_counts()
+    else:
+        adjust_category_counts(previous, None)
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def recount_categories(sender, **kwargs):
+    # Moving a category changes the totals of every ancestor, so recount all of them
+    refresh_category_counts()
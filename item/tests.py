@@ -1,3 +1,470 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models.signals import post_init
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from conversation.threads import start_conversation
+from core.factories import create_users
+
+from .autocomplete import get_index
+from .categories import get_category_tree
+from .counters import apply_pending, increment, rollup_counters
+from .geo import covering_cells, get_gazetteer
+from .images import process_pending_images
+from .lifecycle import run_lifecycle
+from .models import (
+    ArchivedItem, ArchivedItemView, Category, Item, ItemCounterShard, ItemFavorite, ItemImage, ItemView, RelatedItem,
+)
+from .recommendations import compute_related_items, get_related_items, load_catalog, refresh_related_items
+from .search import SEARCH_TABLE, rank_items, rebuild_search_index, search_items
+from .tracking import flush_view_buffer, get_view_buffer, record_view, save_views
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    VIEW_TRACKING_BUFFER='memory',
+    VIEW_TRACKING_FLUSH_INTERVAL=0,
+    BACKGROUND_TASKS_EAGER=True,
+)
+class ItemTestCase(TestCase):
+    """
+    A seller, a buyer and two categories. Cached fragments, the category tree
+    and the autocomplete index would outlive each test's rollback, so the
+    cache is cleared before every test.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller, cls.buyer = create_users(2, prefix='item-tests')
+        cls.furniture = Category.objects.create(name='Furniture', slug='furniture')
+        cls.clothing = Category.objects.create(name='Clothing', slug='clothing')
+
+    def setUp(self):
+        cache.clear()
+        # Views recorded by earlier tests name items that were rolled back, whose ids get reused
+        buffer = get_view_buffer()
+        buffer.pop_batch(len(buffer))
+
+    def create_item(self, name, category=None, **fields):
+        fields.setdefault('price', 100)
+        return Item.objects.create(name=name, category=category or self.furniture, created_by=self.seller, **fields)
+
+
+class ViewTrackingTests(ItemTestCase):
+    def test_views_are_buffered_and_counted_once_per_viewer(self):
+        item = self.create_item('Wooden chair')
+        for user_id, ip_address in [
+            (None, '10.0.0.1'), (None, '10.0.0.1'), (self.buyer.pk, '10.0.0.1'),
+            (None, ' 2001:DB8::1'), (None, 'not an address'), (None, None),
+        ]:
+            record_view(item.pk, user_id, ip_address)
+
+        self.assertEqual(flush_view_buffer(), 4)
+        item.refresh_from_db()
+        self.assertEqual(item.views, 4)
+        self.assertEqual(
+            set(ItemView.objects.filter(item=item).values_list('ip_address', flat=True)),
+            {'10.0.0.1', '2001:db8::1', '0.0.0.0'},
+        )
+
+        # Viewers already stored aren't counted again, even when another flush stored them meanwhile
+        record_view(item.pk, None, '10.0.0.1')
+        self.assertEqual(flush_view_buffer(), 0)
+        ItemView.objects.create(item=item, user=self.seller, ip_address='10.0.0.9')
+        self.assertEqual(save_views([(item.pk, self.seller.pk, '10.0.0.9'), (item.pk, None, '10.0.0.3')]), 1)
+        self.assertEqual(Item.objects.get(pk=item.pk).views, 5)
+
+    def test_a_bad_event_does_not_lose_the_rest_of_its_batch(self):
+        item = self.create_item('Wooden chair')
+        record_view(item.pk, None, '10.0.0.1')
+        # As written to a shared buffer before addresses were checked
+        get_view_buffer().append((item.pk, None, None))
+        record_view(item.pk, None, '10.0.0.2')
+
+        self.assertEqual(flush_view_buffer(), 2)
+        self.assertEqual(
+            set(ItemView.objects.filter(item=item).values_list('ip_address', flat=True)), {'10.0.0.1', '10.0.0.2'}
+        )
+        self.assertEqual(Item.objects.get(pk=item.pk).views, 2)
+        self.assertEqual(len(get_view_buffer()), 0)
+
+
+class SearchTests(ItemTestCase):
+    def search(self, query):
+        return list(rank_items(search_items(Item.objects.all(), query), query).order_by('-rank').values_list('name', flat=True))
+
+    def test_matches_are_ranked_by_field(self):
+        self.create_item('Sofa', location='Chair Street')
+        self.create_item('Wooden table', description='Comes with a matching chair')
+        self.create_item('Office chair')
+        self.create_item('Red lamp')
+
+        self.assertEqual(self.search('chair'), ['Office chair', 'Wooden table', 'Sofa'])
+        # Words still being typed match as prefixes
+        self.assertEqual(self.search('offi cha'), ['Office chair'])
+
+    def test_index_follows_saves_and_deletes(self):
+        item = self.create_item('Office chair')
+        item.name = 'Office desk'
+        item.save()
+        self.assertEqual((self.search('chair'), self.search('desk')), ([], ['Office desk']))
+
+        # Saves of other fields leave the index alone
+        with CaptureQueriesContext(connection) as queries:
+            item.price = 80
+            item.save(update_fields=['price'])
+        self.assertFalse([query for query in queries if SEARCH_TABLE in query['sql']])
+        item.description = 'Height adjustable'
+        item.save(update_fields=['description'])
+        self.assertEqual(self.search('adjustable'), ['Office desk'])
+
+        item.delete()
+        self.assertEqual(self.search('desk'), [])
+
+    def test_rebuild_indexes_every_item(self):
+        self.create_item('Office chair')
+        self.create_item('Office desk')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        self.assertEqual(self.search('office'), [])
+
+        self.assertEqual(rebuild_search_index(), 2)
+        self.assertEqual(sorted(self.search('office')), ['Office chair', 'Office desk'])
+
+
+class CounterTests(ItemTestCase):
+    def test_favorites_are_counted_in_shards_and_rolled_up(self):
+        item = self.create_item('Wooden chair')
+        favorite_url = reverse('accounts:toggle_favorite', kwargs={'item_id': item.pk})
+        for count, user in enumerate(create_users(2, prefix='collector'), start=1):
+            self.client.force_login(user)
+            self.assertEqual(self.client.post(favorite_url).json(), {'favorited': True, 'favorites_count': count})
+
+        # Unfavoriting decrements, and the item row isn't written until the rollup
+        response = self.client.post(favorite_url).json()
+        self.assertEqual(response, {'favorited': False, 'favorites_count': 1})
+        self.assertEqual(Item.objects.get(pk=item.pk).favorites, 0)
+        self.assertEqual(apply_pending([Item.objects.get(pk=item.pk)])[0].favorites, 1)
+
+        self.assertEqual(rollup_counters(), 1)
+        self.assertEqual(Item.objects.get(pk=item.pk).favorites, 1)
+        self.assertFalse(ItemCounterShard.objects.exists())
+        self.assertEqual(rollup_counters(), 0)
+
+    def test_increments_share_a_shard_and_never_go_below_zero(self):
+        item = self.create_item('Wooden chair')
+        with self.settings(ITEM_COUNTER_SHARDS=1):
+            for amount in [2, 3, -1]:
+                increment(item.pk, 'views', amount)
+        self.assertEqual(list(ItemCounterShard.objects.values_list('field', 'delta')), [('views', 4)])
+
+        increment(item.pk, 'favorites', -2)
+        self.assertEqual(apply_pending([Item.objects.get(pk=item.pk)])[0].favorites, 0)
+        self.assertEqual(rollup_counters(), 1)
+        item.refresh_from_db()
+        self.assertEqual((item.views, item.favorites), (4, 0))
+
+
+class CategoryTreeTests(ItemTestCase):
+    def test_category_counts_follow_item_changes(self):
+        parent = Category.objects.create(name='Parent', slug='parent')
+        child = Category.objects.create(name='Child', slug='child', parent=parent)
+        item = self.create_item('Counted item', category=child)
+
+        tree = get_category_tree()
+        self.assertEqual(tree.get(child.pk).active_items_count, 1)
+        self.assertEqual(tree.get(parent.pk).total_active_items_count, 1)
+
+        item.status = 'sold'
+        item.save()
+        self.assertEqual(get_category_tree().get(parent.pk).total_active_items_count, 0)
+
+        # Loaded items compare against the row they came from; nothing runs as they are built
+        self.assertFalse(post_init.has_listeners(Item))
+        loaded = Item.objects.get(pk=item.pk)
+        loaded.status = 'active'
+        loaded.save()
+        self.assertEqual(get_category_tree().get(parent.pk).total_active_items_count, 1)
+        Item.objects.defer('status', 'admin_approved').get(pk=item.pk).delete()
+        self.assertEqual(get_category_tree().get(parent.pk).total_active_items_count, 0)
+
+        self.client.get(reverse('core:index'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('core:index'))
+            get_category_tree()
+
+        # A process that missed a version bump still rebuilds the tree once it is old enough
+        Category.objects.filter(pk=child.pk).update(name='Renamed')
+        self.assertEqual(get_category_tree().get(child.pk).name, 'Child')
+        with self.settings(PROCESS_CACHE_MAX_AGE=-1):
+            self.assertEqual(get_category_tree().get(child.pk).name, 'Renamed')
+
+
+class ItemImageTests(ItemTestCase):
+    def test_uploaded_images_get_responsive_variants(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+
+        upload = BytesIO()
+        Image.new('RGB', (1600, 1200), 'orange').save(upload, 'JPEG')
+
+        self.client.force_login(self.seller)
+        with self.settings(MEDIA_ROOT=media_root), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('item:new'), {
+                'category': self.furniture.pk,
+                'name': 'Photographed item',
+                'price': '100',
+                'condition': 'good',
+                'image': SimpleUploadedFile('photo.jpg', upload.getvalue(), content_type='image/jpeg'),
+            })
+        self.assertEqual(response.status_code, 302)
+
+        image = ItemImage.objects.get(item__name='Photographed item')
+        self.assertEqual((image.status, image.width, image.height), ('ready', 1600, 1200))
+        self.assertEqual(image.variant('card', 'webp')['width'], 480)
+        self.assertEqual(image.variant('thumb', 'webp')['height'], 120)
+        self.assertIn('480w', image.srcset('webp'))
+
+        with self.settings(MEDIA_ROOT=media_root):
+            response = self.client.get(reverse('item:items') + '?query=photographed')
+        self.assertContains(response, '<source type="image/webp"')
+
+    def test_a_broken_upload_does_not_hold_up_the_queue(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+
+        upload = BytesIO()
+        Image.new('RGB', (640, 480), 'orange').save(upload, 'JPEG')
+        item = self.create_item('Photographed item')
+
+        with self.settings(MEDIA_ROOT=media_root):
+            broken = ItemImage.objects.create(item=item, position=0, original=SimpleUploadedFile('broken.jpg', b'not a photo'))
+            good = ItemImage.objects.create(item=item, position=1, original=SimpleUploadedFile('photo.jpg', upload.getvalue()))
+            with self.assertLogs('item.images', 'ERROR'):
+                self.assertEqual(process_pending_images(), (1, 1))
+
+        statuses = dict(ItemImage.objects.values_list('pk', 'status'))
+        self.assertEqual((statuses[broken.pk], statuses[good.pk]), ('failed', 'ready'))
+
+
+class RelatedItemTests(ItemTestCase):
+    def test_related_items_are_precomputed_and_refreshed(self):
+        chair = self.create_item('Wooden chair')
+        self.create_item('Wooden table')
+        self.create_item('Red chair')
+        jacket = self.create_item('Leather jacket', category=self.clothing)
+        lamps = Category.objects.create(name='Lighting', slug='lighting')
+        self.create_item('Brass lamp', category=lamps)
+        self.create_item('Brass lantern', category=lamps)
+
+        # Until the first run the detail page shows other listings of the category
+        response = self.client.get(reverse('item:detail', kwargs={'pk': chair.pk}))
+        self.assertContains(response, 'Wooden table')
+        self.assertEqual({item.name for item in get_related_items(chair)}, {'Wooden table', 'Red chair'})
+
+        self.assertEqual(refresh_related_items(full=True), 6)
+        related_ids = list(RelatedItem.objects.filter(item=chair).values_list('related_id', flat=True))
+        self.assertTrue(related_ids)
+        self.assertNotIn(chair.pk, related_ids)
+        self.assertNotIn(jacket.pk, related_ids)
+        self.assertEqual([item.pk for item in get_related_items(chair)], related_ids[:3])
+
+        # Items favorited by the same people become related on the next incremental run,
+        # which leaves the lamps alone
+        for user in create_users(3, prefix='collector'):
+            ItemFavorite.objects.bulk_create([ItemFavorite(item=chair, user=user), ItemFavorite(item=jacket, user=user)])
+        self.assertLess(refresh_related_items(), 6)
+        self.assertIn(jacket.pk, RelatedItem.objects.filter(item=chair).values_list('related_id', flat=True))
+
+    def test_incremental_runs_only_load_the_candidates(self):
+        chair = self.create_item('Wooden chair')
+        table = self.create_item('Wooden table')
+        red_chair = self.create_item('Red chair', category=self.clothing)
+        self.create_item('Leather jacket', category=self.clothing)
+        lamps = Category.objects.create(name='Lighting', slug='lighting')
+        self.create_item('Brass lamp', category=lamps)
+        refresh_related_items(full=True)
+
+        # The category's listings and those sharing a term, not the lamps or the jacket
+        catalog = load_catalog([chair.pk])
+        self.assertEqual(set(catalog.items), {chair.pk, table.pk, red_chair.pk})
+        self.assertEqual(compute_related_items([chair.pk]), compute_related_items([chair.pk], load_catalog()))
+
+
+class LifecycleTests(ItemTestCase):
+    def test_lifecycle_expires_listings_and_archives_old_rows(self):
+        now = timezone.now()
+        listed = self.create_item('Listed lamp')
+        expiring = self.create_item('Expiring lamp', expires_at=now - timedelta(days=1))
+        sold = self.create_item('Sold lamp', status='sold')
+        ItemView.objects.create(item=sold, ip_address='10.0.0.1')
+        ItemFavorite.objects.create(item=sold, user=self.buyer)
+        RelatedItem.objects.create(item=listed, related=sold, rank=0, score=1)
+        # Archiving would delete the conversation with it
+        discussed = self.create_item('Discussed lamp', status='sold')
+        start_conversation(discussed, self.buyer, 'Did it sell?')
+
+        left_market = now - timedelta(days=settings.ITEM_ARCHIVE_AFTER_DAYS + 1)
+        Item.objects.filter(pk__in=[sold.pk, discussed.pk]).update(updated_at=left_market)
+        ItemView.objects.bulk_create([ItemView(item=listed, ip_address=f'10.0.1.{number}') for number in range(7)])
+        aged_views = list(ItemView.objects.filter(item=listed).values_list('pk', flat=True)[:5])
+        ItemView.objects.filter(pk__in=aged_views).update(
+            timestamp=now - timedelta(days=settings.ITEM_VIEW_RETENTION_DAYS + 1)
+        )
+
+        self.assertEqual(run_lifecycle(now), {'expired': 1, 'archived_items': 1, 'archived_views': 5})
+        self.assertEqual(Item.objects.get(pk=expiring.pk).status, 'expired')
+        self.assertEqual(Category.objects.get(pk=self.furniture.pk).active_items_count, 1)
+
+        self.assertFalse(Item.objects.filter(pk=sold.pk).exists())
+        self.assertEqual(ArchivedItem.objects.get(pk=sold.pk).data['name'], 'Sold lamp')
+        self.assertEqual(ArchivedItemView.objects.filter(item_id=sold.pk).count(), 1)
+        self.assertFalse(ItemFavorite.objects.filter(item_id=sold.pk).exists())
+        self.assertFalse(RelatedItem.objects.filter(item=listed).exists())
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {SEARCH_TABLE} WHERE rowid = %s', [sold.pk])
+            self.assertEqual(cursor.fetchone()[0], 0)
+        self.assertTrue(Item.objects.filter(pk=discussed.pk).exists())
+        self.assertFalse(ItemView.objects.filter(pk__in=aged_views).exists())
+        self.assertEqual(ItemView.objects.filter(item=listed).count(), 2)
+
+        self.assertEqual(run_lifecycle(now), {'expired': 0, 'archived_items': 0, 'archived_views': 0})
+
+    def test_relisting_an_expired_listing_renews_it(self):
+        now = timezone.now()
+        lamp = self.create_item('Expiring lamp', expires_at=now - timedelta(days=1))
+        run_lifecycle(now)
+
+        self.client.force_login(self.seller)
+        response = self.client.post(reverse('item:edit', kwargs={'pk': lamp.pk}), {
+            'category': self.furniture.pk, 'name': 'Expiring lamp', 'price': '100', 'condition': 'good',
+            'pickup_available': 'on', 'status': 'active',
+        })
+        self.assertEqual(response.status_code, 302)
+        lamp.refresh_from_db()
+        self.assertEqual(lamp.status, 'active')
+        self.assertGreater(lamp.expires_at, now + timedelta(days=settings.ITEM_LISTING_DAYS - 1))
+        self.assertEqual(run_lifecycle(now)['expired'], 0)
+
+        # Edits that leave it on the market keep its listing period
+        expires_at = lamp.expires_at
+        lamp.name = 'Brass lamp'
+        lamp.save()
+        self.assertEqual(Item.objects.get(pk=lamp.pk).expires_at, expires_at)
+
+
+class FacetTests(ItemTestCase):
+    def test_facet_counts_follow_the_other_filters(self):
+        chairs = Category.objects.create(name='Chairs', slug='chairs', parent=self.furniture)
+        listings = [
+            ('new', True, True, chairs), ('new', True, False, self.furniture), ('good', True, True, chairs),
+            ('good', False, True, self.clothing), ('fair', True, False, self.clothing), ('fair', False, True, chairs),
+        ]
+        for number, (condition, delivery, pickup, category) in enumerate(listings):
+            self.create_item(
+                f'Listing {number}', category=category, condition=condition, price=500 * (number + 1),
+                delivery_available=delivery, pickup_available=pickup,
+            )
+
+        url = reverse('item:items')
+        response = self.client.get(url, {'condition': ['new', 'good'], 'delivery_available': 'on'})
+        facets = response.context['facets']
+
+        items = Item.objects.active()
+        selected = items.filter(condition__in=['new', 'good'], delivery_available=True)
+        self.assertEqual(facets['total'], 3)
+        self.assertEqual(sum(option['count'] for option in facets['prices']), 3)
+
+        # Each facet is counted against the other facets' filters
+        conditions = {option['value']: option['count'] for option in facets['conditions']}
+        self.assertEqual(conditions['fair'], 1)
+        flags = {option['field']: option['count'] for option in facets['flags']}
+        self.assertEqual(flags['delivery_available'], 3)
+        self.assertEqual(flags['pickup_available'], 2)
+        tree = get_category_tree()
+        for option in facets['categories']:
+            self.assertEqual(
+                option['count'], selected.filter(category__in=tree.descendant_ids(option['category'].pk)).count()
+            )
+
+        # The same pre-facet filters reuse the cached groups
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'condition': 'fair', 'query': '  '})
+        self.assertFalse([query for query in queries if 'GROUP BY' in query['sql']])
+
+
+class NearbySearchTests(ItemTestCase):
+    def test_nearby_search_matches_places_within_the_radius(self):
+        gazetteer = get_gazetteer()
+        self.assertEqual(gazetteer.lookup('Westlands, Nairobi').name, 'Westlands')
+        self.assertEqual(gazetteer.lookup('nairobi cbd').name, 'Nairobi CBD')
+        self.assertIsNone(gazetteer.lookup('Atlantis'))
+
+        for location in ['Nairobi', 'Nairobi CBD', 'Westlands', 'Mombasa', 'Kisumu']:
+            self.create_item(f'Chair in {location}', location=location)
+
+        # Saving an item locates it
+        item = self.create_item('Located item', location='Near Sarit Centre, Westlands')
+        self.assertTrue(item.geohash)
+        self.assertTrue(any(item.geohash.startswith(cell) for cell in covering_cells(-1.2864, 36.8172, 20)))
+
+        # A place name matches listings in and around it, not only those naming it
+        url = reverse('item:items')
+        response = self.client.get(url, {'location': 'Nairobi', 'sort_by': 'distance'})
+        self.assertEqual(response.context['total_items'], 4)
+        distances = [item.distance for item in response.context['items']]
+        self.assertEqual(distances, sorted(distances))
+
+        # A smaller radius around the browser's position, which leaves out Westlands
+        response = self.client.get(url, {'lat': '-1.2841', 'lng': '36.8235', 'radius': '2'})
+        self.assertEqual(response.context['total_items'], 2)
+
+        # Unknown places still match by name
+        response = self.client.get(url, {'location': 'Atlantis', 'sort_by': 'distance'})
+        self.assertEqual(response.context['total_items'], 0)
+
+
+class AutocompleteTests(ItemTestCase):
+    def test_autocomplete_follows_item_changes_without_queries(self):
+        for name, views, location in [
+            ('Wooden chair', 50, 'Mombasa'), ('Wooden table', 20, 'Nairobi'),
+            ('Red chair', 30, 'Mombasa'), ('Leather chair', 10, 'Kisumu'),
+        ]:
+            self.create_item(name, views=views, location=location)
+
+        url = reverse('item:autocomplete')
+        self.client.get(url, {'q': 'wooden'})
+
+        with self.assertNumQueries(0):
+            suggestions = self.client.get(url, {'q': 'wooden'}).json()['suggestions']
+        self.assertEqual([suggestion['text'] for suggestion in suggestions], ['Wooden chair', 'Wooden table'])
+        # Suggestions match any word of a name, most viewed first
+        texts = [suggestion['text'] for suggestion in self.client.get(url, {'q': 'chai'}).json()['suggestions']]
+        self.assertEqual(texts, ['Wooden chair', 'Red chair', 'Leather chair'])
+        locations = self.client.get(url, {'q': 'mom'}).json()['suggestions']
+        self.assertEqual(locations[0], {'text': 'Mombasa', 'kind': 'location', 'url': '/items/?location=Mombasa&sort_by=distance'})
+
+        # Changes reach the index through the change log once they commit
+        with self.captureOnCommitCallbacks(execute=True):
+            item = self.create_item('Zanzibar hammock', views=10 ** 6)
+        with self.assertNumQueries(0):
+            suggestions = self.client.get(url, {'q': 'hamm'}).json()['suggestions']
+        self.assertEqual(suggestions[0]['url'], reverse('item:detail', kwargs={'pk': item.pk}))
+
+        item.status = 'sold'
+        with self.captureOnCommitCallbacks(execute=True):
+            item.save()
+        self.assertEqual(self.client.get(url, {'q': 'zanzibar'}).json()['suggestions'], [])
+        self.assertIs(get_index(), get_index())
@@ -0,0 +1,207 @@
+import atexit
+import ipaddress
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from core.cache import bump_version
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 1000
+# Stored for viewers whose address is missing or isn't one (X-Forwarded-For is whatever the client sent)
+UNKNOWN_IP_ADDRESS = '0.0.0.0'
+
+
+class MemoryViewBuffer:
+    """
+    Per-process buffer, flushed by a background thread every
+    ``VIEW_TRACKING_FLUSH_INTERVAL`` seconds (0 disables the thread). The
+    thread also rolls up the item counter shards.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.events = []
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def append(self, event):
+        with self.lock:
+            self.events.append(event)
+            if self.thread is None and self.interval:
+                self.thread = threading.Thread(target=self.run, name='view-tracking-flusher', daemon=True)
+                self.thread.start()
+                atexit.register(self.flush_safely)
+
+    def pop_batch(self, size):
+        with self.lock:
+            batch = self.events[:size]
+            del self.events[:size]
+        return batch
+
+    def __len__(self):
+        return len(self.events)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush_safely()
+
+    def flush_safely(self):
+        from .counters import rollup_counters
+
+        try:
+            flush_view_buffer()
+            rollup_counters()
+        except Exception:
+            logger.exception('Flushing buffered item views failed')
+        finally:
+            close_old_connections()
+
+
+class RedisViewBuffer:
+    """
+    Shared buffer in a Redis list, flushed by ``manage.py flush_item_views``.
+    """
+
+    key = 'item:view-events'
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    def append(self, event):
+        self.client.rpush(self.key, json.dumps(event))
+
+    def pop_batch(self, size):
+        # LRANGE + LTRIM in one transaction so concurrent flushers never see the same events
+        pipeline = self.client.pipeline()
+        pipeline.lrange(self.key, 0, size - 1)
+        pipeline.ltrim(self.key, size, -1)
+        events, _ = pipeline.execute()
+        return [tuple(json.loads(event)) for event in events]
+
+    def __len__(self):
+        return self.client.llen(self.key)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    global _buffer
+
+    with _buffer_lock:
+        if _buffer is None:
+            if settings.VIEW_TRACKING_BUFFER == 'redis':
+                _buffer = RedisViewBuffer(settings.VIEW_TRACKING_REDIS_URL)
+            else:
+                _buffer = MemoryViewBuffer(settings.VIEW_TRACKING_FLUSH_INTERVAL)
+    return _buffer
+
+
+def clean_ip_address(ip_address):
+    try:
+        return str(ipaddress.ip_address((ip_address or '').strip()))
+    except ValueError:
+        return UNKNOWN_IP_ADDRESS
+
+
+def record_view(item_id, user_id, ip_address):
+    get_view_buffer().append((item_id, user_id, clean_ip_address(ip_address)))
+
+
+def inserted_views(views):
+    """
+    The ``(item_id, user_id, ip_address)`` events of the ItemViews just
+    given to ``bulk_create(ignore_conflicts=True)`` that were inserted. A
+    view skipped as a duplicate finds a row stored with another timestamp.
+    """
+    from .models import ItemView
+
+    given = {(view.item_id, view.user_id, view.ip_address, view.timestamp) for view in views}
+    rows = ItemView.objects.filter(
+        item_id__in={view.item_id for view in views},
+        ip_address__in={view.ip_address for view in views},
+    ).values_list('item_id', 'user_id', 'ip_address', 'timestamp')
+    return {row[:3] for row in rows if row in given}
+
+
+def save_views(events):
+    """
+    Store a batch of ``(item_id, user_id, ip_address)`` events: one ItemView
+    per distinct viewer and a single UPDATE adding each item's new viewers to
+    ``Item.views``. Returns the number of new ItemView rows.
+    """
+    from .models import Item, ItemView
+
+    events = set(events)
+    if not events:
+        return 0
+
+    with transaction.atomic():
+        # Items deleted since the view was recorded are dropped
+        live_item_ids = set(
+            Item.objects.filter(pk__in={item_id for item_id, user_id, ip_address in events}).values_list('pk', flat=True)
+        )
+        views = [
+            ItemView(item_id=item_id, user_id=user_id, ip_address=ip_address)
+            for item_id, user_id, ip_address in events if item_id in live_item_ids
+        ]
+        if not views:
+            return 0
+
+        # The unique constraints skip viewers already stored, by this flush or a concurrent one
+        ItemView.objects.bulk_create(views, ignore_conflicts=True)
+        new_events = inserted_views(views)
+
+        increments = {}
+        for item_id, user_id, ip_address in new_events:
+            increments[item_id] = increments.get(item_id, 0) + 1
+
+        if increments:
+            Item.objects.filter(pk__in=increments).update(
+                views=F('views') + Case(
+                    *[When(pk=item_id, then=Value(count)) for item_id, count in increments.items()],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+            # The counters change without updated_at, so API validators watch this version
+            bump_version('item-counts')
+
+    return len(new_events)
+
+
+def save_views_one_by_one(events):
+    # After a batch failed: the events that can be stored still are, the others are dropped
+    saved = 0
+    for event in events:
+        try:
+            saved += save_views([event])
+        except DatabaseError:
+            logger.exception('Dropping item view %r', event)
+    return saved
+
+
+def flush_view_buffer(batch_size=FLUSH_BATCH_SIZE):
+    buffer = get_view_buffer()
+    saved = 0
+    while True:
+        batch = buffer.pop_batch(batch_size)
+        if not batch:
+            return saved
+        try:
+            saved += save_views(batch)
+        except DatabaseError:
+            # The batch is already out of the buffer, so one bad event must not take the rest with it
+            logger.warning('Saving %s item views failed, retrying them one by one', len(batch), exc_info=True)
+            saved += save_views_one_by_one(batch)
@@ -6,6 +6,7 @@ app_name = 'item'
 
 urlpatterns = [
     path('', views.items, name='items'),
+    path('autocomplete/', views.autocomplete, name='autocomplete'),
     path('new/', views.new, name='new'),
     path('<int:pk>/', views.detail, name='detail'),
     path('<int:pk>/delete/', views.delete, name='delete'),
@@ -1,15 +1,44 @@
+import asyncio
+from functools import partial
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, F
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views.decorators.http import require_POST
 
+from core.async_views import aget_user, arender
+from core.metrics import timed
+from core.pagination import paginate
+
+from .autocomplete import suggest
+from .counters import apply_pending, increment
+from .facets import apply_selection, get_facets, get_selection
 from .forms import NewItemForm, EditItemForm, ItemFilterForm
-from .models import Category, Item, ItemView, ItemFavorite
+from .geo import get_center, within_radius
+from .images import accept_item_images
+from .models import Item, ItemFavorite
+from .recommendations import get_related_items
+from .search import rank_items, search_items
+from .tracking import record_view
 from accounts.models import Report
 
+# Keyset orderings for each sort option; ``id`` breaks ties so every row has a unique position
+SORT_ORDERINGS = {
+    'relevance': ('-rank', '-id'),
+    'newest': ('-created_at', '-id'),
+    'oldest': ('created_at', 'id'),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+    'most_viewed': ('-views', '-id'),
+    'most_favorited': ('-favorites', '-id'),
+    'distance': ('distance', 'id'),
+}
+
+# Search radii (km) offered on the browse page
+RADIUS_OPTIONS = [2, 5, 10, 25, 50, 100]
+
 def get_client_ip(request):
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
     if x_forwarded_for:
@@ -18,36 +47,27 @@ def get_client_ip(request):
         ip = request.META.get('REMOTE_ADDR')
     return ip
 
-def items(request):
-    form = ItemFilterForm(request.GET)
-    items = Item.objects.filter(status='active', admin_approved=True)
-    categories = Category.objects.filter(is_active=True).order_by('name')
+def filter_items(form):
+    """
+    The public items matching the search, location and price filters in
+    ``form``, before the facet filters (see item.facets), with the search
+    query and sort option to order them by. A location the gazetteer knows
+    is searched by distance (see item.geo), others by name.
+    """
+    items = Item.objects.public()
+    query = ''
+    sort_by = 'newest'
     
     # Apply filters
     if form.is_valid():
         query = form.cleaned_data.get('query')
-        category = form.cleaned_data.get('category')
-        condition = form.cleaned_data.get('condition')
         min_price = form.cleaned_data.get('min_price')
         max_price = form.cleaned_data.get('max_price')
         location = form.cleaned_data.get('location')
-        delivery_available = form.cleaned_data.get('delivery_available')
-        pickup_available = form.cleaned_data.get('pickup_available')
-        is_negotiable = form.cleaned_data.get('is_negotiable')
-        sort_by = form.cleaned_data.get('sort_by', 'newest')
+        sort_by = form.cleaned_data.get('sort_by') or 'newest'
         
         if query:
-            items = items.filter(
-                Q(name__icontains=query) | 
-                Q(description__icontains=query) |
-                Q(location__icontains=query)
-            )
-        
-        if category:
-            items = items.filter(category=category)
-        
-        if condition:
-            items = items.filter(condition__in=condition)
+            items = search_items(items, query)
         
         if min_price is not None:
             items = items.filter(price__gte=min_price)
@@ -55,78 +75,82 @@ def items(request):
         if max_price is not None:
             items = items.filter(price__lte=max_price)
         
-        if location:
+        center = get_center(form.cleaned_data)
+        if center:
+            items = within_radius(items, *center)
+        elif location:
             items = items.filter(location__icontains=location)
         
-        if delivery_available:
-            items = items.filter(delivery_available=True)
-        
-        if pickup_available:
-            items = items.filter(pickup_available=True)
-        
-        if is_negotiable:
-            items = items.filter(is_negotiable=True)
-        
-        # Sorting
-        if sort_by == 'oldest':
-            items = items.order_by('created_at')
-        elif sort_by == 'price_low':
-            items = items.order_by('price')
-        elif sort_by == 'price_high':
-            items = items.order_by('-price')
-        elif sort_by == 'most_viewed':
-            items = items.order_by('-views')
-        elif sort_by == 'most_favorited':
-            items = items.order_by('-favorites')
-        else:  # newest
-            items = items.order_by('-created_at')
+        if sort_by == 'distance' and not center:
+            sort_by = 'newest'
+    
+    return items, query, sort_by
+
+def items(request):
+    form = ItemFilterForm(request.GET)
+    unfaceted_items, query, sort_by = filter_items(form)
+    cleaned_data = form.cleaned_data if form.is_valid() else {}
+    items = apply_selection(unfaceted_items, get_selection(cleaned_data))
+    
+    # Counted from the same grouped query as the facets, before ranking
+    facets = get_facets(unfaceted_items, cleaned_data, request.GET)
+    
+    # Sorting (relevance needs a search query to rank against)
+    if sort_by == 'relevance' and query:
+        items = rank_items(items, query)
+    elif sort_by not in SORT_ORDERINGS or sort_by == 'relevance':
+        sort_by = 'newest'
     
     # Pagination
-    paginator = Paginator(items, 12)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = paginate(request, items, SORT_ORDERINGS[sort_by])
     
-    context = {
+    return render(request, 'item/items.html', {
         'items': page_obj,
-        'categories': categories,
         'form': form,
-        'total_items': items.count(),
-    }
+        'query': query,
+        'facets': facets,
+        'total_items': facets['total'],
+        'radius_options': RADIUS_OPTIONS,
+    })
+
+def autocomplete(request):
+    # Called on every keystroke, so it reads only the in-process index (no session, user or queries)
+    query = request.GET.get('q', '')[:100]
+    return JsonResponse({'query': query, 'suggestions': suggest(query)})
+
+async def detail(request, pk):
+    item = await Item.objects.public().filter(pk=pk).afirst()
+    if item is None:
+        raise Http404('No Item matches the given query.')
     
-    return render(request, 'item/items.html', context)
-
-def detail(request, pk):
-    item = get_object_or_404(Item, pk=pk, status='active', admin_approved=True)
-    related_items = Item.objects.filter(
-        category=item.category, 
-        status='active', 
-        admin_approved=True
-    ).exclude(pk=pk)[:3]
-    
-    # Track view
-    ip_address = get_client_ip(request)
-    view, created = ItemView.objects.get_or_create(
-        item=item,
-        user=request.user if request.user.is_authenticated else None,
-        ip_address=ip_address
-    )
+    # Left lazy: the template only calls it inside a cached fragment that missed
+    related_items = partial(get_related_items, item)
+    user = await aget_user(request)
+    
+    async def check_favorited():
+        if not user.is_authenticated:
+            return False
+        return await ItemFavorite.objects.filter(item=item, user=user).aexists()
     
-    if created:
-        Item.objects.filter(pk=pk).update(views=F('views') + 1)
+    # Track view (buffered and written in batches by item.tracking). The buffer
+    # never touches the database, so it runs off the request's DB thread
+    # alongside the favorite check
+    is_favorited, _ = await asyncio.gather(
+        check_favorited(),
+        sync_to_async(record_view, thread_sensitive=False)(item.pk, user.pk, get_client_ip(request)),
+    )
     
-    # Check if user has favorited this item
-    is_favorited = False
-    if request.user.is_authenticated:
-        is_favorited = ItemFavorite.objects.filter(item=item, user=request.user).exists()
+    with timed('images'):
+        item_images = item.get_all_images()
     
     context = {
         'item': item,
         'related_items': related_items,
         'is_favorited': is_favorited,
-        'item_images': item.get_all_images(),
+        'item_images': item_images,
     }
     
-    return render(request, 'item/detail.html', context)
+    return await arender(request, 'item/detail.html', context)
 
 @login_required
 def new(request):
@@ -136,6 +160,7 @@ def new(request):
             item = form.save(commit=False)
             item.created_by = request.user
             item.save()
+            accept_item_images(item, form.cleaned_data)
             messages.success(request, 'Your item has been listed successfully!')
             return redirect('item:detail', pk=item.id)
     else:
@@ -154,6 +179,7 @@ def edit(request, pk):
         form = EditItemForm(request.POST, request.FILES, instance=item)
         if form.is_valid():
             form.save()
+            accept_item_images(item, form.cleaned_data)
             messages.success(request, 'Your item has been updated successfully!')
             return redirect('item:detail', pk=item.id)
     else:
@@ -179,13 +205,15 @@ def toggle_favorite(request, pk):
     favorite, created = ItemFavorite.objects.get_or_create(item=item, user=request.user)
     
     if not created:
-        favorite.delete()
-        Item.objects.filter(pk=pk).update(favorites=F('favorites') - 1)
+        # Only the request that actually removed the row decrements the counter
+        if ItemFavorite.objects.filter(pk=favorite.pk).delete()[0]:
+            increment(item.pk, 'favorites', -1)
         favorited = False
     else:
-        Item.objects.filter(pk=pk).update(favorites=F('favorites') + 1)
+        increment(item.pk, 'favorites')
         favorited = True
     
+    apply_pending([item])
     return JsonResponse({
         'favorited': favorited,
         'favorites_count': item.favorites